@@ -0,0 +1,303 @@
+import io
+import os
+import urllib.parse
+import urllib.request
+
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+
+
+ARCHIVE_CACHE_DIR = 'archive_cache'
+
+# Default on-disk budget per cached archive.
+ARCHIVE_CACHE_MAX_BYTES = 2 * 1024**3
+
+DAY = pd.Timedelta(days=1)
+
+
+def day_buckets(t0, t1) -> pd.DatetimeIndex:
+
+    # UTC days (as midnights) overlapping [t0, t1].
+    t0 = pd.Timestamp(t0).floor('D')
+    t1 = pd.Timestamp(t1).floor('D')
+
+    return pd.date_range(t0, t1, freq='D')
+
+
+def _runs(days: pd.DatetimeIndex) -> list[tuple[pd.Timestamp, pd.Timestamp]]:
+
+    # Groups sorted days into runs of consecutive days, returned as
+    # [first midnight, midnight after the last day) ranges.
+    if len(days) == 0:
+        return []
+
+    gaps = np.flatnonzero((days[1:] - days[:-1]) != DAY) + 1
+    bounds = np.concatenate([[0], gaps, [len(days)]])
+
+    return [
+        (days[b0], days[b1 - 1] + DAY) for b0, b1 in zip(bounds[:-1], bounds[1:])
+    ]
+
+
+###################
+# Archive Sources #
+###################
+
+
+class DirectoryArchive:
+
+    # Serves catalogue rows from a local CSV file (or a directory of CSV
+    # files), standing in for an instrument archive when working offline.
+    # Rows are returned when their time_column falls in [start, end).
+
+    def __init__(self, path: str, time_column: str = 'DATE_OBS'):
+
+        self.path = path
+        self.time_column = time_column
+        self._table = None
+
+    def _load(self) -> DataFrame:
+
+        if self._table is None:
+
+            if os.path.isdir(self.path):
+                files = sorted(
+                    os.path.join(self.path, name)
+                    for name in os.listdir(self.path) if name.endswith('.csv')
+                )
+            else:
+                files = [self.path]
+
+            table = pd.concat([pd.read_csv(f) for f in files], ignore_index=True)
+            times = pd.to_datetime(table[self.time_column], format='ISO8601')
+
+            order = np.argsort(times.to_numpy(), kind='stable')
+            self._times = times.to_numpy()[order]
+            self._table = table.iloc[order].reset_index(drop=True)
+
+        return self._table
+
+    def __call__(self, start, end) -> DataFrame:
+
+        table = self._load()
+        lo, hi = np.searchsorted(
+            self._times,
+            [np.datetime64(pd.Timestamp(start)), np.datetime64(pd.Timestamp(end))]
+        )
+
+        return table.iloc[lo:hi].reset_index(drop=True)
+
+
+class HttpArchive:
+
+    # Fetches catalogue rows as CSV from <url>?start=...&end=... (ISO 8601,
+    # end exclusive), e.g. a small stub server in front of a catalogue dump.
+
+    def __init__(self, url: str, timeout: float = 60):
+
+        self.url = url
+        self.timeout = timeout
+
+    def __call__(self, start, end) -> DataFrame:
+
+        query = urllib.parse.urlencode({
+            'start': pd.Timestamp(start).isoformat(),
+            'end': pd.Timestamp(end).isoformat()
+        })
+
+        with urllib.request.urlopen(f"{self.url}?{query}", timeout=self.timeout) as r:
+            body = r.read().decode()
+
+        if not body.strip():
+            return DataFrame()
+
+        return pd.read_csv(io.StringIO(body))
+
+
+#################
+# Archive Cache #
+#################
+
+
+class ArchiveCache:
+
+    # Caches archive lookups by UTC day. A query is widened to the whole days
+    # it touches, and all missing days are fetched together, one fetch per
+    # run of consecutive days, then split into one file per day under
+    # <root>/<name>/YYYY-MM-DD.pkl. Neighbouring flares on a busy day then
+    # share a single fetch instead of each querying the archive.
+    #
+    # fetch(start, end) must return the catalogue rows whose time_column
+    # falls in [start, end). Days that have not yet ended are never cached,
+    # as the archive may still grow. The cache directory is kept under
+    # max_bytes by evicting the least recently used days.
+
+    def __init__(
+                self,
+                fetch,
+                name: str,
+                root: str = ARCHIVE_CACHE_DIR,
+                time_column: str = 'DATE_OBS',
+                max_bytes: int = ARCHIVE_CACHE_MAX_BYTES
+            ):
+
+        self.fetch = fetch
+        self.directory = os.path.join(root, name)
+        self.time_column = time_column
+        self.max_bytes = max_bytes
+
+        self.hits = 0
+        self.misses = 0
+        self.fetches = 0
+        self.evictions = 0
+
+        os.makedirs(self.directory, exist_ok=True)
+
+        # {day file: [size, last used]} for the LRU, seeded from the
+        # modification times, which are bumped on every hit.
+        self._index = {}
+        for name in os.listdir(self.directory):
+            if name.endswith('.pkl'):
+                stat = os.stat(os.path.join(self.directory, name))
+                self._index[name] = [stat.st_size, stat.st_mtime_ns]
+
+    def _file(self, day: pd.Timestamp) -> str:
+
+        return f"{day.strftime('%Y-%m-%d')}.pkl"
+
+    def stats(self) -> dict:
+
+        lookups = self.hits + self.misses
+
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'fetches': self.fetches,
+            'evictions': self.evictions,
+            'days_cached': len(self._index),
+            'bytes_cached': sum(size for size, _ in self._index.values())
+        }
+
+    def _read(self, day: pd.Timestamp) -> DataFrame | None:
+
+        name = self._file(day)
+
+        if name not in self._index:
+            return None
+
+        path = os.path.join(self.directory, name)
+
+        try:
+            rows = pd.read_pickle(path)
+        except (OSError, EOFError):
+            # Evicted or replaced by another process.
+            self._index.pop(name, None)
+            return None
+
+        os.utime(path)
+        self._index[name][1] = os.stat(path).st_mtime_ns
+
+        return rows
+
+    def _write(self, day: pd.Timestamp, rows: DataFrame):
+
+        name = self._file(day)
+        path = os.path.join(self.directory, name)
+
+        tmp = f"{path}.tmp{os.getpid()}"
+        rows.to_pickle(tmp)
+        os.replace(tmp, path)
+
+        stat = os.stat(path)
+        self._index[name] = [stat.st_size, stat.st_mtime_ns]
+
+        self._evict()
+
+    def _evict(self):
+
+        total = sum(size for size, _ in self._index.values())
+
+        for name in sorted(self._index, key=lambda n: self._index[n][1]):
+
+            if total <= self.max_bytes:
+                break
+
+            size, _ = self._index.pop(name)
+            total -= size
+            self.evictions += 1
+
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+
+    def _fetch_days(self, days: pd.DatetimeIndex) -> dict[pd.Timestamp, DataFrame]:
+
+        # Fetches runs of consecutive days and splits the rows by day.
+        fetched = {}
+        today = pd.Timestamp.now(tz='UTC').tz_localize(None).floor('D')
+
+        for start, end in _runs(days):
+
+            rows = self.fetch(start, end)
+            self.fetches += 1
+
+            if len(rows):
+                times = pd.to_datetime(rows[self.time_column], format='ISO8601')
+                row_days = times.dt.floor('D')
+            else:
+                row_days = pd.Series([], dtype='datetime64[ns]')
+
+            for day in pd.date_range(start, end - DAY, freq='D'):
+
+                day_rows = rows[(row_days == day).to_numpy()].reset_index(drop=True)
+                fetched[day] = day_rows
+
+                if day < today:
+                    self._write(day, day_rows)
+
+        return fetched
+
+    def query_days(self, windows) -> DataFrame:
+
+        # Catalogue rows for every UTC day touched by any of the (t0, t1)
+        # windows. Overlapping windows share their days, each day is read or
+        # fetched once, and all missing days are fetched together.
+        days = pd.DatetimeIndex(sorted({
+            day for t0, t1 in windows for day in day_buckets(t0, t1)
+        }))
+        rows = {}
+
+        for day in days:
+            cached = self._read(day)
+            if cached is not None:
+                rows[day] = cached
+                self.hits += 1
+            else:
+                self.misses += 1
+
+        missing = days[[day not in rows for day in days]]
+        rows.update(self._fetch_days(missing))
+
+        parts = [rows[day] for day in days if len(rows[day])]
+
+        if not parts:
+            return DataFrame()
+
+        return pd.concat(parts, ignore_index=True)
+
+    def query(self, t0, t1) -> DataFrame:
+
+        # Catalogue rows with time_column in [t0, t1].
+        rows = self.query_days([(t0, t1)])
+
+        if len(rows) == 0:
+            return rows
+
+        times = pd.to_datetime(rows[self.time_column], format='ISO8601')
+
+        return rows[
+            ((times >= pd.Timestamp(t0)) & (times <= pd.Timestamp(t1))).to_numpy()
+        ].reset_index(drop=True)
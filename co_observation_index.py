@@ -0,0 +1,139 @@
+import numpy as np
+from pandas import DataFrame
+
+
+QUERY_MODES = ('all', 'any', 'exactly')
+
+
+def _mask_dtype(n_instruments: int):
+
+    # Limited to 16 instruments, i.e. at most 65536 distinct sets.
+    for dtype in (np.uint8, np.uint16):
+        if n_instruments <= np.iinfo(dtype).bits:
+            return dtype
+
+    raise ValueError(f"Too many instruments for a bitmask: {n_instruments}")
+
+
+def observation_mask(df: DataFrame, instruments: list[str]) -> np.ndarray:
+
+    # Packs each flare's *_OBSERVED flags into one unsigned integer, bit i
+    # being set when instruments[i] observed the flare. Only a flag of exactly
+    # 1 counts as observed, so the 255 error code is never set.
+    dtype = _mask_dtype(len(instruments))
+    mask = np.zeros(len(df), dtype=dtype)
+
+    for bit, instr in enumerate(instruments):
+        observed = df[f"{instr}_OBSERVED"].to_numpy() == 1
+        mask |= observed.astype(dtype) << dtype(bit)
+
+    return mask
+
+
+def popcount(mask: np.ndarray) -> np.ndarray:
+
+    # Number of set bits in each mask, using a byte lookup table.
+    table = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+    mask = np.ascontiguousarray(mask)
+    bytes_ = mask.view(np.uint8).reshape(len(mask), mask.dtype.itemsize)
+
+    return table[bytes_].sum(axis=1, dtype=np.uint8)
+
+
+class CoObservationIndex:
+
+    # Index of flares by the set of instruments which observed them.
+    #
+    # Rows are grouped by mask once (a stable argsort plus a bincount), so a
+    # query only has to pick out the masks matching the instrument set, of
+    # which there are at most 2 ** len(instruments), and concatenate their
+    # row lists. Query cost is independent of the size of the table apart
+    # from the rows returned.
+
+    def __init__(self, mask: np.ndarray, instruments: list[str]):
+
+        self.instruments = list(instruments)
+        self.mask = mask
+
+        n_masks = 1 << len(self.instruments)
+
+        self.counts = np.bincount(mask.astype(np.intp), minlength=n_masks)
+        self._order = np.argsort(mask, kind='stable')
+        self._offsets = np.concatenate([[0], np.cumsum(self.counts)])
+
+    @classmethod
+    def from_flare_list(
+                cls,
+                df: DataFrame,
+                instruments: list[str]
+            ) -> 'CoObservationIndex':
+
+        return cls(observation_mask(df, instruments), instruments)
+
+    def bits(self, instruments) -> int:
+
+        if isinstance(instruments, str):
+            instruments = [instruments]
+
+        bits = 0
+        for instr in instruments:
+            try:
+                bits |= 1 << self.instruments.index(instr)
+            except ValueError:
+                raise ValueError(f"Unknown instrument: {instr!r}") from None
+
+        return bits
+
+    def matching_masks(self, instruments, mode='all') -> np.ndarray:
+
+        # Masks (instrument sets) satisfying the query:
+        #   'all'     - observed by every instrument in the set (and maybe more)
+        #   'any'     - observed by at least one instrument in the set
+        #   'exactly' - observed by the instruments in the set and no others
+        bits = self.bits(instruments)
+        masks = np.arange(len(self.counts))
+
+        if mode == 'all':
+            match = (masks & bits) == bits
+        elif mode == 'any':
+            match = (masks & bits) != 0
+        elif mode == 'exactly':
+            match = masks == bits
+        else:
+            raise ValueError(
+                f"Unknown mode: {mode!r}, expected one of {QUERY_MODES}"
+            )
+
+        return masks[match & (self.counts > 0)]
+
+    def count(self, instruments, mode='all') -> int:
+
+        return int(self.counts[self.matching_masks(instruments, mode)].sum())
+
+    def rows(self, instruments, mode='all') -> np.ndarray:
+
+        # Positional row indices of the matching flares, in table order.
+        masks = self.matching_masks(instruments, mode)
+
+        if len(masks) == 0:
+            return np.zeros(0, dtype=np.intp)
+
+        rows = np.concatenate([
+            self._order[self._offsets[m]:self._offsets[m + 1]] for m in masks
+        ])
+
+        if len(masks) > 1:
+            rows.sort()
+
+        return rows
+
+    def degree_counts(self) -> np.ndarray:
+
+        # Number of flares against the number of instruments observing them.
+        degree = popcount(np.arange(len(self.counts), dtype=self.mask.dtype))
+
+        return np.bincount(
+            degree,
+            weights=self.counts,
+            minlength=len(self.instruments) + 1
+        ).astype(np.int64)
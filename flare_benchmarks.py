@@ -0,0 +1,657 @@
+import argparse
+import gc
+import json
+import os
+import platform
+import subprocess
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+
+from flare_list_cache import typed_flare_list
+from flare_list_joiner import GEV_TIME_FORMAT, create_her_goes_list
+from flare_positions import FlarePositionIndex, heliographic_to_arcsec
+from flare_time_index import FlareTimeIndex
+from interval_overlap import observed_fractions_for_flares
+from multi_wavelength_obs_stats import (
+    FlareStats,
+    INSTRUMENT_NAMES_SHORT,
+    load_instr_obs_range_info,
+    prepare_flare_list
+)
+
+
+BENCHMARK_DIR = 'benchmarks'
+BASELINE_FILENAME = os.path.join(BENCHMARK_DIR, 'baseline.json')
+RESULTS_FILENAME = os.path.join(BENCHMARK_DIR, 'results.jsonl')
+
+BENCHMARK_SIZES = [10_000, 100_000, 1_000_000]
+
+# A stage is flagged as a regression when it is this much slower (or uses
+# this much more memory) than its baseline, and by more than the noise
+# floors below.
+REGRESSION_TOLERANCE = 0.25
+MIN_REGRESSION_SECONDS = 0.01
+MIN_REGRESSION_BYTES = 1 << 20
+
+# Growth in run time between two sizes, as a power of the growth in rows,
+# above which a stage is flagged as not scaling.
+SUPERLINEAR_EXPONENT = 1.25
+
+##############################
+# Synthetic Flare Generation #
+##############################
+
+# Shapes of the synthetic lists, measured on
+# instr_observed_flare_list_rsi_full.csv (16676 flares, 2010-2019).
+SYNTHETIC_START = pd.Timestamp('2010-04-13')
+FLARES_PER_DAY = 5.0
+
+# Lists too long for FLARES_PER_DAY are packed more densely instead of
+# running past the end of the int64 ns range (in 2262), and short lists are
+# spread out to reach the end of the time range every instrument observed
+# (2013-07-17 to 2014-05-27, see instrument_observing_range_info.csv), which
+# FlareStats needs flares in.
+MAX_SPAN_DAYS = 70_000
+MIN_SPAN_DAYS = 1506
+
+CLASS_LETTER_FRACTIONS = {'A': 0.0001, 'B': 0.4196, 'C': 0.5274, 'M': 0.0493, 'X': 0.0035}
+
+# Magnitudes within a letter follow m^-1.2 on [1, 10), which gives the
+# observed ~36% of flares in [1, 2) falling to ~4% in [9, 10).
+MAGNITUDE_INDEX = 1.2
+
+# Rise (start to peak) and fall (peak to end) durations are log-normal, in
+# minutes.
+RISE_LOG_MINUTES = (2.005, 0.851)
+FALL_LOG_MINUTES = (1.932, 0.881)
+
+MALFORMED_FRACTION = 0.0004
+
+# Latitudes cluster in the active region belts, longitudes are spread over
+# the disk with a few flares just behind the limb.
+ABS_LATITUDE = (14.4, 8.2)
+BEHIND_LIMB_FRACTION = 0.02
+NO_POSITION_FRACTION = 0.124
+NOAA_LOC_FRACTION = 0.3
+NO_AR_FRACTION = 0.28
+FIRST_AR = 11062
+ARS_PER_DAY = 0.5
+
+# Fraction of flares each instrument observed. Only RHESSI's is measured
+# from the shipped list; the rest are in line with EXPECTED_SUCCESS_RATES.
+OBSERVED_FRACTIONS = {
+    'RSI': 0.70,
+    'MEGSA': 0.12,
+    'MEGSB': 0.45,
+    'EIS': 0.04,
+    'SOT': 0.06,
+    'XRT': 0.35,
+    'IRIS': 0.03,
+    'FERMI': 0.55
+}
+
+# Of the observed flares, the fraction seen in full, and the fraction of
+# those RHESSI also flagged.
+FULLY_OBSERVED_FRACTION = 0.45
+RSI_TRIGGERED_FRACTION = 0.85
+
+# HER / GEV list membership, matching the 14.6k / 14.3k / 16.7k sizes of
+# the HER, GEV and joined 2010-2019 lists, and the share of shared flares
+# whose HER peak is a minute or two off the GEV one.
+HER_ONLY_FRACTION = 0.14
+GEV_ONLY_FRACTION = 0.13
+PEAK_JITTER_FRACTION = 0.1
+
+# RHESSI-like observing windows: one per orbit, some lost to SAA passes.
+ORBIT_MINUTES = 96
+WINDOW_MINUTES = (55, 10)
+LOST_ORBIT_FRACTION = 0.1
+
+REFERENCE_FRACTION = 0.01
+
+MINUTE_NS = 60 * 10**9
+DAY_NS = 86400 * 10**9
+
+MONTH_ABBREVIATIONS = [
+    'Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec'
+]
+
+
+def _class_strings(rng: np.random.Generator, n: int) -> np.ndarray:
+
+    letters = np.array(list(CLASS_LETTER_FRACTIONS))
+    p = np.array(list(CLASS_LETTER_FRACTIONS.values()))
+    letter = rng.choice(len(letters), n, p=p / p.sum())
+
+    # Inverse CDF of m^-index on [1, 10), in tenths.
+    a = 1 - MAGNITUDE_INDEX
+    magnitude = (1 + rng.random(n) * (10**a - 1))**(1 / a)
+    tenths = np.clip(np.floor(magnitude * 10).astype(np.int64), 10, 99)
+
+    # Only 5 * 90 distinct strings, built once.
+    table = np.array([f"{l}{t / 10:.1f}" for l in letters for t in range(10, 100)], dtype=object)
+
+    return table[letter * 90 + tenths - 10]
+
+
+def _location_strings(lat: np.ndarray, lon: np.ndarray) -> np.ndarray:
+
+    # Location strings of integer degree positions, via a table of the
+    # distinct latitude and longitude halves.
+    lat = np.rint(lat).astype(np.int64)
+    lon = np.rint(lon).astype(np.int64)
+
+    lat_table = np.array([f"{'S' if v < 0 else 'N'}{abs(v):02d}" for v in range(-90, 91)], dtype=object)
+    lon_table = np.array([f"{'E' if v < 0 else 'W'}{abs(v):02d}" for v in range(-180, 181)], dtype=object)
+
+    return lat_table[lat + 90] + lon_table[lon + 180]
+
+
+def _format_minutes(ns: np.ndarray, date_format: str, separator: str) -> np.ndarray:
+
+    # Formats minute resolution int64 ns times, with each day's date and each
+    # minute of the day only formatted once. date_format is a str.format
+    # pattern of y, m, d and b (month abbreviation), as strftime is slow.
+    days, minutes = np.divmod(ns, DAY_NS)
+    unique_days, day_codes = np.unique(days, return_inverse=True)
+
+    index = pd.DatetimeIndex(unique_days * DAY_NS)
+    dates = np.array([
+        date_format.format(y=y, m=m, d=d, b=MONTH_ABBREVIATIONS[m - 1])
+        for y, m, d in zip(index.year, index.month, index.day)
+    ], dtype=object)
+    clock = np.array(
+        [f"{m // 60:02d}:{m % 60:02d}:00" for m in range(1440)], dtype=object
+    )
+
+    return dates[day_codes] + separator + clock[minutes // MINUTE_NS]
+
+
+def synthetic_flares(n: int, seed: int = 0) -> DataFrame:
+
+    # Instrument observed flare list of n flares with the schema and compact
+    # dtypes of load_flare_list('instr_observed_flare_list.csv'), sorted by
+    # start time.
+    rng = np.random.default_rng(seed)
+
+    span_days = min(max(n / FLARES_PER_DAY, MIN_SPAN_DAYS), MAX_SPAN_DAYS)
+    start = SYNTHETIC_START.value + np.sort(rng.integers(0, int(span_days * DAY_NS), n))
+    start -= start % MINUTE_NS
+
+    rise = np.rint(np.exp(rng.normal(*RISE_LOG_MINUTES, n))).astype(np.int64) * MINUTE_NS
+    fall = np.rint(np.exp(rng.normal(*FALL_LOG_MINUTES, n))).astype(np.int64) * MINUTE_NS
+
+    peak = start + rise
+    end = peak + fall
+
+    malformed = rng.random(n) < MALFORMED_FRACTION
+    start[malformed], peak[malformed] = peak[malformed], start[malformed]
+
+    lat = np.clip(rng.normal(*ABS_LATITUDE, n), 0, 60) * rng.choice([-1, 1], n)
+    lon = rng.uniform(-90, 90, n)
+    behind = rng.random(n) < BEHIND_LIMB_FRACTION
+    lon[behind] = np.sign(lon[behind]) * rng.uniform(90, 100, behind.sum())
+
+    x, y = heliographic_to_arcsec(lat, lon, start.view('datetime64[ns]'))
+
+    no_position = rng.random(n) < NO_POSITION_FRACTION
+    aia_loc = _location_strings(lat, lon)
+    aia_loc[no_position] = np.nan
+    x[no_position] = 0
+    y[no_position] = 0
+
+    noaa_loc = _location_strings(
+        np.clip(lat + rng.normal(0, 2, n), -90, 90), np.clip(lon + rng.normal(0, 2, n), -180, 180)
+    )
+    noaa_loc[rng.random(n) >= NOAA_LOC_FRACTION] = np.nan
+
+    days = (start - SYNTHETIC_START.value) / DAY_NS
+    noaa_ar = np.floor(FIRST_AR + days * ARS_PER_DAY + rng.normal(0, 3, n))
+    noaa_ar[rng.random(n) < NO_AR_FRACTION] = 0
+
+    columns = {
+        'INDEX': np.arange(n),
+        'FLARE_START': start.view('datetime64[ns]'),
+        'FLARE_PEAK': peak.view('datetime64[ns]'),
+        'FLARE_END': end.view('datetime64[ns]'),
+        'CLASS': _class_strings(rng, n),
+        'AIA_LOC': aia_loc,
+        'AIA_XCEN': x,
+        'AIA_YCEN': y,
+        'LOC': noaa_loc,
+        'NOAA_AR': noaa_ar
+    }
+
+    for instr in INSTRUMENT_NAMES_SHORT:
+
+        observed = rng.random(n) < OBSERVED_FRACTIONS[instr]
+        full = observed & (rng.random(n) < FULLY_OBSERVED_FRACTION)
+
+        def fraction():
+            return np.where(full, 1.0, np.where(observed, rng.random(n), 0.0))
+
+        columns[f"{instr}_OBSERVED"] = np.where(malformed, 255, observed)
+
+        if instr == 'RSI':
+            triggered = observed & (rng.random(n) < RSI_TRIGGERED_FRACTION)
+            columns['RSI_FLARE_TRIGGERED'] = np.where(malformed, 255, triggered)
+
+        if instr in ('XRT', 'SOT'):
+            columns[f"{instr}_RISE_OBSERVED"] = np.where(malformed, 255, fraction() > 0)
+            columns[f"{instr}_FALL_OBSERVED"] = np.where(malformed, 255, fraction() > 0)
+
+        elif instr != 'MEGSA':
+            for suffix in ['FRAC_OBS', 'FRAC_OBS_RISE', 'FRAC_OBS_FALL']:
+                columns[f"{instr}_{suffix}"] = np.where(malformed, -1, fraction())
+
+    return typed_flare_list(DataFrame(columns))
+
+
+def synthetic_her_gev(flares: DataFrame, seed: int = 0) -> tuple[DataFrame, DataFrame]:
+
+    # HER and GEV lists, as read from their CSVs, covering overlapping
+    # subsets of flares.
+    rng = np.random.default_rng(seed + 1)
+    n = len(flares)
+
+    u = rng.random(n)
+    in_her = u >= GEV_ONLY_FRACTION
+    in_gev = u < 1 - HER_ONLY_FRACTION
+
+    times = {
+        col: flares[col].to_numpy(dtype='datetime64[ns]').view(np.int64)
+        for col in ['FLARE_START', 'FLARE_PEAK', 'FLARE_END']
+    }
+
+    jitter = in_her & in_gev & (rng.random(n) < PEAK_JITTER_FRACTION)
+    her_peak = times['FLARE_PEAK'] + jitter * rng.choice([-2, -1, 1, 2], n) * MINUTE_NS
+
+    def her_time(ns):
+        return _format_minutes(ns[in_her], '{y:04d}-{m:02d}-{d:02d}', 'T')
+
+    def gev_time(ns):
+        return _format_minutes(ns[in_gev], '{d:02d}-{b}-{y:04d}', ' ')
+
+    her = DataFrame({
+        'GEV_START': her_time(times['FLARE_START']),
+        'GEV_PEAK': her_time(her_peak),
+        'GEV_END': her_time(times['FLARE_END']),
+        'GOES_CLASS': flares['CLASS'].to_numpy(dtype=object)[in_her],
+        'AIA_LOC': flares['AIA_LOC'].to_numpy(dtype=object)[in_her],
+        'AIA_XCEN': flares['AIA_XCEN'].to_numpy()[in_her],
+        'AIA_YCEN': flares['AIA_YCEN'].to_numpy()[in_her]
+    })
+
+    gev = DataFrame({
+        'GSTART': gev_time(times['FLARE_START']),
+        'GEND': gev_time(times['FLARE_END']),
+        'GPEAK': gev_time(times['FLARE_PEAK']),
+        'CLASS': flares['CLASS'].to_numpy(dtype=object)[in_gev],
+        'LOC': flares['LOC'].to_numpy(dtype=object)[in_gev],
+        'NOAA_AR': flares['NOAA_AR'].to_numpy()[in_gev]
+    })
+
+    return her, gev
+
+
+def synthetic_windows(flares: DataFrame, seed: int = 0) -> tuple[np.ndarray, np.ndarray]:
+
+    # RHESSI-like observing windows (int64 ns starts and ends) over the
+    # span of the flares.
+    rng = np.random.default_rng(seed + 2)
+
+    start = flares['FLARE_START'].min().value
+    end = flares['FLARE_END'].max().value
+    n_orbits = -(-(end - start) // (ORBIT_MINUTES * MINUTE_NS)) + 1
+
+    orbit = start + np.arange(n_orbits, dtype=np.int64) * ORBIT_MINUTES * MINUTE_NS
+    window_start = orbit + rng.integers(0, 10 * MINUTE_NS, n_orbits)
+    window_end = window_start + (
+        np.clip(rng.normal(*WINDOW_MINUTES, n_orbits), 5, ORBIT_MINUTES - 10) * MINUTE_NS
+    ).astype(np.int64)
+
+    kept = rng.random(n_orbits) >= LOST_ORBIT_FRACTION
+
+    return window_start[kept], window_end[kept]
+
+
+def synthetic_dataset(n: int, seed: int = 0) -> dict:
+
+    flares = synthetic_flares(n, seed)
+    her, gev = synthetic_her_gev(flares, seed)
+
+    # A goes_data_reflist.csv of a sample of the GEV peaks.
+    rng = np.random.default_rng(seed + 3)
+    refs = DataFrame({
+        'gpeak': gev['GPEAK'].to_numpy()[rng.random(len(gev)) < REFERENCE_FRACTION]
+    })
+
+    return {
+        'flares': flares,
+        'her': her,
+        'gev': gev,
+        'windows': synthetic_windows(flares, seed),
+        'refs': refs
+    }
+
+
+##########
+# Stages #
+##########
+
+
+def _obs_stats(data: dict):
+
+    df, no_coords_count = prepare_flare_list(data['flares'])
+    stats = FlareStats(df, load_instr_obs_range_info(), no_coords_count)
+
+    return (
+        stats.success_rate_table,
+        stats.instr_obs_histogram,
+        stats.class_counts,
+        stats.rhessi_flag_counts,
+        stats.duration_by_class,
+        stats.fully_observed
+    )
+
+
+def _return_flares_merge(data: dict):
+
+    # As return_flares.py did before it used FlareTimeIndex.
+    refs = data['refs'].assign(
+        FLARE_PEAK=pd.to_datetime(data['refs']['gpeak'], format='mixed')
+    )
+
+    return pd.merge(data['flares'], refs, on='FLARE_PEAK', how='inner')
+
+
+def _flare_time_index(data: dict):
+
+    index = FlareTimeIndex.from_flare_list(data['flares'])
+
+    return index.match(pd.to_datetime(data['refs']['gpeak'], format=GEV_TIME_FORMAT))
+
+
+def _interval_intersection(data: dict):
+
+    return observed_fractions_for_flares(data['flares'], *data['windows'], 'RSI')
+
+
+def _position_index(data: dict):
+
+    index = FlarePositionIndex.from_flare_list(data['flares'])
+
+    return [index.radius(x, y, 200) for x, y in [(0, 0), (-700, 300), (900, -200)]]
+
+
+BENCHMARK_STAGES = {
+    'her_goes_exact': lambda data: create_her_goes_list(data['her'], data['gev']),
+    'her_goes_nearest': lambda data: create_her_goes_list(data['her'], data['gev'], join='nearest'),
+    'obs_stats': _obs_stats,
+    'return_flares_merge': _return_flares_merge,
+    'flare_time_index': _flare_time_index,
+    'interval_intersection': _interval_intersection,
+    'position_index': _position_index
+}
+
+
+###############
+# Measurement #
+###############
+
+
+def measure(stage: str, data: dict, repeat: int = 3) -> dict:
+
+    # Best wall and CPU time over repeat runs, and peak traced memory (numpy
+    # and pandas buffers included) from one further run. Memory is traced
+    # in a run of its own as tracing slows allocation heavy code.
+    run = BENCHMARK_STAGES[stage]
+
+    wall = []
+    cpu = []
+
+    for _ in range(repeat):
+
+        gc.collect()
+        w0, c0 = time.perf_counter(), time.process_time()
+        run(data)
+        wall.append(time.perf_counter() - w0)
+        cpu.append(time.process_time() - c0)
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        run(data)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'stage': stage,
+        'rows': len(data['flares']),
+        'seconds': min(wall),
+        'cpu_seconds': min(cpu),
+        'peak_bytes': int(peak)
+    }
+
+
+def _environment() -> dict:
+
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    return {
+        'time': pd.Timestamp.now(tz='UTC').isoformat(),
+        'commit': commit,
+        'machine': platform.node(),
+        'processor': platform.machine(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__
+    }
+
+
+def run_benchmarks(
+            sizes=BENCHMARK_SIZES,
+            stages=None,
+            repeat: int = 3,
+            seed: int = 0,
+            max_seconds: float | None = None
+        ) -> list[dict]:
+
+    # Results of every stage at every size. Once a stage's time at the next
+    # size, extrapolated linearly, would pass max_seconds, its larger sizes
+    # are skipped and recorded with seconds None. A stage which raises is
+    # recorded the same way with the error, and the run carries on.
+    stages = list(BENCHMARK_STAGES) if stages is None else list(stages)
+    environment = _environment()
+
+    results = []
+    last = {}
+
+    for n in sorted(sizes):
+
+        data = synthetic_dataset(n, seed)
+
+        for stage in stages:
+
+            previous = last.get(stage)
+            if (
+                max_seconds is not None and previous is not None and 'error' not in previous and
+                (previous['seconds'] is None or
+                 previous['seconds'] * n / previous['rows'] > max_seconds)
+            ):
+                result = {'stage': stage, 'rows': n, 'seconds': None, 'cpu_seconds': None, 'peak_bytes': None}
+            else:
+                try:
+                    result = measure(stage, data, repeat)
+                except Exception as e:
+                    result = {
+                        'stage': stage, 'rows': n, 'seconds': None, 'cpu_seconds': None, 'peak_bytes': None,
+                        'error': f"{type(e).__name__}: {e}"
+                    }
+
+            result.update(environment)
+            results.append(result)
+            last[stage] = result
+
+        del data
+
+    return results
+
+
+#########################
+# Baselines and Scaling #
+#########################
+
+
+def _key(result: dict) -> str:
+
+    return f"{result['stage']}@{result['rows']}"
+
+
+def load_baseline(filename: str = BASELINE_FILENAME) -> dict:
+
+    if not os.path.exists(filename):
+        return {}
+
+    with open(filename) as f:
+        return json.load(f)
+
+
+def save_baseline(results: list[dict], filename: str = BASELINE_FILENAME):
+
+    # Measured results replace their entries in the baseline, others are
+    # kept.
+    baseline = load_baseline(filename)
+    baseline.update({_key(r): r for r in results if r['seconds'] is not None})
+
+    os.makedirs(os.path.dirname(filename) or '.', exist_ok=True)
+
+    tmp = f"{filename}.tmp{os.getpid()}"
+    with open(tmp, 'w') as f:
+        json.dump(baseline, f, indent=1, sort_keys=True)
+    os.replace(tmp, filename)
+
+
+def append_results(results: list[dict], filename: str = RESULTS_FILENAME):
+
+    os.makedirs(os.path.dirname(filename) or '.', exist_ok=True)
+
+    with open(filename, 'a') as f:
+        for result in results:
+            f.write(json.dumps(result) + '\n')
+
+
+def compare(
+            results: list[dict],
+            baseline: dict,
+            tolerance: float = REGRESSION_TOLERANCE
+        ) -> DataFrame:
+
+    # Results against their baselines: time and memory ratios, regression
+    # flags, and each stage's scaling exponent from the previous size.
+    table = DataFrame(results, columns=['stage', 'rows', 'seconds', 'cpu_seconds', 'peak_bytes', 'error'])
+    table = table.sort_values(['stage', 'rows'], kind='stable').reset_index(drop=True)
+
+    base = [baseline.get(_key(r), {}) for r in table.to_dict('records')]
+    base_seconds = np.array([b.get('seconds', np.nan) for b in base], dtype=np.float64)
+    base_bytes = np.array([b.get('peak_bytes', np.nan) for b in base], dtype=np.float64)
+
+    seconds = table['seconds'].to_numpy(dtype=np.float64)
+    peak_bytes = table['peak_bytes'].to_numpy(dtype=np.float64)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+
+        table['time_ratio'] = seconds / base_seconds
+        table['memory_ratio'] = peak_bytes / base_bytes
+
+        table['slower'] = (
+            (table['time_ratio'] > 1 + tolerance) &
+            (seconds - base_seconds > MIN_REGRESSION_SECONDS)
+        )
+        table['more_memory'] = (
+            (table['memory_ratio'] > 1 + tolerance) &
+            (peak_bytes - base_bytes > MIN_REGRESSION_BYTES)
+        )
+
+        previous = table.groupby('stage')[['rows', 'seconds']].shift()
+        table['exponent'] = (
+            np.log(seconds / previous['seconds'].to_numpy(dtype=np.float64)) /
+            np.log(table['rows'] / previous['rows'])
+        )
+
+    # Too quick to tell apart from noise.
+    timed = seconds > 10 * MIN_REGRESSION_SECONDS
+    table['superlinear'] = timed & (table['exponent'] > SUPERLINEAR_EXPONENT)
+
+    return table
+
+
+def summary(table: DataFrame) -> str:
+
+    out = table.assign(
+        peak_mb=table['peak_bytes'] / 2**20,
+        flags=np.select(
+            [table['slower'] & table['more_memory'], table['slower'], table['more_memory']],
+            ['SLOWER, MORE MEMORY', 'SLOWER', 'MORE MEMORY'],
+            ''
+        )
+    )
+    out.loc[table['superlinear'], 'flags'] = out.loc[table['superlinear'], 'flags'].str.cat(
+        ['SUPERLINEAR'] * int(table['superlinear'].sum()), sep=' '
+    ).str.strip()
+    out.loc[table['seconds'].isna(), 'flags'] = 'skipped'
+    failed = table['error'].notna()
+    out.loc[failed, 'flags'] = 'FAILED ' + table.loc[failed, 'error'].astype(str)
+
+    return out[
+        ['stage', 'rows', 'seconds', 'cpu_seconds', 'peak_mb', 'time_ratio', 'memory_ratio', 'exponent', 'flags']
+    ].to_string(index=False, float_format=lambda v: f"{v:.3g}")
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(
+        description="Time and memory benchmarks of the pipeline stages on synthetic flare lists."
+    )
+    parser.add_argument('--sizes', type=int, nargs='+', default=BENCHMARK_SIZES)
+    parser.add_argument('--stages', nargs='+', choices=list(BENCHMARK_STAGES))
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument(
+        '--max-seconds', type=float, default=120,
+        help="Skip a stage's larger sizes once they would take longer than this."
+    )
+    parser.add_argument('--baseline', default=BASELINE_FILENAME)
+    parser.add_argument('--results', default=RESULTS_FILENAME)
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--tolerance', type=float, default=REGRESSION_TOLERANCE)
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.sizes, args.stages, args.repeat, args.seed, args.max_seconds)
+    append_results(results, args.results)
+
+    table = compare(results, load_baseline(args.baseline), args.tolerance)
+    print(summary(table))
+
+    if args.save_baseline:
+        save_baseline(results, args.baseline)
+        print(f"Baseline saved to {args.baseline}")
+
+    # Non-zero exit on failed stages or regressions, so the suite can gate a
+    # CI job.
+    failed = table['error'].notna().any()
+    regressed = not args.save_baseline and (table['slower'] | table['more_memory']).any()
+
+    if failed or regressed:
+        raise SystemExit(1)
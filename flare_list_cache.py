@@ -0,0 +1,166 @@
+import hashlib
+import os
+
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+except ImportError:
+    pa = None
+
+
+TIME_COLUMNS = ['FLARE_START', 'FLARE_PEAK', 'FLARE_END']
+
+# Bumped whenever the dtype rules below change so old sidecars are rebuilt.
+CACHE_VERSION = '1'
+
+
+def _file_sha256(filename: str) -> str:
+
+    sha = hashlib.sha256()
+
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            sha.update(block)
+
+    return sha.hexdigest()
+
+
+def _narrow_int(col: pd.Series, dtype) -> pd.Series:
+
+    # Only narrow flag columns whose values fit, otherwise leave as parsed.
+    info = np.iinfo(dtype)
+
+    if (
+        pd.api.types.is_numeric_dtype(col) and
+        col.notna().all() and
+        col.min() >= info.min and
+        col.max() <= info.max
+    ):
+        return col.astype(dtype)
+
+    return col
+
+
+def typed_flare_list(df: DataFrame) -> DataFrame:
+
+    # Applies the compact dtypes used by the cache to an instrument observed
+    # flare list as read from CSV:
+    #   *_OBSERVED, *_TRIGGERED -> uint8 (flags, including the 255 code)
+    #   *FRAC_OBS*              -> float32 (fractions, including the -1 code)
+    #   FLARE_START/PEAK/END    -> datetime64
+    #   CLASS                   -> categorical
+    df = df.copy()
+
+    for col in df.columns:
+
+        if col.endswith('OBSERVED') or col.endswith('TRIGGERED'):
+            df[col] = _narrow_int(df[col], np.uint8)
+
+        elif 'FRAC_OBS' in col:
+            df[col] = df[col].astype(np.float32)
+
+        elif col in TIME_COLUMNS:
+            df[col] = pd.to_datetime(df[col], format='ISO8601')
+
+        elif col == 'CLASS':
+            df[col] = df[col].astype('category')
+
+    return df
+
+
+def _source_signature(filename: str) -> dict:
+
+    stat = os.stat(filename)
+
+    return {
+        'source_mtime_ns': str(stat.st_mtime_ns),
+        'source_size': str(stat.st_size),
+        'cache_version': CACHE_VERSION
+    }
+
+
+def _read_sidecar(sidecar: str, filename: str) -> DataFrame | None:
+
+    # Returns the cached table if the sidecar is still valid for filename.
+    if not os.path.exists(sidecar):
+        return None
+
+    try:
+        table = feather.read_table(sidecar, memory_map=True)
+    except (OSError, pa.ArrowException):
+        return None
+
+    meta = {
+        k.decode(): v.decode() for k, v in (table.schema.metadata or {}).items()
+    }
+    signature = _source_signature(filename)
+
+    if meta.get('cache_version') != CACHE_VERSION:
+        return None
+
+    if any(meta.get(k) != v for k, v in signature.items()):
+
+        # The source has been touched, only rebuild if its content changed.
+        if (
+            meta.get('source_size') != signature['source_size'] or
+            meta.get('source_sha256') != _file_sha256(filename)
+        ):
+            return None
+
+        _write_sidecar(table, sidecar, filename, meta['source_sha256'])
+
+    return table.to_pandas()
+
+
+def _write_sidecar(
+            table: 'pa.Table',
+            sidecar: str,
+            filename: str,
+            sha256: str
+        ):
+
+    meta = _source_signature(filename)
+    meta['source_sha256'] = sha256
+
+    table = table.replace_schema_metadata({
+        **(table.schema.metadata or {}),
+        **meta
+    })
+
+    # Written to a temporary file first so readers never see a partial file.
+    # Uncompressed so that reads can be memory mapped.
+    tmp = f"{sidecar}.tmp{os.getpid()}"
+    feather.write_feather(table, tmp, compression='uncompressed')
+    os.replace(tmp, sidecar)
+
+
+def load_flare_list(filename: str, use_cache=True) -> DataFrame:
+
+    # Loads an instrument observed flare list CSV with compact dtypes (see
+    # typed_flare_list). The typed table is kept in a Feather sidecar next to
+    # the CSV (<filename>.feather) and is re-read by memory mapping on later
+    # calls. The sidecar is rebuilt when the CSV's mtime or size changes and
+    # its SHA-256 no longer matches. Without pyarrow the CSV is parsed on
+    # every call.
+    sidecar = f"{filename}.feather"
+
+    if use_cache and pa is not None:
+        cached = _read_sidecar(sidecar, filename)
+        if cached is not None:
+            return cached
+
+    df = typed_flare_list(pd.read_csv(filename))
+
+    if use_cache and pa is not None:
+        _write_sidecar(
+            pa.Table.from_pandas(df, preserve_index=False),
+            sidecar,
+            filename,
+            _file_sha256(filename)
+        )
+
+    return df
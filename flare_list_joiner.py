@@ -1,87 +1,266 @@
+import argparse
+import os
+import numpy as np
 import pandas as pd
 from pandas import DataFrame
 import sys
+import tempfile
+
+from goes_class import goes_class_rank, goes_class_rank_decode
+from pipeline_metrics import stage
+
+
+HER_COLUMNS = {
+    "GEV_START": "flare_start",
+    "GEV_PEAK": "flare_peak",
+    "GEV_END": "flare_end",
+    "GOES_CLASS": "class",
+    "AIA_LOC": "aia_loc",
+    "AIA_XCEN": "aia_xcen",
+    "AIA_YCEN": "aia_ycen"
+}
+
+GEV_COLUMNS = {
+    "GSTART": "flare_start",
+    "GPEAK": "flare_peak",
+    "GEND": "flare_end",
+    "CLASS": "class",
+    "LOC": "loc",
+    "NOAA_AR": "noaa_ar"
+}
+
+HER_TIME_FORMAT = "%Y-%m-%dT%H:%M:%S"
+GEV_TIME_FORMAT = "%d-%b-%Y %H:%M:%S"
+
 
 def goes_class_ranking_val(goes_class: str) -> float:
 
-    class_rank = {
-        "A": 10,
-        "B": 20,
-        "C": 30,
-        "M": 40,
-        "X": 50
-    }
-    
     if not isinstance(goes_class, str):
         return 0
-    
-    letter = goes_class[0]
-    number = goes_class[1:]
-
-    return class_rank[letter] + float(number)
-
-def goes_class_ranking_val_decode(goes_class_val: str) -> float:
-
-    class_rank = {
-        "A": 10,
-        "B": 20,
-        "C": 30,
-        "M": 40,
-        "X": 50
-    }
-    
-    goes_rank = ""
-
-    for rank in class_rank:
-        if goes_class_val - class_rank[rank] > 0:
-            goes_rank = rank
-        else:
-            break
 
-    return f"{goes_rank}{round(goes_class_val - class_rank[goes_rank], 1)}"
+    return float(goes_class_rank([goes_class])[0])
 
+def goes_class_ranking_val_decode(goes_class_val: float) -> str:
 
-def create_her_goes_list(
+    return goes_class_rank_decode([goes_class_val])[0]
+
+
+def match_flares_nearest(
+            her: DataFrame,
+            gev: DataFrame,
+            peak_tolerance: pd.Timedelta = pd.Timedelta(minutes=2),
+            require_overlap: bool = True
+        ) -> tuple[np.ndarray, np.ndarray]:
+
+    # One-to-one matching of HER and GEV flares on their peak times. Returns
+    # arrays of positional (her_row, gev_row) pairs.
+    #
+    # Candidate pairs are the GEV flares whose peak lies within
+    # peak_tolerance of a HER peak, found with a searchsorted over the sorted
+    # GEV peaks, so the cost is O(n log n) plus the number of candidates.
+    # With require_overlap, candidates must also have overlapping
+    # start -> end intervals. Candidates are ranked by peak separation, with
+    # ties broken on peak and start times and finally row position, and are
+    # accepted greedily in that order.
+    her_peak = her['flare_peak'].to_numpy(dtype='datetime64[ns]').view(np.int64)
+    gev_peak = gev['flare_peak'].to_numpy(dtype='datetime64[ns]').view(np.int64)
+
+    nat = np.iinfo(np.int64).min
+    tol = pd.Timedelta(peak_tolerance).value
+
+    her_rows = np.flatnonzero(her_peak != nat)
+    gev_rows = np.flatnonzero(gev_peak != nat)
+    gev_rows = gev_rows[np.argsort(gev_peak[gev_rows], kind='stable')]
+    gev_sorted = gev_peak[gev_rows]
+
+    lo = np.searchsorted(gev_sorted, her_peak[her_rows] - tol, side='left')
+    hi = np.searchsorted(gev_sorted, her_peak[her_rows] + tol, side='right')
+    counts = hi - lo
+
+    cand_her = np.repeat(her_rows, counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    cand_gev = gev_rows[np.repeat(lo, counts) + offsets]
+
+    her_start = her['flare_start'].to_numpy(dtype='datetime64[ns]')
+    gev_start = gev['flare_start'].to_numpy(dtype='datetime64[ns]')
+
+    if require_overlap:
+        her_end = her['flare_end'].to_numpy(dtype='datetime64[ns]')
+        gev_end = gev['flare_end'].to_numpy(dtype='datetime64[ns]')
+
+        overlap = (
+            (her_start[cand_her] <= gev_end[cand_gev]) &
+            (gev_start[cand_gev] <= her_end[cand_her])
+        )
+
+        cand_her = cand_her[overlap]
+        cand_gev = cand_gev[overlap]
+
+    separation = np.abs(her_peak[cand_her] - gev_peak[cand_gev])
+    order = np.lexsort((
+        cand_gev,
+        cand_her,
+        gev_start[cand_gev],
+        her_start[cand_her],
+        gev_peak[cand_gev],
+        her_peak[cand_her],
+        separation
+    ))
+    cand_her = cand_her[order]
+    cand_gev = cand_gev[order]
+
+    # Greedy acceptance in one pass over the ranked candidates, skipping any
+    # whose HER or GEV flare is already matched.
+    used_her = bytearray(len(her))
+    used_gev = bytearray(len(gev))
+    accept = []
+
+    for i, (h, g) in enumerate(zip(cand_her.tolist(), cand_gev.tolist())):
+        if not (used_her[h] or used_gev[g]):
+            used_her[h] = used_gev[g] = 1
+            accept.append(i)
+
+    accept = np.asarray(accept, dtype=np.int64)
+
+    return cand_her[accept], cand_gev[accept]
+
+
+def _join_nearest(
             her: DataFrame,
             gev: DataFrame,
-            csv_out=False
+            peak_tolerance: pd.Timedelta,
+            require_overlap: bool
         ) -> DataFrame:
 
-    her = her.rename(columns={
-        "GEV_START": "flare_start",
-        "GEV_PEAK": "flare_peak",
-        "GEV_END": "flare_end",
-        "GOES_CLASS": "class",
-        "AIA_LOC": "aia_loc",
-        "AIA_XCEN": "aia_xcen",
-        "AIA_YCEN": "aia_ycen"
-    })
-
-    gev = gev.rename(columns={
-        "GSTART": "flare_start",
-        "GPEAK": "flare_peak",
-        "GEND": "flare_end",
-        "CLASS": "class",
-        "LOC": "loc",
-        "NOAA_AR": "noaa_ar"
-    })
+    her = her.reset_index(drop=True)
+    gev = gev.reset_index(drop=True)
 
-    fl_zip = zip(
-        [her, gev],
-        ["%Y-%m-%dT%H:%M:%S", "%d-%b-%Y %H:%M:%S"]
+    her_idx, gev_idx = match_flares_nearest(
+        her, gev, peak_tolerance, require_overlap
+    )
+
+    her_only = np.setdiff1d(np.arange(len(her)), her_idx)
+    gev_only = np.setdiff1d(np.arange(len(gev)), gev_idx)
+
+    # -1 is not in either RangeIndex, so reindexing on it yields empty rows.
+    left = np.concatenate([her_idx, her_only, np.full(len(gev_only), -1)])
+    right = np.concatenate([gev_idx, np.full(len(her_only), -1), gev_only])
+
+    shared = her.columns.intersection(gev.columns)
+
+    result = pd.concat(
+        [
+            her.reindex(left).reset_index(drop=True).rename(
+                columns={col: f"{col}_x" for col in shared}
+            ),
+            gev.reindex(right).reset_index(drop=True).rename(
+                columns={col: f"{col}_y" for col in shared}
+            )
+        ],
+        axis=1
     )
 
-    for fl, fl_fmt in fl_zip:
-        for col in ["flare_start", "flare_peak", "flare_end"]:
-            fl[col] = pd.to_datetime(fl[col], format=fl_fmt)
+    # Matched rows take the GEV peak time, the GOES event list being the
+    # reference for peak times.
+    result['flare_peak'] = result['flare_peak_y'].fillna(result['flare_peak_x'])
 
-    result =  (
-        her
-            .merge(gev, on=["flare_peak"], how='outer')
-            .sort_values(by=["flare_peak"])
+    return (
+        result
+            .drop(['flare_peak_x', 'flare_peak_y'], axis=1)
+            .sort_values(by=["flare_peak"], kind='stable')
             .reset_index()
     )
 
+
+def _add_detected(
+            result: DataFrame,
+            detected: DataFrame,
+            peak_tolerance: pd.Timedelta,
+            require_overlap: bool
+        ) -> DataFrame:
+
+    # Cross-checks the joined list against flares detected in the GOES light
+    # curves (see goes_flare_detector), given in the GEV format. Each joined
+    # flare is matched one-to-one with the nearest detected flare as in
+    # match_flares_nearest, and unmatched detections, e.g. in the HER gaps,
+    # are added as new flares. The 'detected' column records the outcome:
+    # 'matched', 'catalogue_only' or 'detector_only'.
+    detected = detected.rename(columns=GEV_COLUMNS)
+
+    for col in ["flare_start", "flare_peak", "flare_end"]:
+        detected[col] = pd.to_datetime(detected[col], format=GEV_TIME_FORMAT)
+
+    result = result.reset_index(drop=True)
+    detected = detected.reset_index(drop=True)
+
+    # A flare still in progress at the end of the data has no end time, and
+    # is matched as if it ended at its peak.
+    result_idx, detected_idx = match_flares_nearest(
+        result,
+        detected.assign(flare_end=detected['flare_end'].fillna(detected['flare_peak'])),
+        peak_tolerance,
+        require_overlap
+    )
+
+    result['detected'] = 'catalogue_only'
+    result.loc[result_idx, 'detected'] = 'matched'
+
+    detected_only = detected.drop(index=detected_idx)[
+        ['flare_start', 'flare_peak', 'flare_end', 'class']
+    ].assign(detected='detector_only')
+
+    return (
+        pd.concat([result, detected_only], ignore_index=True)
+            .sort_values(by=["flare_peak"], kind='stable')
+            .reset_index(drop=True)
+    )
+
+
+def create_her_goes_list(
+            her: DataFrame,
+            gev: DataFrame,
+            csv_out=False,
+            join='exact',
+            peak_tolerance=pd.Timedelta(minutes=2),
+            require_overlap=True,
+            detected: DataFrame | None = None
+        ) -> DataFrame:
+
+    # join='exact' performs an outer merge on identical peak times.
+    # join='nearest' matches each flare one-to-one with the closest flare
+    # in the other list whose peak is within peak_tolerance (and, with
+    # require_overlap, whose start -> end interval overlaps), see
+    # match_flares_nearest.
+    #
+    # detected is an optional third list of flares found in the GOES light
+    # curves, which fills gaps in the joined list, see _add_detected.
+
+    her = her.rename(columns=HER_COLUMNS)
+    gev = gev.rename(columns=GEV_COLUMNS)
+
+    fl_zip = zip(
+        [her, gev],
+        [HER_TIME_FORMAT, GEV_TIME_FORMAT]
+    )
+
+    with stage('join.parse_times', rows=len(her) + len(gev)):
+        for fl, fl_fmt in fl_zip:
+            for col in ["flare_start", "flare_peak", "flare_end"]:
+                fl[col] = pd.to_datetime(fl[col], format=fl_fmt)
+
+    with stage(f"join.{join}", rows=len(her) + len(gev)):
+        if join == 'exact':
+            result =  (
+                her
+                    .merge(gev, on=["flare_peak"], how='outer')
+                    .sort_values(by=["flare_peak"])
+                    .reset_index()
+            )
+        elif join == 'nearest':
+            result = _join_nearest(her, gev, peak_tolerance, require_overlap)
+        else:
+            raise ValueError(f"Unknown join mode: {join!r}")
+
     merged_flare_start = pd.concat(
         [result['flare_start_x'], result['flare_start_y']],
         axis=1
@@ -92,21 +271,14 @@ def create_her_goes_list(
         axis=1
     )
 
-    merged_class = pd.concat(
-        [
-            result['class_x'].apply(goes_class_ranking_val), 
-            result['class_y'].apply(goes_class_ranking_val)
-        ],
-        axis=1
+    merged_class = np.fmax(
+        goes_class_rank(result['class_x']),
+        goes_class_rank(result['class_y'])
     )
 
     result['flare_start'] = merged_flare_start.min(axis=1)
     result['flare_end'] = merged_flare_end.max(axis=1)
-    result['class'] = (
-        merged_class
-            .max(axis=1)
-            .apply(goes_class_ranking_val_decode)
-    )
+    result['class'] = goes_class_rank_decode(merged_class)
 
     result = result.drop(
         ['flare_start_x',
@@ -119,25 +291,264 @@ def create_her_goes_list(
         axis=1
     )
 
-    return (
-        result[[
-            'flare_start',
-            'flare_peak',
-            'flare_end',
-            'class',
-            'aia_loc',
-            'aia_xcen',
-            'aia_ycen',
-            'loc',
-            'noaa_ar'
-        ]]
-    )
+    columns = [
+        'flare_start',
+        'flare_peak',
+        'flare_end',
+        'class',
+        'aia_loc',
+        'aia_xcen',
+        'aia_ycen',
+        'loc',
+        'noaa_ar'
+    ]
+
+    if detected is not None:
+        with stage('join.detected', rows=len(detected)):
+            result = _add_detected(result, detected, peak_tolerance, require_overlap)
+        columns.append('detected')
+
+    return result[columns]
+
+
+def _iter_partitions(
+            filepath: str,
+            peak_col: str,
+            time_format: str,
+            partition: str,
+            chunksize: int
+        ):
+
+    # Yields (period, rows) for each partition period of a flare list in time
+    # order. The lists are not necessarily in time order (the GEV lists are
+    # sorted on their date strings), so the CSV is first read in chunks and
+    # each chunk's rows are appended to a temporary file per period. Only one
+    # chunk or one period's rows are held in memory at a time. Columns are
+    # kept as strings so that every partition is read back identically.
+    #
+    # Flares without a peak time cannot be placed in a partition; they are
+    # yielded last, with period None.
+    with tempfile.TemporaryDirectory() as spill_dir:
+
+        spill_files = {}
+
+        for chunk in pd.read_csv(filepath, chunksize=chunksize, dtype=str):
+
+            peaks = pd.to_datetime(chunk[peak_col], format=time_format)
+            periods = peaks.dt.to_period(partition).astype(object).where(peaks.notna(), None)
+
+            for period, rows in chunk.groupby(periods, dropna=False, sort=False):
+
+                period = None if pd.isna(period) else period
+
+                spill_file = spill_files.get(period)
+                new_file = spill_file is None
+
+                if new_file:
+                    spill_file = os.path.join(spill_dir, f"{len(spill_files)}.csv")
+                    spill_files[period] = spill_file
+
+                rows.to_csv(spill_file, mode='a', header=new_file, index=False)
+
+        for period in sorted(p for p in spill_files if p is not None):
+            yield period, pd.read_csv(spill_files[period], dtype=str)
+
+        if None in spill_files:
+            yield None, pd.read_csv(spill_files[None], dtype=str)
+
+
+def stream_her_goes_list(
+            her_filepath: str,
+            gev_filepath: str,
+            output_filepath: str,
+            partition='M',
+            margin=pd.Timedelta(hours=2),
+            chunksize=5000,
+            verbose=False,
+            **join_kwargs
+        ) -> int:
+
+    # Bounded memory version of create_her_goes_list working from CSV files.
+    #
+    # Both lists are split into partitions (calendar months by default) on
+    # their peak times. Each partition is joined together with the flares
+    # within margin of either side of it, so flares matched across a
+    # partition boundary are not lost, and only joined rows whose peak falls
+    # inside the partition are appended to output_filepath. Peak memory
+    # depends on the size of three neighbouring partitions rather than the
+    # length of the lists. Flares without a peak time are joined among
+    # themselves after the last partition, as create_her_goes_list sorts
+    # them last. Returns the number of rows written.
+    margin = pd.Timedelta(margin)
+
+    sources = [
+        _iter_partitions(
+            her_filepath, "GEV_PEAK", HER_TIME_FORMAT, partition, chunksize
+        ),
+        _iter_partitions(
+            gev_filepath, "GPEAK", GEV_TIME_FORMAT, partition, chunksize
+        )
+    ]
+    time_formats = [HER_TIME_FORMAT, GEV_TIME_FORMAT]
+    peak_cols = ["GEV_PEAK", "GPEAK"]
+    templates = [
+        pd.read_csv(her_filepath, nrows=0, dtype=str),
+        pd.read_csv(gev_filepath, nrows=0, dtype=str)
+    ]
+
+    buffers = [{}, {}]
+    no_peak = [templates[0], templates[1]]
+    exhausted = [False, False]
+
+    def fill(i, after):
+        # Load partitions from source i until one later than `after` is held.
+        while not exhausted[i] and (
+            not buffers[i] or after is None or max(buffers[i]) <= after
+        ):
+            try:
+                period, rows = next(sources[i])
+            except StopIteration:
+                exhausted[i] = True
+            else:
+                if period is None:
+                    no_peak[i] = rows
+                else:
+                    buffers[i][period] = rows
+
+    last = None
+    rows_written = 0
+
+    def write(result):
+        result.index = pd.RangeIndex(rows_written, rows_written + len(result))
+        result.to_csv(
+            output_filepath,
+            mode='w' if rows_written == 0 and last is None else 'a',
+            header=rows_written == 0 and last is None
+        )
+
+    while True:
+
+        for i in (0, 1):
+            fill(i, last)
+
+        pending = [
+            period
+            for buffer in buffers
+            for period in buffer
+            if last is None or period > last
+        ]
+
+        if not pending:
+            break
+
+        period = min(pending)
+
+        # Make sure the following partition is complete before joining.
+        for i in (0, 1):
+            fill(i, period)
+
+        window_start = period.start_time - margin
+        window_end = period.end_time + margin
+
+        if margin >= period.end_time - period.start_time:
+            raise ValueError("margin must be shorter than a partition.")
+
+        parts = []
+        for i in (0, 1):
+            neighbours = [
+                buffers[i][p]
+                for p in (period - 1, period, period + 1)
+                if p in buffers[i]
+            ]
+            rows = pd.concat([templates[i], *neighbours])
+
+            peaks = pd.to_datetime(rows[peak_cols[i]], format=time_formats[i])
+            parts.append(
+                rows[(peaks >= window_start) & (peaks <= window_end)]
+            )
+
+        with stage('join.partition') as partition_stage:
+
+            result = create_her_goes_list(*parts, **join_kwargs)
+            result = result[
+                (result['flare_peak'] >= period.start_time) &
+                (result['flare_peak'] <= period.end_time)
+            ]
+
+            write(result)
+
+            partition_stage.rows = len(result)
+        rows_written += len(result)
+
+        if verbose:
+            print(f"{period}: {len(result)} flares written.")
+
+        for buffer in buffers:
+            for p in [p for p in buffer if p < period]:
+                del buffer[p]
+
+        last = period
+
+    if len(no_peak[0]) or len(no_peak[1]):
+
+        result = create_her_goes_list(*no_peak, **join_kwargs)
+        write(result)
+        rows_written += len(result)
+
+        if verbose:
+            print(f"Without a peak time: {len(result)} flares written.")
+
+    elif last is None:
+        # Neither list had any flares; still write the header.
+        write(create_her_goes_list(*templates, **join_kwargs))
+
+    return rows_written
 
 
 if __name__ == "__main__":
 
-    her_filepath = sys.argv[1]
-    gev_filepath = sys.argv[2]
+    parser = argparse.ArgumentParser(
+        description="Join a HER flare list with a GOES event list."
+    )
+    parser.add_argument('her_filepath')
+    parser.add_argument('gev_filepath')
+    parser.add_argument('verbose', nargs='?', default=None)
+    parser.add_argument(
+        '--join', choices=['exact', 'nearest'], default='exact'
+    )
+    parser.add_argument(
+        '--peak-tolerance', type=float, default=2,
+        help="Peak tolerance in minutes for --join nearest."
+    )
+    parser.add_argument(
+        '--no-overlap', action='store_true',
+        help="Do not require start/end overlap for --join nearest."
+    )
+    parser.add_argument(
+        '--stream', action='store_true',
+        help="Join the lists partition by partition with bounded memory."
+    )
+    parser.add_argument(
+        '--partition', default='M',
+        help="Partition period for --stream (pandas period alias)."
+    )
+    parser.add_argument(
+        '--margin', type=float, default=120,
+        help="Partition overlap margin in minutes for --stream."
+    )
+    parser.add_argument('--chunksize', type=int, default=5000)
+    parser.add_argument(
+        '--detected',
+        help="Flares detected in the GOES light curves (goes_flare_detector.py) "
+        "to fill gaps in the joined list. Not supported with --stream."
+    )
+    args = parser.parse_args()
+
+    if args.stream and args.detected:
+        parser.error("--detected is not supported with --stream")
+
+    her_filepath = args.her_filepath
+    gev_filepath = args.gev_filepath
 
     her_filename = her_filepath.rsplit('/', 1)[-1]
     gev_filename = gev_filepath.rsplit('/', 1)[-1]
@@ -145,33 +556,63 @@ if __name__ == "__main__":
     result_filename = f"joined_{her_filename[:-4]}+{gev_filename}"
     output_filepath = f"flare_lists_csv/{result_filename}"
 
-    try:
-        verbose = sys.argv[3]
-        if verbose == 'verbose':
-            verbose = True
-    except:
-        verbose = False
+    verbose = args.verbose == 'verbose'
+
+    join_kwargs = dict(
+        join=args.join,
+        peak_tolerance=pd.Timedelta(minutes=args.peak_tolerance),
+        require_overlap=not args.no_overlap
+    )
 
     if verbose:
         print(f"HER filepath: {her_filepath}")
         print(f"GEV filepath: {gev_filepath}")
         print(f"Output filepath: {output_filepath}")
 
-    her = pd.read_csv(her_filepath)
+    if args.stream:
+
+        if verbose:
+            print("Joining lists by partition...")
+
+        rows_written = stream_her_goes_list(
+            her_filepath,
+            gev_filepath,
+            output_filepath,
+            partition=args.partition,
+            margin=pd.Timedelta(minutes=args.margin),
+            chunksize=args.chunksize,
+            verbose=verbose,
+            **join_kwargs
+        )
+
+        if verbose:
+            print(f"Joined {rows_written} flares and output to {output_filepath}")
+
+        sys.exit()
+
+    with stage('join.read_her') as read_stage:
+        her = pd.read_csv(her_filepath)
+        read_stage.rows = len(her)
 
     if verbose:
         print("HER list loaded.")
 
-    gev = pd.read_csv(gev_filepath)
+    with stage('join.read_gev') as read_stage:
+        gev = pd.read_csv(gev_filepath)
+        read_stage.rows = len(gev)
 
     if verbose:
-        print("HER list loaded.")
+        print("GEV list loaded.")
 
     if verbose:
         print("Joining lists...")
 
-    result = create_her_goes_list(her, gev)
-    result.to_csv(output_filepath)
+    detected = pd.read_csv(args.detected) if args.detected else None
+
+    result = create_her_goes_list(her, gev, detected=detected, **join_kwargs)
+
+    with stage('join.write', rows=len(result)):
+        result.to_csv(output_filepath)
 
     if verbose:
         print(f"Joined and output to {output_filepath}")
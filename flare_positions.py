@@ -0,0 +1,451 @@
+import argparse
+
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+
+from fov_overlap import in_fov
+
+
+# Heliographic location strings, e.g. S06W07: latitude north / south and
+# longitude east / west of the central meridian, in degrees.
+LOCATION_PATTERN = r'^\s*([NS])(\d{1,2})([EW])(\d{1,3})\s*$'
+
+# Solar radius in arcsec at 1 AU, and the Earth's orbit and the tilt of the
+# solar equator for the approximate ephemeris below (good to a few arcsec,
+# plenty for selecting flares).
+RSUN_ARCSEC_1AU = 959.63
+ORBIT_ECCENTRICITY = 0.01672
+B0_MAX_DEG = 7.25
+YEAR_DAYS = 365.25
+
+# Synodic differential rotation in deg/day, A + B sin^2(lat) + C sin^4(lat)
+# (Howard et al. 1990, less the Earth's orbital motion).
+ROTATION_DEG_PER_DAY = (14.713 - 0.9856, -2.396, -1.787)
+
+# How long before its first and after its last flare an active region is
+# tracked for.
+REGION_TRACK_MARGIN = pd.Timedelta(days=2)
+
+# Fraction of the solar radius beyond which a flare counts as at the limb.
+LIMB_RHO = 0.9
+
+# Side of the grid cells positions are binned in, in arcsec, and the extent
+# of the grid; positions beyond it go in the edge cells.
+GRID_CELL_ARCSEC = 64
+GRID_EXTENT_ARCSEC = 1216
+
+
+########################
+# Locations on the Sun #
+########################
+
+
+def parse_locations(locations) -> tuple[np.ndarray, np.ndarray]:
+
+    # Heliographic latitude and longitude (deg, north and west positive) of
+    # location strings like S06W07. Empty or malformed strings give NaN.
+    # Each distinct string is only parsed once, as flare lists repeat them.
+    codes, uniques = pd.factorize(pd.Series(locations, dtype=object).fillna(''))
+
+    parts = pd.Series(uniques, dtype=object).astype(str).str.extract(LOCATION_PATTERN)
+
+    lat = parts[1].astype(np.float64).to_numpy() * np.where(parts[0] == 'S', -1, 1)
+    lon = parts[3].astype(np.float64).to_numpy() * np.where(parts[2] == 'E', -1, 1)
+
+    # factorize codes missing values as -1, which picks the appended NaN.
+    lat = np.append(lat, np.nan)[codes]
+    lon = np.append(lon, np.nan)[codes]
+
+    return lat, lon
+
+
+def _day_of_year(times) -> np.ndarray:
+
+    times = pd.DatetimeIndex(pd.to_datetime(np.atleast_1d(times)))
+
+    return (times.dayofyear + times.hour / 24).to_numpy(dtype=np.float64)
+
+
+def solar_radius(times) -> np.ndarray:
+
+    # Apparent solar radius in arcsec as seen from the Earth.
+    doy = _day_of_year(times)
+    distance = 1 - ORBIT_ECCENTRICITY * np.cos(2 * np.pi * (doy - 4) / YEAR_DAYS)
+
+    return RSUN_ARCSEC_1AU / distance
+
+
+def solar_b0(times) -> np.ndarray:
+
+    # Heliographic latitude of the disk centre in degrees, zero in early June
+    # and December and largest in early September.
+    doy = _day_of_year(times)
+
+    return B0_MAX_DEG * np.sin(2 * np.pi * (doy - 157) / YEAR_DAYS)
+
+
+def heliographic_to_arcsec(lat, lon, times) -> tuple[np.ndarray, np.ndarray]:
+
+    # Helioprojective x, y (arcsec from disk centre, solar north up, as
+    # AIA_XCEN / AIA_YCEN) of heliographic positions at times, with the
+    # longitude measured from the central meridian.
+    lat = np.radians(np.asarray(lat, dtype=np.float64))
+    lon = np.radians(np.asarray(lon, dtype=np.float64))
+    b0 = np.radians(solar_b0(times))
+    radius = solar_radius(times)
+
+    x = radius * np.cos(lat) * np.sin(lon)
+    y = radius * (np.sin(lat) * np.cos(b0) - np.cos(lat) * np.cos(lon) * np.sin(b0))
+
+    return x, y
+
+
+def arcsec_to_heliographic(x, y, times) -> tuple[np.ndarray, np.ndarray]:
+
+    # Inverse of heliographic_to_arcsec for points on the disk; points off
+    # the disk are put on the limb.
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    b0 = np.radians(solar_b0(times))
+    radius = solar_radius(times)
+
+    z = np.sqrt(np.maximum(radius**2 - x**2 - y**2, 0))
+
+    lat = np.arcsin(np.clip((y * np.cos(b0) + z * np.sin(b0)) / radius, -1, 1))
+    lon = np.arctan2(x, z * np.cos(b0) - y * np.sin(b0))
+
+    return np.degrees(lat), np.degrees(lon)
+
+
+def rotation_rate(lat) -> np.ndarray:
+
+    # Synodic rotation rate in deg/day at latitude lat (deg).
+    a, b, c = ROTATION_DEG_PER_DAY
+    sin2 = np.sin(np.radians(np.asarray(lat, dtype=np.float64)))**2
+
+    return a + b * sin2 + c * sin2**2
+
+
+def flare_positions(df: DataFrame) -> tuple[np.ndarray, np.ndarray]:
+
+    # x, y in arcsec of each flare: AIA_XCEN / AIA_YCEN where the flare has
+    # them (not the (0, 0) placeholder), otherwise the projection of LOC,
+    # and failing that AIA_LOC, at FLARE_PEAK. NaN where none is known.
+    #
+    # LOC goes first as projecting it lands on AIA_XCEN / AIA_YCEN to within
+    # its rounding, while the AIA_LOC latitudes in the flare lists sit a few
+    # degrees north of them.
+    x = np.full(len(df), np.nan)
+    y = np.full(len(df), np.nan)
+
+    if 'AIA_XCEN' in df and 'AIA_YCEN' in df:
+
+        xcen = df['AIA_XCEN'].to_numpy(dtype=np.float64)
+        ycen = df['AIA_YCEN'].to_numpy(dtype=np.float64)
+        known = np.isfinite(xcen) & np.isfinite(ycen) & ((xcen != 0) | (ycen != 0))
+
+        x[known] = xcen[known]
+        y[known] = ycen[known]
+
+    for col in ['LOC', 'AIA_LOC']:
+
+        missing = np.flatnonzero(np.isnan(x))
+        if col not in df or len(missing) == 0:
+            continue
+
+        lat, lon = parse_locations(df[col].to_numpy(dtype=object)[missing])
+        peaks = df['FLARE_PEAK'].to_numpy(dtype='datetime64[ns]')[missing]
+
+        x[missing], y[missing] = heliographic_to_arcsec(lat, lon, peaks)
+
+    return x, y
+
+
+##################
+# Position Index #
+##################
+
+
+class FlarePositionIndex:
+
+    # Spatial index of a flare list on a uniform grid of GRID_CELL_ARCSEC
+    # cells over the disk. Flares are ordered by (cell, FLARE_PEAK), as in
+    # CoObservationIndex, so a query only visits the cells its region
+    # overlaps and, with a time window, only the run of each cell's flares
+    # inside the window (a searchsorted per cell), before the exact test on
+    # the few flares left. Flares without a position are never returned by
+    # a spatial query.
+    #
+    # All queries return positional rows of the flare list in table order,
+    # so they can be combined with each other and with CoObservationIndex
+    # rows using np.intersect1d.
+
+    def __init__(self, x: np.ndarray, y: np.ndarray, peaks: np.ndarray):
+
+        self.x = np.asarray(x, dtype=np.float64)
+        self.y = np.asarray(y, dtype=np.float64)
+        self.peaks = np.asarray(peaks, dtype='datetime64[ns]').view(np.int64)
+
+        # Distance from disk centre in solar radii.
+        self.rho = np.hypot(self.x, self.y) / solar_radius(self.peaks.view('datetime64[ns]'))
+
+        self.n_side = 2 * GRID_EXTENT_ARCSEC // GRID_CELL_ARCSEC
+        n_cells = self.n_side**2
+
+        known = np.isfinite(self.x) & np.isfinite(self.y)
+        cell = np.where(known, self._cell(self.x, self.y), n_cells)
+
+        # The unknown positions sort into an extra, never visited, cell.
+        self._order = np.lexsort((self.peaks, cell))
+        self._sorted_peaks = self.peaks[self._order]
+        self._offsets = np.concatenate([
+            [0], np.cumsum(np.bincount(cell, minlength=n_cells + 1))
+        ])
+
+    @classmethod
+    def from_flare_list(cls, df: DataFrame) -> 'FlarePositionIndex':
+
+        x, y = flare_positions(df)
+
+        return cls(x, y, df['FLARE_PEAK'].to_numpy(dtype='datetime64[ns]'))
+
+    def __len__(self) -> int:
+
+        return len(self.x)
+
+    def _grid(self, v) -> np.ndarray:
+
+        v = (np.asarray(v, dtype=np.float64) + GRID_EXTENT_ARCSEC) // GRID_CELL_ARCSEC
+
+        return np.clip(np.nan_to_num(v), 0, self.n_side - 1).astype(np.intp)
+
+    def _cell(self, x, y) -> np.ndarray:
+
+        return self._grid(y) * self.n_side + self._grid(x)
+
+    def _time_bounds(self, t0, t1) -> tuple[int, int]:
+
+        lo = np.iinfo(np.int64).min + 1 if t0 is None else pd.Timestamp(t0).value
+        hi = np.iinfo(np.int64).max if t1 is None else pd.Timestamp(t1).value
+
+        return lo, hi
+
+    def _candidates(self, x0, x1, y0, y1, t0=None, t1=None) -> np.ndarray:
+
+        # Rows in the cells overlapping the box [x0, x1] x [y0, y1] and
+        # peaking in [t0, t1].
+        lo_t, hi_t = self._time_bounds(t0, t1)
+
+        gx0, gx1 = self._grid(x0), self._grid(x1)
+        gy0, gy1 = self._grid(y0), self._grid(y1)
+
+        parts = []
+
+        for gy in range(int(gy0), int(gy1) + 1):
+
+            # The cells of a grid row are contiguous in the ordering.
+            c0 = gy * self.n_side + int(gx0)
+            c1 = gy * self.n_side + int(gx1)
+
+            for c in range(c0, c1 + 1):
+
+                a, b = self._offsets[c], self._offsets[c + 1]
+                if a == b:
+                    continue
+
+                peaks = self._sorted_peaks[a:b]
+                i = a + np.searchsorted(peaks, lo_t, side='left')
+                j = a + np.searchsorted(peaks, hi_t, side='right')
+
+                parts.append(self._order[i:j])
+
+        if not parts:
+            return np.zeros(0, dtype=np.intp)
+
+        return np.concatenate(parts)
+
+    def window(self, t0=None, t1=None) -> np.ndarray:
+
+        # Rows peaking in [t0, t1], positions or not.
+        lo_t, hi_t = self._time_bounds(t0, t1)
+
+        return np.flatnonzero((self.peaks >= lo_t) & (self.peaks <= hi_t))
+
+    def region(self, x0, x1, y0, y1, t0=None, t1=None) -> np.ndarray:
+
+        # Rows inside the box [x0, x1] x [y0, y1] (arcsec), edges included.
+        rows = self._candidates(x0, x1, y0, y1, t0, t1)
+        inside = in_fov(
+            self.x[rows], self.y[rows], (x0 + x1) / 2, (y0 + y1) / 2, x1 - x0, y1 - y0
+        )
+
+        return np.sort(rows[inside])
+
+    def radius(self, x, y, r, t0=None, t1=None) -> np.ndarray:
+
+        # Rows within r arcsec of (x, y).
+        rows = self._candidates(x - r, x + r, y - r, y + r, t0, t1)
+        inside = np.hypot(self.x[rows] - x, self.y[rows] - y) <= r
+
+        return np.sort(rows[inside])
+
+    def nearest(self, x, y, t0=None, t1=None, max_distance=None) -> int:
+
+        # Row of the flare closest to (x, y), or -1 if there is none (within
+        # max_distance). The search box grows until it holds a flare whose
+        # distance is no more than the box's half width, which no flare
+        # outside the box can beat.
+        limit = 2 * np.hypot(GRID_EXTENT_ARCSEC, GRID_EXTENT_ARCSEC) + np.hypot(x, y)
+        if max_distance is not None:
+            limit = min(limit, max_distance)
+
+        r = min(GRID_CELL_ARCSEC, limit)
+
+        while True:
+
+            rows = self._candidates(x - r, x + r, y - r, y + r, t0, t1)
+
+            if len(rows):
+                distance = np.hypot(self.x[rows] - x, self.y[rows] - y)
+                best = int(np.argmin(distance))
+
+                if distance[best] <= r:
+                    return int(rows[best])
+
+            if r >= limit:
+                return -1
+
+            r = min(2 * r, limit)
+
+    def limb(self, t0=None, t1=None, min_rho=LIMB_RHO) -> np.ndarray:
+
+        # Rows at least min_rho solar radii from disk centre, including
+        # those beyond the limb.
+        rows = self.window(t0, t1)
+
+        return rows[self.rho[rows] >= min_rho]
+
+    def disk_centre(self, t0=None, t1=None, max_rho=0.5) -> np.ndarray:
+
+        # Rows within max_rho solar radii of disk centre.
+        rows = self.window(t0, t1)
+
+        return rows[self.rho[rows] <= max_rho]
+
+
+#######################
+# Active Region Track #
+#######################
+
+
+def region_track(df: DataFrame, noaa_ar: int) -> tuple:
+
+    # (lat, lon, first, last): latitude and central meridian longitude of an
+    # active region at its first flare's peak, from the positions of the
+    # flares attributed to it each rotated back to that time, and the peaks
+    # of its first and last flares.
+    flares = df[df['NOAA_AR'] == noaa_ar]
+
+    if flares.empty:
+        raise KeyError(f"No flares attributed to AR {noaa_ar}")
+
+    peaks = flares['FLARE_PEAK'].to_numpy(dtype='datetime64[ns]')
+    lat, lon = arcsec_to_heliographic(*flare_positions(flares), peaks)
+    reference = pd.Timestamp(peaks.min())
+    days = (peaks - reference.to_datetime64()) / np.timedelta64(1, 'D')
+
+    lat_ref = np.nanmedian(lat)
+    lon_ref = np.nanmedian(lon - rotation_rate(lat_ref) * days)
+
+    return float(lat_ref), float(lon_ref), reference, pd.Timestamp(peaks.max())
+
+
+def region_positions(track: tuple, times) -> tuple[np.ndarray, np.ndarray]:
+
+    # x, y in arcsec of a region_track() at times, NaN while the region is
+    # on the far side of the Sun.
+    lat, lon, reference, _ = track
+    times = np.asarray(times, dtype='datetime64[ns]')
+    days = (times - reference.to_datetime64()) / np.timedelta64(1, 'D')
+
+    lon = lon + rotation_rate(lat) * days
+    lon = (lon + 180) % 360 - 180
+
+    x, y = heliographic_to_arcsec(np.full(len(times), lat), lon, times)
+    far_side = np.abs(lon) > 90
+
+    return np.where(far_side, np.nan, x), np.where(far_side, np.nan, y)
+
+
+def near_region(
+            index: FlarePositionIndex,
+            track: tuple,
+            r: float,
+            t0=None,
+            t1=None,
+            margin=REGION_TRACK_MARGIN
+        ) -> np.ndarray:
+
+    # Rows within r arcsec of where the tracked region was at each flare's
+    # peak, while the region was tracked (from margin before its first flare
+    # to margin after its last). The region moves, so the time window is
+    # taken first and the distance worked out per flare.
+    first, last = track[2] - margin, track[3] + margin
+
+    t0 = first if t0 is None else max(pd.Timestamp(t0), first)
+    t1 = last if t1 is None else min(pd.Timestamp(t1), last)
+
+    rows = index.window(t0, t1)
+    x, y = region_positions(track, index.peaks[rows].view('datetime64[ns]'))
+
+    with np.errstate(invalid='ignore'):
+        near = np.hypot(index.x[rows] - x, index.y[rows] - y) <= r
+
+    return rows[near]
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(
+        description="Select flares from a flare list by position on the Sun."
+    )
+    parser.add_argument('flare_list')
+    parser.add_argument('--start')
+    parser.add_argument('--end')
+    parser.add_argument('--classes', default='', help="GOES class letters to keep, e.g. MX.")
+
+    query = parser.add_mutually_exclusive_group(required=True)
+    query.add_argument('--ar', type=int, help="Flares near this NOAA active region.")
+    query.add_argument('--point', type=float, nargs=2, metavar=('X', 'Y'))
+    query.add_argument('--limb', action='store_true')
+    query.add_argument('--disk-centre', action='store_true')
+
+    parser.add_argument('--radius', type=float, default=200, help="arcsec")
+    parser.add_argument('--out')
+    args = parser.parse_args()
+
+    from flare_list_cache import load_flare_list
+
+    flares = load_flare_list(args.flare_list)
+    index = FlarePositionIndex.from_flare_list(flares)
+
+    if args.ar is not None:
+        rows = near_region(index, region_track(flares, args.ar), args.radius, args.start, args.end)
+    elif args.point is not None:
+        rows = index.radius(*args.point, args.radius, args.start, args.end)
+    elif args.limb:
+        rows = index.limb(args.start, args.end)
+    else:
+        rows = index.disk_centre(args.start, args.end)
+
+    selected = flares.iloc[rows]
+
+    if args.classes:
+        letters = selected['CLASS'].astype(str).str[:1].str.upper()
+        selected = selected[letters.isin(list(args.classes.upper()))]
+
+    print(selected.to_string())
+
+    if args.out:
+        selected.to_csv(args.out, index=False)
@@ -0,0 +1,176 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+
+from flare_list_cache import _source_signature, load_flare_list
+
+
+NAT = np.iinfo(np.int64).min
+
+
+def _ns(times) -> np.ndarray:
+
+    # int64 ns of any array of times pandas can parse, NaT as NAT.
+    times = pd.to_datetime(pd.Series(np.atleast_1d(np.asarray(times, dtype=object))))
+
+    return times.to_numpy(dtype='datetime64[ns]').view(np.int64)
+
+
+class FlareTimeIndex:
+
+    # Index of a flare list by FLARE_PEAK: the peaks as a sorted int64 ns
+    # array and, alongside, the table row each came from. Flares without a
+    # peak are left out.
+    #
+    # The index is kept next to the CSV as <filename>.peaks.npy, a (2, n)
+    # int64 array of (peak, row), with the source's signature in
+    # <filename>.peaks.json, and is rebuilt when the CSV changes. It is
+    # memory mapped when opened, so every lookup is a searchsorted over the
+    # peaks, O(log n) per key, without touching the table. Rows are only
+    # read, from the flare list cache, when a lookup asks for them.
+
+    def __init__(self, peaks: np.ndarray, positions: np.ndarray, filename: str | None = None):
+
+        self.peaks = peaks
+        self.positions = positions
+        self.filename = filename
+        self._table = None
+
+    def __len__(self) -> int:
+
+        return len(self.peaks)
+
+    @classmethod
+    def from_flare_list(cls, df: DataFrame, filename: str | None = None) -> 'FlareTimeIndex':
+
+        peaks = df['FLARE_PEAK'].to_numpy(dtype='datetime64[ns]').view(np.int64)
+
+        rows = np.flatnonzero(peaks != NAT)
+        rows = rows[np.argsort(peaks[rows], kind='stable')]
+
+        index = cls(peaks[rows], rows.astype(np.int64), filename)
+        index._table = df
+
+        return index
+
+    @classmethod
+    def open(cls, filename: str, use_cache=True) -> 'FlareTimeIndex':
+
+        # Index of the flare list CSV filename, from its sidecar when that is
+        # still current.
+        path = f"{filename}.peaks.npy"
+        meta_path = f"{filename}.peaks.json"
+
+        signature = _source_signature(filename)
+
+        if use_cache and os.path.exists(path) and os.path.exists(meta_path):
+
+            with open(meta_path) as f:
+                meta = json.load(f)
+
+            if meta == signature:
+                arrays = np.load(path, mmap_mode='r')
+                return cls(arrays[0], arrays[1], filename)
+
+        index = cls.from_flare_list(load_flare_list(filename, use_cache), filename)
+
+        if use_cache:
+
+            tmp = f"{path}.tmp{os.getpid()}.npy"
+            np.save(tmp, np.stack([index.peaks, index.positions]))
+            os.replace(tmp, path)
+
+            # The signature is written last, so a half built index is never
+            # taken as current.
+            tmp = f"{meta_path}.tmp{os.getpid()}"
+            with open(tmp, 'w') as f:
+                json.dump(signature, f)
+            os.replace(tmp, meta_path)
+
+        return index
+
+    @property
+    def table(self) -> DataFrame:
+
+        if self._table is None:
+            self._table = load_flare_list(self.filename)
+
+        return self._table
+
+    def lookup(self, times) -> tuple[np.ndarray, np.ndarray]:
+
+        # Flares peaking exactly at each of times. Returns (keys, rows):
+        # positions into times and the matching table rows, one pair per
+        # match, in key order and table order within a key.
+        keys = _ns(times)
+
+        lo = np.searchsorted(self.peaks, keys, side='left')
+        hi = np.searchsorted(self.peaks, keys, side='right')
+        hi[keys == NAT] = lo[keys == NAT]
+
+        counts = hi - lo
+        key_idx = np.repeat(np.arange(len(keys)), counts)
+
+        # Position of each match within its key's run of equal peaks.
+        within = np.arange(len(key_idx)) - np.repeat(np.cumsum(counts) - counts, counts)
+
+        return key_idx, np.asarray(self.positions[lo[key_idx] + within])
+
+    def nearest(self, times, tolerance=None) -> np.ndarray:
+
+        # Table row of the flare with the closest peak to each of times, -1
+        # where there is none within tolerance. Ties go to the earlier peak.
+        keys = _ns(times)
+        out = np.full(len(keys), -1, dtype=np.int64)
+
+        if len(self.peaks) == 0:
+            return out
+
+        right = np.searchsorted(self.peaks, keys, side='left')
+        left = np.clip(right - 1, 0, len(self.peaks) - 1)
+        right = np.clip(right, 0, len(self.peaks) - 1)
+
+        d_left = np.abs(keys - self.peaks[left])
+        d_right = np.abs(self.peaks[right] - keys)
+
+        best = np.where(d_right < d_left, right, left)
+        distance = np.minimum(d_left, d_right)
+
+        valid = keys != NAT
+        if tolerance is not None:
+            valid &= distance <= pd.Timedelta(tolerance).value
+
+        out[valid] = self.positions[best[valid]]
+
+        return out
+
+    def between(self, t0, t1) -> np.ndarray:
+
+        # Table rows of flares peaking in [t0, t1], in peak order.
+        t0, t1 = _ns([t0, t1])
+
+        lo = np.searchsorted(self.peaks, t0, side='left')
+        hi = np.searchsorted(self.peaks, t1, side='right')
+
+        return np.asarray(self.positions[lo:max(lo, hi)])
+
+    def rows(self, rows: np.ndarray) -> DataFrame:
+
+        return self.table.iloc[np.asarray(rows)]
+
+    def match(self, times, tolerance=None) -> DataFrame:
+
+        # Flares matching each of times, exactly or, with tolerance, the
+        # nearest within it. The KEY column gives the position in times and
+        # ROW the row in the flare list.
+        if tolerance is None:
+            keys, rows = self.lookup(times)
+        else:
+            rows = self.nearest(times, tolerance)
+            keys = np.flatnonzero(rows >= 0)
+            rows = rows[keys]
+
+        return self.rows(rows).assign(KEY=keys, ROW=rows).reset_index(drop=True)
@@ -0,0 +1,336 @@
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+
+from interval_overlap import (
+    MALFORMED_FRAC,
+    MALFORMED_OBSERVED,
+    WIDEN_NS,
+    _as_ns
+)
+
+
+POINTING_COLUMNS = ['XCEN', 'YCEN', 'FOVX', 'FOVY']
+
+# Columns each imaging instrument has in instr_observed_flare_list.csv.
+FOV_INSTRUMENT_COLUMNS = {
+    'EIS': ['OBSERVED', 'FRAC_OBS', 'FRAC_OBS_RISE', 'FRAC_OBS_FALL'],
+    'XRT': ['OBSERVED', 'RISE_OBSERVED', 'FALL_OBSERVED'],
+    'SOT': ['OBSERVED', 'RISE_OBSERVED', 'FALL_OBSERVED'],
+    'IRIS': ['OBSERVED', 'FRAC_OBS', 'FRAC_OBS_RISE', 'FRAC_OBS_FALL']
+}
+
+# Upper bound on the (flare, pointing) candidate pairs expanded at once.
+MAX_CANDIDATES = 1 << 22
+
+
+def in_fov(flare_x, flare_y, xcen, ycen, fovx, fovy) -> np.ndarray:
+
+    # Vectorised instr_pointing_valid: whether the flare lies within the
+    # rectangle centred on (xcen, ycen) of size fovx by fovy, edges included.
+    # All arguments broadcast against each other.
+    flare_x = np.asarray(flare_x, dtype=np.float64)
+    flare_y = np.asarray(flare_y, dtype=np.float64)
+    half_x = np.asarray(fovx, dtype=np.float64) / 2
+    half_y = np.asarray(fovy, dtype=np.float64) / 2
+
+    return (
+        (xcen - half_x <= flare_x) & (flare_x <= xcen + half_x) &
+        (ycen - half_y <= flare_y) & (flare_y <= ycen + half_y)
+    )
+
+
+def _to_datetime(col: pd.Series) -> pd.Series:
+
+    if pd.api.types.is_datetime64_any_dtype(col):
+        return col
+
+    return pd.to_datetime(col, format='ISO8601')
+
+
+def pointing_windows(pointings: DataFrame) -> DataFrame:
+
+    # Normalises a pointing table (one row per raster or exposure) to
+    # START, END, XCEN, YCEN, FOVX and FOVY, sorted by START. Times are taken
+    # from whichever the catalogue provides:
+    #   DATE_OBS, DATE_END       - EIS rasters (eis_obs_structure)
+    #   STARTTIME, STOPTIME      - IRIS rasters (iris_obs2hcr)
+    #   DATE_OBS, EXPTIME (s)    - XRT / SOT exposures (xrt_cat, sot_cat)
+    # The aia_data/*_pointing_2013.csv tables only hold the pointing, so
+    # they can be drawn but not matched against flares.
+    cols = {col.upper(): col for col in pointings.columns}
+
+    missing = [col for col in POINTING_COLUMNS if col not in cols]
+    if missing:
+        raise ValueError(f"Pointing table missing columns: {missing}")
+
+    if 'START' in cols and 'END' in cols:
+        start, end = pointings[cols['START']], pointings[cols['END']]
+    elif 'DATE_OBS' in cols and 'DATE_END' in cols:
+        start, end = pointings[cols['DATE_OBS']], pointings[cols['DATE_END']]
+    elif 'STARTTIME' in cols and 'STOPTIME' in cols:
+        start, end = pointings[cols['STARTTIME']], pointings[cols['STOPTIME']]
+    elif 'DATE_OBS' in cols and 'EXPTIME' in cols:
+        start = _to_datetime(pointings[cols['DATE_OBS']])
+        end = start + pd.to_timedelta(pointings[cols['EXPTIME']], unit='s')
+    else:
+        raise ValueError(
+            "Pointing table has no observation times, expected START/END, "
+            "DATE_OBS/DATE_END, STARTTIME/STOPTIME or DATE_OBS/EXPTIME"
+        )
+
+    windows = DataFrame({
+        'START': _to_datetime(start),
+        'END': _to_datetime(end),
+        **{col: pointings[cols[col]].astype(np.float64) for col in POINTING_COLUMNS}
+    })
+
+    if windows['START'].is_monotonic_increasing:
+        return windows
+
+    return windows.sort_values('START', kind='stable').reset_index(drop=True)
+
+
+def match_pointings(
+            flare_start,
+            flare_end,
+            flare_x,
+            flare_y,
+            pointings: DataFrame
+        ) -> DataFrame:
+
+    # Matches every flare against every pointing in one pass, returning one
+    # row per (flare, pointing) pair where the pointing's window intersects
+    # [flare_start, flare_end] (touching included) and the flare is within
+    # its field of view. FLARE is the flare's position and POINTING the row
+    # of pointing_windows(pointings); rows are ordered by flare then START,
+    # so each flare's in-FOV observing windows are contiguous.
+    #
+    # With the windows sorted by start, the candidates for a flare are the
+    # windows starting in [flare_start - longest window, flare_end], found by
+    # two searchsorted calls. The candidates are expanded in bounded chunks
+    # and filtered with vectorised end time and rectangle tests.
+    windows = pointing_windows(pointings)
+
+    start = _as_ns(flare_start)
+    end = _as_ns(flare_end)
+    flare_x = np.asarray(flare_x, dtype=np.float64)
+    flare_y = np.asarray(flare_y, dtype=np.float64)
+
+    win_start = _as_ns(windows['START'])
+    win_end = _as_ns(windows['END'])
+    win = {col: windows[col].to_numpy() for col in POINTING_COLUMNS}
+
+    longest = int((win_end - win_start).max()) if len(windows) else 0
+
+    lo = np.searchsorted(win_start, start - longest, side='left')
+    hi = np.searchsorted(win_start, end, side='right')
+    counts = np.maximum(hi - lo, 0)
+
+    flares, pointing = [], []
+
+    # Splits the flares so each chunk expands to at most MAX_CANDIDATES pairs
+    # (a single flare with more candidates gets a chunk of its own).
+    cum = np.cumsum(counts)
+    bounds = np.searchsorted(
+        cum, np.arange(MAX_CANDIDATES, cum[-1] if len(cum) else 0, MAX_CANDIDATES),
+        side='right'
+    )
+    bounds = np.unique(np.concatenate([[0], bounds, [len(counts)]]))
+
+    for c0, c1 in zip(bounds[:-1], bounds[1:]):
+
+        n = counts[c0:c1]
+        flare_idx = np.repeat(np.arange(c0, c1), n)
+        offsets = np.arange(n.sum()) - np.repeat(np.cumsum(n) - n, n)
+        win_idx = lo[flare_idx] + offsets
+
+        keep = (win_end[win_idx] >= start[flare_idx]) & in_fov(
+            flare_x[flare_idx],
+            flare_y[flare_idx],
+            win['XCEN'][win_idx],
+            win['YCEN'][win_idx],
+            win['FOVX'][win_idx],
+            win['FOVY'][win_idx]
+        )
+
+        flares.append(flare_idx[keep])
+        pointing.append(win_idx[keep])
+
+    flares = np.concatenate(flares) if flares else np.zeros(0, dtype=np.intp)
+    pointing = np.concatenate(pointing) if pointing else np.zeros(0, dtype=np.intp)
+
+    return DataFrame({
+        'FLARE': flares,
+        'POINTING': pointing,
+        'WINDOW_START': win_start[pointing].view('datetime64[ns]'),
+        'WINDOW_END': win_end[pointing].view('datetime64[ns]')
+    })
+
+
+def _covered_by_flare(
+            flares: np.ndarray,
+            window_start: np.ndarray,
+            window_end: np.ndarray,
+            a: np.ndarray,
+            b: np.ndarray
+        ) -> np.ndarray:
+
+    # Time within each flare's [a, b] covered by the union of its windows.
+    # Windows are clipped to their flare's interval and sorted by flare then
+    # start. A window adds the part of it beyond the latest end of the
+    # earlier windows of the same flare.
+    n_flares = len(a)
+
+    if len(flares) == 0:
+        return np.zeros(n_flares, dtype=np.int64)
+
+    duration = np.maximum(b - a, 0)
+
+    rel_start = np.clip(window_start - a[flares], 0, duration[flares])
+    rel_end = np.clip(window_end - a[flares], 0, duration[flares])
+
+    order = np.lexsort((rel_start, flares))
+    flares = flares[order]
+    rel_start = rel_start[order]
+    rel_end = rel_end[order]
+
+    # Running maximum of the end within each flare. Ends are replaced by
+    # their rank in (flare, end) order, so every rank of a flare is above
+    # those of the flares before it and one maximum.accumulate restarts at
+    # each flare.
+    end_order = np.lexsort((rel_end, flares))
+    end_rank = np.empty(len(end_order), dtype=np.intp)
+    end_rank[end_order] = np.arange(len(end_order))
+    max_end = rel_end[end_order][np.maximum.accumulate(end_rank)]
+
+    first = np.ones(len(flares), dtype=bool)
+    first[1:] = flares[1:] != flares[:-1]
+    prev_end = np.where(first, 0, np.roll(max_end, 1))
+
+    added = np.maximum(rel_end - np.maximum(rel_start, prev_end), 0)
+
+    return np.bincount(flares, weights=added, minlength=n_flares).astype(np.int64)
+
+
+def fov_observed_fractions(
+            flare_start,
+            flare_peak,
+            flare_end,
+            flare_x,
+            flare_y,
+            pointings: DataFrame,
+            prefix: str = ''
+        ) -> DataFrame:
+
+    # Batch equivalent of the pointing based *_observed_stats routines (EIS,
+    # XRT, SOT, IRIS): observing windows only count for a flare when it lies
+    # within the field of view. Returns {prefix}OBSERVED,
+    # {prefix}RISE_OBSERVED, {prefix}FALL_OBSERVED and the {prefix}FRAC_OBS*
+    # columns, with the malformed flare handling of observed_fractions.
+    # Flares without a position (NaN) are coded as malformed, as the IDL
+    # routines do for an undefined location.
+    start = _as_ns(flare_start)
+    peak = _as_ns(flare_peak)
+    end = _as_ns(flare_end)
+    flare_x = np.asarray(flare_x, dtype=np.float64)
+    flare_y = np.asarray(flare_y, dtype=np.float64)
+
+    malformed = (
+        (start > peak) | (peak > end) | np.isnan(flare_x) | np.isnan(flare_y)
+    )
+
+    start = np.where(start == peak, start - WIDEN_NS, start)
+    end = np.where(end == peak, end + WIDEN_NS, end)
+
+    pairs = match_pointings(start, end, flare_x, flare_y, pointings)
+
+    flares = pairs['FLARE'].to_numpy()
+    window_start = _as_ns(pairs['WINDOW_START'])
+    window_end = _as_ns(pairs['WINDOW_END'])
+
+    def phase(a, b):
+
+        touches = (window_start <= b[flares]) & (window_end >= a[flares])
+        observed = np.bincount(flares[touches], minlength=len(a)) > 0
+
+        covered = _covered_by_flare(
+            flares[touches], window_start[touches], window_end[touches], a, b
+        )
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            frac = np.where(observed, covered / (b - a), 0.0)
+
+        observed = np.where(malformed, MALFORMED_OBSERVED, observed)
+        frac = np.where(malformed, MALFORMED_FRAC, frac)
+
+        return observed.astype(np.uint8), frac.astype(np.float32)
+
+    observed, frac_obs = phase(start, end)
+    rise_observed, frac_obs_rise = phase(start, peak)
+    fall_observed, frac_obs_fall = phase(peak, end)
+
+    return DataFrame(
+        {
+            f"{prefix}OBSERVED": observed,
+            f"{prefix}RISE_OBSERVED": rise_observed,
+            f"{prefix}FALL_OBSERVED": fall_observed,
+            f"{prefix}FRAC_OBS": frac_obs,
+            f"{prefix}FRAC_OBS_RISE": frac_obs_rise,
+            f"{prefix}FRAC_OBS_FALL": frac_obs_fall
+        },
+        index=getattr(flare_start, 'index', None)
+    )
+
+
+def fov_observed_for_flares(
+            flares: DataFrame,
+            pointings: DataFrame,
+            instr: str
+        ) -> DataFrame:
+
+    # fov_observed_fractions for a flare table with FLARE_START, FLARE_PEAK,
+    # FLARE_END, AIA_XCEN and AIA_YCEN columns, keeping only the columns the
+    # instrument has in instr_observed_flare_list.csv.
+    result = fov_observed_fractions(
+        flares['FLARE_START'],
+        flares['FLARE_PEAK'],
+        flares['FLARE_END'],
+        flares['AIA_XCEN'],
+        flares['AIA_YCEN'],
+        pointings,
+        prefix=f"{instr}_"
+    )
+
+    return result[[f"{instr}_{col}" for col in FOV_INSTRUMENT_COLUMNS[instr]]]
+
+
+def fov_windows_by_flare(
+            flares: DataFrame,
+            pointings: dict[str, DataFrame]
+        ) -> dict[str, list[np.ndarray]]:
+
+    # Per flare lists of in-FOV observing windows for each imaging
+    # instrument: {instr: [Array[x, 2] of datetime64 start/end per flare]}.
+    windows = {}
+
+    for instr, table in pointings.items():
+
+        pairs = match_pointings(
+            flares['FLARE_START'],
+            flares['FLARE_END'],
+            flares['AIA_XCEN'],
+            flares['AIA_YCEN'],
+            table
+        )
+
+        bounds = np.searchsorted(
+            pairs['FLARE'].to_numpy(), np.arange(len(flares) + 1)
+        )
+        times = pairs[['WINDOW_START', 'WINDOW_END']].to_numpy()
+
+        windows[instr] = [
+            times[b0:b1] for b0, b1 in zip(bounds[:-1], bounds[1:])
+        ]
+
+    return windows
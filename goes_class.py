@@ -0,0 +1,156 @@
+import numpy as np
+import pandas as pd
+
+
+# GOES class letters in ascending order of flux. A flare's rank is the base
+# value of its letter plus its magnitude, e.g. "C3.4" -> 30 + 3.4 = 33.4.
+# Rank 0 is reserved for flares with no class.
+CLASS_LETTERS = np.array(['A', 'B', 'C', 'M', 'X'])
+CLASS_RANK_BASE = np.array([10, 20, 30, 40, 50], dtype=np.float64)
+
+# Lookup table from character code point to letter index (1-5, 0 = invalid).
+_LETTER_INDEX = np.zeros(128, dtype=np.uint8)
+_LETTER_INDEX[[ord(letter) for letter in CLASS_LETTERS]] = np.arange(1, 6)
+
+
+def _class_strings(goes_classes) -> tuple[np.ndarray, np.ndarray]:
+
+    # Returns the non-missing classes as a fixed width unicode array along
+    # with a mask of which input rows they came from.
+    classes = pd.Series(goes_classes, copy=False)
+    # A copy, as the mask is edited below and pandas hands out read-only
+    # views under copy-on-write.
+    valid = classes.notna().to_numpy(copy=True)
+
+    strings = np.asarray(classes[valid], dtype=str)
+    # A trailing "+" marks a saturated (lower bound) class, e.g. "X18+".
+    strings = np.char.rstrip(np.char.strip(strings), '+')
+
+    empty = strings == ''
+    if empty.any():
+        valid[np.flatnonzero(valid)[empty]] = False
+        strings = strings[~empty]
+
+    return strings, valid
+
+
+def _parse_classes(strings: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+
+    # Parses a unicode array of GOES classes into letter indices and float64
+    # magnitudes by viewing the array as a grid of single characters.
+    if len(strings) == 0:
+        return np.zeros(0, dtype=np.uint8), np.zeros(0, dtype=np.float64)
+
+    width = strings.dtype.itemsize // 4
+    chars = strings.view('U1').reshape(len(strings), width)
+
+    codes = chars[:, 0].view(np.uint32)
+    idx = _LETTER_INDEX[np.where(codes < 128, codes, 0)]
+
+    if (idx == 0).any():
+        bad = strings[idx == 0][0]
+        raise ValueError(f"Unrecognised GOES class: {bad!r}")
+
+    if width > 1:
+        numbers = np.ascontiguousarray(chars[:, 1:]).view(f'U{width - 1}')
+        numbers = numbers.ravel().astype(np.float64)
+    else:
+        numbers = np.zeros(len(strings), dtype=np.float64)
+
+    return idx, numbers
+
+
+def goes_class_split(goes_classes) -> tuple[np.ndarray, np.ndarray]:
+
+    # Splits a column of GOES classes into letter indices (uint8, 1=A to 5=X,
+    # 0 for missing classes) and magnitudes (float32, 0 for missing classes).
+    strings, valid = _class_strings(goes_classes)
+    idx, numbers = _parse_classes(strings)
+
+    letter_idx = np.zeros(len(valid), dtype=np.uint8)
+    magnitude = np.zeros(len(valid), dtype=np.float32)
+
+    letter_idx[valid] = idx
+    magnitude[valid] = numbers
+
+    return letter_idx, magnitude
+
+
+def goes_class_letters(goes_classes) -> pd.Categorical:
+
+    # Returns an ordered categorical of class letters (NaN for missing).
+    letter_idx, _ = goes_class_split(goes_classes)
+
+    return pd.Categorical.from_codes(
+        letter_idx.astype(np.int8) - 1,
+        categories=CLASS_LETTERS,
+        ordered=True
+    )
+
+
+def goes_class_rank(goes_classes) -> np.ndarray:
+
+    # Vectorised equivalent of goes_class_ranking_val, missing classes rank 0.
+    strings, valid = _class_strings(goes_classes)
+    idx, numbers = _parse_classes(strings)
+
+    rank = np.zeros(len(valid), dtype=np.float64)
+    rank[valid] = CLASS_RANK_BASE[idx - 1] + numbers
+
+    return rank
+
+
+def goes_class_rank_decode(goes_class_vals) -> np.ndarray:
+
+    # Vectorised equivalent of goes_class_ranking_val_decode. Ranks which sit
+    # exactly on a letter boundary decode to the lower letter (40 -> "C10.0")
+    # as in the scalar version. Ranks <= 10 or NaN decode to None.
+    vals = np.asarray(goes_class_vals, dtype=np.float64)
+
+    out = np.full(vals.shape, None, dtype=object)
+
+    idx = np.searchsorted(CLASS_RANK_BASE, vals, side='left') - 1
+    valid = (idx >= 0) & ~np.isnan(vals)
+
+    if not valid.any():
+        return out
+
+    idx = idx[valid]
+    magnitude = np.round(vals[valid] - CLASS_RANK_BASE[idx], 1)
+
+    out[valid] = np.char.add(
+        CLASS_LETTERS[idx],
+        np.char.mod('%.1f', magnitude)
+    ).astype(object)
+
+    return out
+
+
+def goes_class_from_flux(flux) -> np.ndarray:
+
+    # GOES classes from 1-8 A peak fluxes in W/m^2, e.g. 3.4e-6 -> "C3.4".
+    # Magnitudes are rounded to one decimal place before choosing the letter,
+    # so 9.96e-6 is "M1.0" rather than "C10.0". Fluxes above X10 keep the X
+    # letter ("X17.2") and fluxes below A1 keep the A letter ("A0.5").
+    # Non-positive or NaN fluxes give None.
+    flux = np.asarray(flux, dtype=np.float64)
+
+    out = np.full(flux.shape, None, dtype=object)
+    valid = flux > 0
+
+    if not valid.any():
+        return out
+
+    idx = np.clip(np.floor(np.log10(flux[valid])).astype(int) + 8, 0, len(CLASS_LETTERS) - 1)
+    magnitude = np.round(flux[valid] / 10.0**(idx - 8), 1)
+
+    carry = (magnitude >= 10) & (idx < len(CLASS_LETTERS) - 1)
+    idx = np.where(carry, idx + 1, idx)
+    magnitude = np.where(carry, np.round(magnitude / 10, 1), magnitude)
+
+    out[valid] = np.char.add(
+        CLASS_LETTERS[idx],
+        np.char.mod('%.1f', magnitude)
+    ).astype(object)
+
+    return out
@@ -0,0 +1,404 @@
+import argparse
+from collections import deque
+
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+
+from flare_list_joiner import GEV_TIME_FORMAT
+from goes_class import goes_class_from_flux
+from light_curve_readers import iter_goes_text
+
+
+# NOAA/SWPC event criteria, applied to 1 minute averages of the 1-8 A flux:
+#   start - the first minute of RISE_MINUTES minutes of monotonic increase,
+#           the last at least RISE_RATIO times the first
+#   peak  - the minute of maximum flux
+#   end   - the first minute the flux falls back half way from the peak to
+#           the flux at the start
+# A new rise starting after the peak, before the flare has ended, ends the
+# flare and starts a new one.
+RISE_MINUTES = 4
+RISE_RATIO = 1.4
+
+# Rises starting below this flux (B1) are ignored, as at solar minimum the
+# background sits close to the noise of the long channel.
+MIN_START_FLUX = 1e-7
+
+MINUTE_NS = 60 * 10**9
+
+# The SSW exports of GOES 8-15 give true fluxes, while the NOAA event lists
+# classify the operational fluxes, which were 0.7 times lower. Scale by this
+# to reproduce the catalogue classes for those satellites.
+GOES_OPERATIONAL_SCALE = 0.7
+
+# Columns of the detected flare list, as in the GOES event (GEV) lists, so it
+# can be passed to create_her_goes_list as a third source.
+DETECTED_COLUMNS = ['GSTART', 'GEND', 'GPEAK', 'CLASS', 'LOC', 'NOAA_AR', 'PEAK_FLUX']
+
+
+def _flare_records(start, peak, end, peak_flux) -> DataFrame:
+
+    # GEV formatted flare list from int64 ns minute times (end may be NaT for
+    # a flare still in progress when the data ran out).
+    def fmt(times):
+        return pd.to_datetime(np.asarray(times, dtype=np.int64)).strftime(GEV_TIME_FORMAT)
+
+    peak_flux = np.asarray(peak_flux, dtype=np.float64)
+
+    return DataFrame({
+        'GSTART': fmt(start),
+        'GEND': fmt(end),
+        'GPEAK': fmt(peak),
+        # str even when there are no flares (or no classes), so that lists
+        # from GoesFlareDetector's updates concatenate to the batch dtypes.
+        'CLASS': pd.Series(goes_class_from_flux(peak_flux), dtype=str),
+        'LOC': '',
+        'NOAA_AR': 0,
+        'PEAK_FLUX': peak_flux
+    }, columns=DETECTED_COLUMNS)
+
+
+def minute_averages(times, flux) -> tuple[np.ndarray, np.ndarray]:
+
+    # 1 minute mean fluxes on a regular grid of minute starts (int64 ns),
+    # NaN for minutes without valid samples.
+    times = np.asarray(times, dtype='datetime64[ns]').astype(np.int64)
+    flux = np.asarray(flux, dtype=np.float64)
+
+    valid = ~np.isnan(flux) & (flux > 0)
+    times = times[valid]
+    flux = flux[valid]
+
+    if len(times) == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0)
+
+    minute = times // MINUTE_NS
+    first = minute.min()
+    bins = minute - first
+    n = int(bins.max()) + 1
+
+    count = np.bincount(bins, minlength=n)
+    total = np.bincount(bins, weights=flux, minlength=n)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.where(count > 0, total / np.maximum(count, 1), np.nan)
+
+    return (first + np.arange(n, dtype=np.int64)) * MINUTE_NS, mean
+
+
+def _rise_starts(flux: np.ndarray, rise_minutes: int, rise_ratio: float, min_flux: float) -> np.ndarray:
+
+    # Indices of minutes starting a qualifying rise.
+    n = len(flux) - rise_minutes + 1
+
+    if n <= 0:
+        return np.zeros(0, dtype=np.int64)
+
+    with np.errstate(invalid='ignore'):
+        rising = flux[1:] > flux[:-1]
+
+        ok = np.ones(n, dtype=bool)
+        for k in range(rise_minutes - 1):
+            ok &= rising[k:k + n]
+
+        ok &= flux[rise_minutes - 1:] >= rise_ratio * flux[:n]
+        ok &= flux[:n] >= min_flux
+
+    return np.flatnonzero(ok)
+
+
+def detect_flares(
+            times,
+            flux,
+            rise_minutes: int = RISE_MINUTES,
+            rise_ratio: float = RISE_RATIO,
+            min_flux: float = MIN_START_FLUX
+        ) -> DataFrame:
+
+    # Batch detection over a whole 1-8 A light curve (e.g. for backfilling
+    # years of data). Qualifying rises are found for every minute at once,
+    # and each flare's peak and end come from a running maximum over the
+    # minutes up to its end, so the work is proportional to the data rather
+    # than per sample Python. Gives the same flare list as GoesFlareDetector.
+    minute_times, mean = minute_averages(times, flux)
+    candidates = _rise_starts(mean, rise_minutes, rise_ratio, min_flux)
+    detect_offset = rise_minutes - 1
+
+    starts, peaks, ends, peak_fluxes = [], [], [], []
+    n = len(mean)
+    nat = np.iinfo(np.int64).min
+
+    c = 0
+    while c < len(candidates):
+
+        s = candidates[c]
+        d = s + detect_offset
+        background = mean[s]
+
+        length = 240
+        while True:
+
+            stop = min(d + length, n)
+            seg = mean[d:stop]
+
+            # Later rises detected within the segment, which may interrupt
+            # this flare.
+            following = candidates[c + 1:np.searchsorted(candidates, stop - detect_offset)]
+
+            run_max = np.fmax.accumulate(seg)
+            new_max = np.concatenate([[True], seg[1:] > run_max[:-1]])
+            run_argmax = np.maximum.accumulate(np.where(new_max, np.arange(len(seg)), 0)) + d
+
+            with np.errstate(invalid='ignore'):
+                ended = seg <= background + (run_max - background) / 2
+            ended[0] = False
+            end_k = np.flatnonzero(ended)
+            end = d + end_k[0] if len(end_k) else None
+
+            # A rise starting at c2 is detected at minute c2 + detect_offset
+            # and interrupts if it began after the peak before that minute.
+            in_seg = following
+            detected_at = in_seg + detect_offset
+            interrupts = in_seg > run_argmax[detected_at - 1 - d]
+            interrupt = in_seg[interrupts][0] if interrupts.any() else None
+
+            if interrupt is not None and (end is None or interrupt + detect_offset <= end):
+                j = interrupt + detect_offset
+                peak = run_argmax[j - 1 - d]
+                starts.append(minute_times[s])
+                peaks.append(minute_times[peak])
+                ends.append(minute_times[interrupt])
+                peak_fluxes.append(mean[peak])
+                c = int(np.searchsorted(candidates, interrupt))
+                break
+
+            if end is not None:
+                peak = run_argmax[end - d]
+                starts.append(minute_times[s])
+                peaks.append(minute_times[peak])
+                ends.append(minute_times[end])
+                peak_fluxes.append(mean[peak])
+                c = int(np.searchsorted(candidates, end - detect_offset + 1))
+                break
+
+            if stop == n:
+                peak = run_argmax[-1]
+                starts.append(minute_times[s])
+                peaks.append(minute_times[peak])
+                ends.append(nat)
+                peak_fluxes.append(mean[peak])
+                c = len(candidates)
+                break
+
+            length *= 2
+
+    return _flare_records(starts, peaks, ends, peak_fluxes)
+
+
+class GoesFlareDetector:
+
+    # Online version of detect_flares. Feed 1-8 A samples in time order with
+    # update(), sample by sample or in chunks of any size; each call returns
+    # the flares which ended during it. close() flushes a flare still in
+    # progress, with no end time.
+    #
+    # Memory is constant: the running sum of the current minute, the last
+    # rise_minutes minute averages and the state of the current flare.
+
+    def __init__(
+                self,
+                rise_minutes: int = RISE_MINUTES,
+                rise_ratio: float = RISE_RATIO,
+                min_flux: float = MIN_START_FLUX
+            ):
+
+        self.rise_minutes = rise_minutes
+        self.rise_ratio = rise_ratio
+        self.min_flux = min_flux
+
+        self._minute = None
+        self._sum = 0.0
+        self._count = 0
+
+        # (minute index, flux) of the last consecutive valid minutes.
+        self._window = deque(maxlen=rise_minutes)
+
+        # [start, background, peak minute, peak flux] of the current flare.
+        self._flare = None
+
+        self._done = ([], [], [], [])
+
+    def _emit(self, end: int | None):
+
+        start, _, peak, peak_flux = self._flare
+
+        for out, value in zip(
+                    self._done,
+                    (
+                        start,
+                        peak * MINUTE_NS,
+                        np.iinfo(np.int64).min if end is None else end,
+                        peak_flux
+                    )
+                ):
+            out.append(value)
+
+        self._flare = None
+
+    def _rise(self) -> int | None:
+
+        # Start minute of a qualifying rise ending at the latest minute.
+        window = self._window
+
+        if len(window) < self.rise_minutes:
+            return None
+
+        minutes = [m for m, _ in window]
+        fluxes = [f for _, f in window]
+
+        if minutes[-1] - minutes[0] != self.rise_minutes - 1:
+            return None
+
+        if not all(a < b for a, b in zip(fluxes, fluxes[1:])):
+            return None
+
+        if fluxes[-1] < self.rise_ratio * fluxes[0] or fluxes[0] < self.min_flux:
+            return None
+
+        return minutes[0]
+
+    def _process_minute(self, minute: int, flux: float):
+
+        # One valid 1 minute average (minute index since 1970).
+        self._window.append((minute, flux))
+        rise = self._rise()
+
+        if self._flare is not None:
+
+            if rise is not None and rise > self._flare[2]:
+                self._emit(rise * MINUTE_NS)
+            else:
+                if flux > self._flare[3]:
+                    self._flare[2] = minute
+                    self._flare[3] = flux
+
+                _, background, _, peak_flux = self._flare
+                if flux <= background + (peak_flux - background) / 2:
+                    self._emit(minute * MINUTE_NS)
+
+                return
+
+        if rise is not None:
+            self._flare = [rise * MINUTE_NS, self._window[0][1], minute, flux]
+
+    def _close_minute(self):
+
+        if self._minute is not None and self._count:
+            self._process_minute(self._minute, self._sum / self._count)
+
+        self._sum = 0.0
+        self._count = 0
+
+    def update(self, times, flux) -> DataFrame:
+
+        times = np.asarray(times, dtype='datetime64[ns]').astype(np.int64)
+        flux = np.asarray(flux, dtype=np.float64)
+
+        valid = ~np.isnan(flux) & (flux > 0)
+        minutes = times[valid] // MINUTE_NS
+        flux = flux[valid]
+
+        # Samples are summed a minute at a time.
+        bounds = np.concatenate([
+            [0], np.flatnonzero(minutes[1:] != minutes[:-1]) + 1, [len(minutes)]
+        ])
+
+        for b0, b1 in zip(bounds[:-1], bounds[1:]):
+
+            if b0 == b1:
+                continue
+
+            minute = int(minutes[b0])
+
+            if minute != self._minute:
+                self._close_minute()
+                self._minute = minute
+
+            # Summed in sample order, as np.bincount does in minute_averages,
+            # so both see bit for bit the same minute averages.
+            self._sum = float(np.cumsum(np.concatenate([[self._sum], flux[b0:b1]]))[-1])
+            self._count += b1 - b0
+
+        return self._flush()
+
+    def close(self) -> DataFrame:
+
+        self._close_minute()
+        self._minute = None
+
+        if self._flare is not None:
+            self._emit(None)
+
+        return self._flush()
+
+    def _flush(self) -> DataFrame:
+
+        records = _flare_records(*self._done)
+        self._done = ([], [], [], [])
+
+        return records
+
+
+def detect_flares_in_files(
+            filenames: list[str],
+            channel: str = 'xrsb',
+            scale: float = 1.0
+        ) -> DataFrame:
+
+    # Streams SSW GOES text exports through a GoesFlareDetector a chunk at a
+    # time, so memory does not grow with the number or size of the files.
+    # Files must be given in time order. Fluxes are multiplied by scale
+    # (see GOES_OPERATIONAL_SCALE).
+    detector = GoesFlareDetector()
+    parts = []
+
+    for filename in filenames:
+        for chunk in iter_goes_text(filename):
+            parts.append(detector.update(chunk.index, chunk[channel].to_numpy() * scale))
+
+    parts.append(detector.close())
+
+    return pd.concat(parts, ignore_index=True)
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(
+        description="Detect flares in GOES 1-8 A light curves with the NOAA criteria."
+    )
+    parser.add_argument('files', nargs='+', help="SSW GOES text exports, in time order.")
+    parser.add_argument('--out', default='flare_lists_csv/goes_detected.csv')
+    parser.add_argument(
+        '--operational', action='store_true',
+        help="Scale GOES 8-15 fluxes by 0.7 to match the NOAA event list classes."
+    )
+    parser.add_argument(
+        '--batch', action='store_true',
+        help="Read every file at once and detect in batch mode."
+    )
+    args = parser.parse_args()
+
+    scale = GOES_OPERATIONAL_SCALE if args.operational else 1.0
+
+    if args.batch:
+        light_curve = pd.concat([
+            chunk for filename in args.files for chunk in iter_goes_text(filename)
+        ])
+        flares = detect_flares(light_curve.index, light_curve['xrsb'].to_numpy() * scale)
+    else:
+        flares = detect_flares_in_files(args.files, scale=scale)
+
+    flares.to_csv(args.out, index=False)
+
+    print(f"Detected {len(flares)} flares, written to {args.out}")
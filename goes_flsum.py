@@ -0,0 +1,204 @@
+import argparse
+import glob
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+
+from flare_list_joiner import GEV_TIME_FORMAT
+from goes_class import goes_class_from_flux
+
+
+FLSUM_DIR = 'downloaded_files'
+FLSUM_PATTERN = 'sci_xrsf-l2-flsum_g*_d*_v*.nc'
+
+FLSUM_STATUSES = ['EVENT_START', 'EVENT_PEAK', 'EVENT_END']
+
+# GEV columns (see flare_list_joiner.GEV_COLUMNS) followed by the extra
+# summary fields.
+FLSUM_COLUMNS = ['GSTART', 'GEND', 'GPEAK', 'CLASS', 'LOC', 'NOAA_AR', 'PEAK_FLUX', 'SATELLITE']
+
+
+def _strings(values) -> np.ndarray:
+
+    # netCDF string variables come back either as variable length strings
+    # or as fixed width character arrays, depending on the file version.
+    values = np.ma.filled(values, b'') if np.ma.isMaskedArray(values) else np.asarray(values)
+
+    if values.dtype.kind == 'S' and values.ndim == 2:
+        values = values.view(f"S{values.shape[1]}").ravel()
+
+    if values.dtype.kind == 'S':
+        values = np.char.decode(values, 'ascii')
+
+    return np.char.strip(values.astype(str))
+
+
+def _cf_times(values: np.ndarray, units: str) -> np.ndarray:
+
+    # int64 ns times from a CF "<unit> since <epoch>" time variable (the
+    # summaries use seconds since 2000-01-01 12:00:00).
+    unit, epoch = re.match(r'\s*(\w+)\s+since\s+(.+)', units).groups()
+    scale = pd.Timedelta(1, unit=unit.rstrip('s')).value
+
+    return pd.Timestamp(epoch).value + np.round(np.asarray(values, dtype=np.float64) * scale).astype(np.int64)
+
+
+def read_flsum(filename: str) -> dict:
+
+    # Reads one sci_xrsf-l2-flsum daily file into flat arrays: event times
+    # (int64 ns), status, flare class, 1-8 A flux and flare id, where the
+    # file has them. Only these variables are read.
+    import netCDF4
+
+    with netCDF4.Dataset(filename) as ds:
+
+        variables = ds.variables
+        n = len(variables['time'])
+
+        events = {
+            'time': _cf_times(np.ma.filled(variables['time'][:], np.nan), variables['time'].units),
+            'status': _strings(variables['status'][:]),
+            'flare_class': (
+                _strings(variables['flare_class'][:])
+                if 'flare_class' in variables else np.full(n, '')
+            ),
+            'flux': (
+                np.ma.filled(variables['xrsb_flux'][:].astype(np.float64), np.nan)
+                if 'xrsb_flux' in variables else np.full(n, np.nan)
+            ),
+            'flare_id': (
+                np.ma.filled(variables['flare_id'][:], -1).astype(np.int64)
+                if 'flare_id' in variables else np.full(n, -1, dtype=np.int64)
+            )
+        }
+
+    satellite = re.search(r'_(g\d+)_', os.path.basename(filename))
+    events['satellite'] = np.full(n, satellite.group(1) if satellite else '')
+
+    return events
+
+
+def pair_flare_events(events: dict) -> DataFrame:
+
+    # Pairs EVENT_START, EVENT_PEAK and EVENT_END records into one row per
+    # flare. Records are grouped by satellite and flare_id where the files
+    # have ids; otherwise, in time order, every EVENT_START opens a new flare
+    # which the following records belong to. The first record of each status
+    # in a flare is kept. Flares whose start is not in the data are dropped,
+    # and a flare still in progress at the end has no end time.
+    records = DataFrame(events)
+    records = records[records['status'].isin(FLSUM_STATUSES)]
+    records = records.sort_values(['satellite', 'time'], kind='stable')
+
+    if (records['flare_id'] >= 0).all():
+        flare = records['flare_id']
+    else:
+        # Running count of starts per satellite; records before a
+        # satellite's first start get -1 and are dropped.
+        is_start = records['status'] == 'EVENT_START'
+        flare = is_start.groupby(records['satellite']).cumsum() - 1
+
+    records = records.assign(flare=flare)
+    records = records[records['flare'] >= 0]
+
+    first = records.drop_duplicates(['satellite', 'flare', 'status'], keep='first')
+    flares = first.pivot(index=['satellite', 'flare'], columns='status')
+
+    def column(field, status):
+        if (field, status) in flares.columns:
+            return flares[(field, status)]
+        return pd.Series(np.nan, index=flares.index)
+
+    flares = flares[column('time', 'EVENT_START').notna()]
+
+    def times(status):
+        return column('time', status).astype('float64').fillna(
+            np.iinfo(np.int64).min
+        ).astype(np.int64).to_numpy()
+
+    # The class is set at the peak, or failing that at the end; flares
+    # without one are classified from their peak flux.
+    flare_class = column('flare_class', 'EVENT_PEAK').replace('', np.nan)
+    flare_class = flare_class.fillna(column('flare_class', 'EVENT_END').replace('', np.nan))
+    peak_flux = column('flux', 'EVENT_PEAK').astype(np.float64).to_numpy()
+    flare_class = flare_class.fillna(pd.Series(goes_class_from_flux(peak_flux), index=flares.index))
+
+    def fmt(values):
+        return pd.to_datetime(values).strftime(GEV_TIME_FORMAT)
+
+    result = DataFrame({
+        'GSTART': fmt(times('EVENT_START')),
+        'GEND': fmt(times('EVENT_END')),
+        'GPEAK': fmt(times('EVENT_PEAK')),
+        'CLASS': flare_class.to_numpy(),
+        'LOC': '',
+        'NOAA_AR': 0,
+        'PEAK_FLUX': peak_flux,
+        'SATELLITE': flares.index.get_level_values('satellite')
+    }, columns=FLSUM_COLUMNS)
+
+    return result.iloc[np.argsort(times('EVENT_START'), kind='stable')].reset_index(drop=True)
+
+
+def _concat_events(parts: list[dict]) -> dict:
+
+    return {key: np.concatenate([part[key] for part in parts]) for key in parts[0]}
+
+
+def read_flsum_files(filenames: list[str], workers: int = 1) -> DataFrame:
+
+    # Reads the daily summaries, in parallel with workers processes, and
+    # pairs their events into a GEV formatted flare list which
+    # create_her_goes_list can take in place of (or joined with) a GEV list.
+    # Flares spanning midnight are paired across files.
+    filenames = sorted(filenames)
+
+    if not filenames:
+        return DataFrame(columns=FLSUM_COLUMNS)
+
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            parts = list(executor.map(
+                read_flsum, filenames, chunksize=max(1, len(filenames) // (4 * workers))
+            ))
+    else:
+        parts = [read_flsum(filename) for filename in filenames]
+
+    return pair_flare_events(_concat_events(parts))
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(
+        description="Build a GEV formatted flare list from GOES-R XRS flare summary files."
+    )
+    parser.add_argument(
+        'paths', nargs='*', default=[FLSUM_DIR],
+        help="flsum files or directories of them."
+    )
+    parser.add_argument('--out', default='flare_lists_csv/goes_flsum.csv')
+    parser.add_argument(
+        '--satellite',
+        help="Only keep one satellite's summaries, e.g. g16."
+    )
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    filenames = []
+    for path in args.paths:
+        if os.path.isdir(path):
+            filenames += glob.glob(os.path.join(path, FLSUM_PATTERN))
+        else:
+            filenames.append(path)
+
+    if args.satellite:
+        filenames = [f for f in filenames if f"_{args.satellite}_" in os.path.basename(f)]
+
+    flares = read_flsum_files(filenames, args.workers)
+    flares.to_csv(args.out, index=False)
+
+    print(f"Paired {len(flares)} flares from {len(filenames)} files, written to {args.out}")
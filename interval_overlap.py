@@ -0,0 +1,188 @@
+import numpy as np
+from pandas import DataFrame
+
+
+# Codes used by the *_observed_stats routines for flares with a malformed
+# flare_start -> flare_peak -> flare_end sequence.
+MALFORMED_OBSERVED = 255
+MALFORMED_FRAC = -1.0
+
+# Widening applied when flare_start = flare_peak or flare_peak = flare_end.
+WIDEN_NS = 60 * 10**9
+
+
+def _as_ns(times) -> np.ndarray:
+
+    return np.asarray(times, dtype='datetime64[ns]').astype(np.int64)
+
+
+def merge_intervals(starts, ends) -> tuple[np.ndarray, np.ndarray]:
+
+    # Sorts intervals and merges overlapping or touching ones, returning
+    # disjoint int64 (ns) start and end arrays.
+    starts = _as_ns(starts)
+    ends = _as_ns(ends)
+
+    if len(starts) == 0:
+        return starts, ends
+
+    order = np.argsort(starts, kind='stable')
+    starts = starts[order]
+    ends = ends[order]
+
+    # An interval opens a new block unless it starts before the latest end of
+    # all earlier intervals.
+    max_end = np.maximum.accumulate(ends)
+    new_block = np.ones(len(starts), dtype=bool)
+    new_block[1:] = starts[1:] > max_end[:-1]
+
+    block_start = np.flatnonzero(new_block)
+    block_end = np.append(block_start[1:], len(starts)) - 1
+
+    return starts[block_start], max_end[block_end]
+
+
+class WindowCoverage:
+
+    # Prefix sums of covered time over a set of observing windows, so the
+    # covered time within any interval is two searchsorted lookups.
+
+    def __init__(self, window_start, window_end, disjoint=False):
+
+        # disjoint=True skips the merge for windows already sorted and
+        # disjoint, e.g. int64 arrays from an ObservingWindowStore.
+        if disjoint:
+            self.start = np.asarray(window_start)
+            self.end = np.asarray(window_end)
+        else:
+            self.start, self.end = merge_intervals(window_start, window_end)
+
+        self.cum = np.concatenate(
+            [[0], np.cumsum(self.end - self.start)]
+        )
+
+    def covered_until(self, t: np.ndarray) -> np.ndarray:
+
+        # Total covered time before each time t (int64 ns).
+        if len(self.start) == 0:
+            return np.zeros(len(t), dtype=np.int64)
+
+        idx = np.searchsorted(self.start, t, side='right') - 1
+        inside = idx >= 0
+        idx = np.where(inside, idx, 0)
+
+        partial = np.clip(
+            t - self.start[idx], 0, self.end[idx] - self.start[idx]
+        )
+
+        return np.where(inside, self.cum[idx] + partial, 0)
+
+    def covered(self, a: np.ndarray, b: np.ndarray) -> np.ndarray:
+
+        return self.covered_until(b) - self.covered_until(a)
+
+    def touches(self, a: np.ndarray, b: np.ndarray) -> np.ndarray:
+
+        # Whether [a, b] intersects any window, with closed intervals as in
+        # interval_intersection.pro (touching counts as an intersection).
+        if len(self.start) == 0:
+            return np.zeros(len(a), dtype=bool)
+
+        # The last window starting at or before b has the latest end of all
+        # such windows, as the windows are disjoint and sorted.
+        idx = np.searchsorted(self.start, b, side='right') - 1
+
+        return (idx >= 0) & (self.end[np.maximum(idx, 0)] >= a)
+
+
+def observed_fractions(
+            flare_start,
+            flare_peak,
+            flare_end,
+            window_start,
+            window_end,
+            prefix: str = ''
+        ) -> DataFrame:
+
+    # Batch equivalent of the interval based *_observed_stats routines
+    # (FERMI, MEGS-B, EIS, IRIS) for a whole flare table and one instrument's
+    # observing windows (or a prebuilt WindowCoverage passed as window_start
+    # with window_end=None). Returns the {prefix}OBSERVED, {prefix}FRAC_OBS,
+    # {prefix}FRAC_OBS_RISE and {prefix}FRAC_OBS_FALL columns.
+    #
+    # As in the IDL routines:
+    #   - flare_start is moved 60 s earlier when it equals flare_peak, and
+    #     flare_end 60 s later when it equals flare_peak.
+    #   - Flares where start > peak or peak > end get OBSERVED = 255 and
+    #     fractions of -1.
+    #   - A phase is observed if it intersects a window, touching included,
+    #     and its fraction is the covered time over the phase duration.
+    # Unlike the IDL routines, the widening is applied before the phase
+    # intervals and durations are taken (as rsi_observed_stats does), and
+    # overlapping windows are merged first so overlap is not counted twice.
+    start = _as_ns(flare_start)
+    peak = _as_ns(flare_peak)
+    end = _as_ns(flare_end)
+
+    malformed = (start > peak) | (peak > end)
+
+    start = np.where(start == peak, start - WIDEN_NS, start)
+    end = np.where(end == peak, end + WIDEN_NS, end)
+
+    if isinstance(window_start, WindowCoverage):
+        coverage = window_start
+    else:
+        coverage = WindowCoverage(window_start, window_end)
+
+    covered_until = {
+        'start': coverage.covered_until(start),
+        'peak': coverage.covered_until(peak),
+        'end': coverage.covered_until(end)
+    }
+
+    def fraction(a, b, a_key, b_key):
+
+        observed = coverage.touches(a, b)
+        covered = covered_until[b_key] - covered_until[a_key]
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            frac = np.where(observed, covered / (b - a), 0.0)
+
+        return observed, np.where(malformed, MALFORMED_FRAC, frac)
+
+    observed, frac_obs = fraction(start, end, 'start', 'end')
+    _, frac_obs_rise = fraction(start, peak, 'start', 'peak')
+    _, frac_obs_fall = fraction(peak, end, 'peak', 'end')
+
+    observed = np.where(malformed, MALFORMED_OBSERVED, observed)
+
+    index = getattr(flare_start, 'index', None)
+
+    return DataFrame(
+        {
+            f"{prefix}OBSERVED": observed.astype(np.uint8),
+            f"{prefix}FRAC_OBS": frac_obs.astype(np.float32),
+            f"{prefix}FRAC_OBS_RISE": frac_obs_rise.astype(np.float32),
+            f"{prefix}FRAC_OBS_FALL": frac_obs_fall.astype(np.float32)
+        },
+        index=index
+    )
+
+
+def observed_fractions_for_flares(
+            flares: DataFrame,
+            window_start,
+            window_end,
+            instr: str
+        ) -> DataFrame:
+
+    # observed_fractions for a flare table with FLARE_START, FLARE_PEAK and
+    # FLARE_END columns, named as in instr_observed_flare_list.csv.
+    return observed_fractions(
+        flares['FLARE_START'],
+        flares['FLARE_PEAK'],
+        flares['FLARE_END'],
+        window_start,
+        window_end,
+        prefix=f"{instr}_"
+    )
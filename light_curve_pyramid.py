@@ -0,0 +1,335 @@
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+
+from archive_cache import day_buckets
+from light_curve_store import LIGHT_CURVE_DIR, LightCurveStore
+
+
+# Bin widths of the pyramid levels, each four times the last, from a few
+# GOES samples per bin up to a few bins per day. Bins are anchored at
+# midnight so that each bin is exactly four bins of the level below.
+PYRAMID_BASE_NS = 8 * 10**9
+PYRAMID_LEVELS = 7
+PYRAMID_FACTOR = 4
+
+DAY_NS = 86400 * 10**9
+
+
+def level_width_ns(level: int) -> int:
+
+    return PYRAMID_BASE_NS * PYRAMID_FACTOR**level
+
+
+def level_bins(level: int) -> int:
+
+    return -(-DAY_NS // level_width_ns(level))
+
+
+def _ordered_extremes(values: np.ndarray, valid: np.ndarray) -> np.ndarray:
+
+    # values (channel, bin, k) holds k ordered samples per bin. Returns
+    # (2, channel, bin): the minimum and maximum of each bin, in the order
+    # they occurred, NaN for bins without data.
+    low = np.where(valid, values, np.inf).argmin(axis=2)
+    high = np.where(valid, values, -np.inf).argmax(axis=2)
+
+    first = np.take_along_axis(values, np.minimum(low, high)[..., None], axis=2)[..., 0]
+    second = np.take_along_axis(values, np.maximum(low, high)[..., None], axis=2)[..., 0]
+
+    empty = ~valid.any(axis=2)
+
+    return np.where(empty, np.nan, np.stack([first, second]))
+
+
+def day_envelope(times: np.ndarray, data: np.ndarray, day: pd.Timestamp) -> np.ndarray:
+
+    # Level 0 of a day's pyramid from its raw samples: (2, channel, bin)
+    # min/max envelope in time order.
+    bins = ((times - day.value) // PYRAMID_BASE_NS).astype(np.int64)
+    n_bins = level_bins(0)
+
+    envelope = np.full((2, len(data), n_bins), np.nan)
+
+    for c, values in enumerate(np.asarray(data)):
+
+        valid = ~np.isnan(values)
+        if not valid.any():
+            continue
+
+        idx = np.flatnonzero(valid)
+        b = bins[idx]
+        v = values[idx]
+
+        # Within each bin, the first sample of the sort is the minimum
+        # (maximum), and sorting is stable so ties keep their time order.
+        by_low = np.lexsort((v, b))
+        by_high = np.lexsort((-v, b))
+
+        starts = np.flatnonzero(np.concatenate([[True], b[by_low][1:] != b[by_low][:-1]]))
+        occupied = b[by_low][starts]
+
+        low = idx[by_low[starts]]
+        high = idx[by_high[starts]]
+
+        envelope[0, c, occupied] = values[np.minimum(low, high)]
+        envelope[1, c, occupied] = values[np.maximum(low, high)]
+
+    return envelope
+
+
+def coarsen(envelope: np.ndarray) -> np.ndarray:
+
+    # Next level up: every PYRAMID_FACTOR bins merged into one, keeping the
+    # extremes of their (first, second) values in order.
+    _, n_channels, n_bins = envelope.shape
+    n_coarse = -(-n_bins // PYRAMID_FACTOR)
+
+    padded = np.full((2, n_channels, n_coarse * PYRAMID_FACTOR), np.nan)
+    padded[:, :, :n_bins] = envelope
+
+    # (channel, coarse bin, child, first/second) -> (channel, coarse bin, 2k)
+    values = (
+        padded
+        .reshape(2, n_channels, n_coarse, PYRAMID_FACTOR)
+        .transpose(1, 2, 3, 0)
+        .reshape(n_channels, n_coarse, 2 * PYRAMID_FACTOR)
+    )
+
+    return _ordered_extremes(values, ~np.isnan(values))
+
+
+class LightCurvePyramid:
+
+    # Multi-resolution min/max envelopes over a LightCurveStore, for plotting.
+    # Each stored day gets PYRAMID_LEVELS levels of bins, saved next to the
+    # day's chunks as <root>/<instrument>/pyramid/YYYYMMDD.L<k>.npy, each a
+    # (2, channel, bin) array holding the bin's minimum and maximum in the
+    # order they occurred.
+    #
+    # Levels are built the first time a day is read, and rebuilt whenever the
+    # day's data chunk is newer than its pyramid, so re-ingesting a file
+    # never leaves a stale envelope behind. The data chunk is checked on
+    # every read, so a long lived pyramid also picks up days re-ingested
+    # since it opened them, by this process or another.
+    #
+    # slice() picks the coarsest level with at least one bin per pixel and
+    # returns two points per bin, so a plot draws at most about
+    # 2 * PYRAMID_FACTOR points per pixel column while every spike still
+    # reaches its full height. Ranges too short for the finest level are
+    # read from the store at full cadence.
+
+    def __init__(self, store: LightCurveStore | str = LIGHT_CURVE_DIR):
+
+        self.store = store if isinstance(store, LightCurveStore) else LightCurveStore(store)
+        self._open = {}
+
+        # (st_ino, st_mtime_ns) of each day's data chunk when its levels
+        # were opened.
+        self._opened = {}
+
+    def _path(self, instrument: str, day: pd.Timestamp, level: int) -> str:
+
+        return os.path.join(
+            self.store._dir(instrument), 'pyramid', f"{day.strftime('%Y%m%d')}.L{level}.npy"
+        )
+
+    def _stale(self, instrument: str, day: pd.Timestamp) -> bool:
+
+        top = self._path(instrument, day, PYRAMID_LEVELS - 1)
+
+        if not os.path.exists(top):
+            return True
+
+        data = self.store._chunk(instrument, day, 'data')
+
+        # Equal times count as stale too, as a chunk re-ingested within the
+        # file system's time resolution of the build gets the same stamp.
+        return os.stat(top).st_mtime_ns <= os.stat(data).st_mtime_ns
+
+    def build_day(self, instrument: str, day: pd.Timestamp):
+
+        times, data = self.store._load_day(instrument, day)
+
+        os.makedirs(os.path.dirname(self._path(instrument, day, 0)), exist_ok=True)
+
+        envelope = day_envelope(np.asarray(times), data, day)
+
+        # The top level is written last, as its time stamp marks the day as
+        # built.
+        for level in range(PYRAMID_LEVELS):
+
+            if level:
+                envelope = coarsen(envelope)
+
+            self.store._save(self._path(instrument, day, level), envelope)
+            self._open.pop((instrument, day, level), None)
+
+    def build(self, instrument: str) -> int:
+
+        # Builds (or refreshes) every stale day, returning how many were built.
+        built = 0
+
+        for day in self.store.days(instrument):
+            if self._stale(instrument, day):
+                self.build_day(instrument, day)
+                built += 1
+
+        return built
+
+    def _level(self, instrument: str, day: pd.Timestamp, level: int) -> np.ndarray:
+
+        key = (instrument, day, level)
+
+        # Chunks are replaced rather than written in place, so a re-ingested
+        # day has a new inode even within the same mtime tick.
+        data = os.stat(self.store._chunk(instrument, day, 'data'))
+        signature = (data.st_ino, data.st_mtime_ns)
+
+        if self._opened.get((instrument, day)) != signature:
+
+            for k in range(PYRAMID_LEVELS):
+                self._open.pop((instrument, day, k), None)
+
+            # The store's own memory map of the day may be of the old chunk.
+            self.store._open.pop((instrument, day), None)
+            self._opened[(instrument, day)] = signature
+
+        if key not in self._open:
+
+            if self._stale(instrument, day):
+                self.build_day(instrument, day)
+
+            self._open[key] = np.load(self._path(instrument, day, level), mmap_mode='r')
+
+        return self._open[key]
+
+    def choose_level(self, t0, t1, pixels: int) -> int | None:
+
+        # Coarsest level whose bins are no wider than a pixel, or None when
+        # even the finest level is too coarse and raw samples should be used.
+        per_pixel = (pd.Timestamp(t1) - pd.Timestamp(t0)).value / max(int(pixels), 1)
+
+        levels = [
+            level for level in range(PYRAMID_LEVELS) if level_width_ns(level) <= per_pixel
+        ]
+
+        return levels[-1] if levels else None
+
+    def slice(
+                self,
+                instrument: str,
+                t0,
+                t1,
+                pixels: int = 1000,
+                channels: list[str] | None = None
+            ) -> DataFrame:
+
+        # Decimated light curve over [t0, t1] for a plot pixels wide. Each
+        # bin becomes two samples, at its start and middle, holding the first
+        # and second of its extremes.
+        level = self.choose_level(t0, t1, pixels)
+
+        if level is None:
+            return self.store.slice(instrument, t0, t1, channels)
+
+        stored_channels = self.store.channels(instrument)
+        channels = stored_channels if channels is None else list(channels)
+
+        unknown = [c for c in channels if c not in stored_channels]
+        if unknown:
+            raise KeyError(f"{instrument} has no channels {unknown}")
+
+        rows = [stored_channels.index(c) for c in channels]
+
+        width = level_width_ns(level)
+        t0 = pd.Timestamp(t0)
+        t1 = pd.Timestamp(t1)
+
+        stored_days = set(self.store.meta(instrument)['days'])
+
+        times = []
+        data = []
+
+        for day in day_buckets(t0, t1):
+
+            if day.strftime('%Y%m%d') not in stored_days:
+                continue
+
+            envelope = self._level(instrument, day, level)
+            n_bins = envelope.shape[2]
+
+            # Bins overlapping [t0, t1].
+            lo = max((t0.value - day.value) // width, 0)
+            hi = min((t1.value - day.value) // width + 1, n_bins)
+
+            if lo >= hi:
+                continue
+
+            part = np.full((2, len(rows), hi - lo), np.nan)
+            for i, row in enumerate(rows):
+                if row < envelope.shape[1]:
+                    part[:, i] = envelope[:, row, lo:hi]
+
+            starts = day.value + np.arange(lo, hi, dtype=np.int64) * width
+
+            times.append(np.stack([starts, starts + width // 2], axis=1).ravel())
+            data.append(part.transpose(2, 0, 1).reshape(-1, len(rows)))
+
+        if times:
+            times = np.concatenate(times)
+            data = np.concatenate(data)
+        else:
+            times = np.zeros(0, dtype=np.int64)
+            data = np.zeros((0, len(rows)))
+
+        # Bins without data in any of the channels are dropped.
+        keep = ~np.isnan(data).all(axis=1)
+
+        return DataFrame(
+            data[keep],
+            index=pd.DatetimeIndex(times[keep].view('datetime64[ns]'), name='time'),
+            columns=channels
+        )
+
+
+def plot_light_curve(
+            ax,
+            pyramid: LightCurvePyramid,
+            instrument: str,
+            t0,
+            t1,
+            channels: list[str] | None = None,
+            **kwargs
+        ) -> list:
+
+    # Plots an instrument's decimated light curve on a matplotlib Axes, with
+    # the level chosen from the Axes' width in pixels.
+    pixels = int(ax.get_window_extent().width) or 1000
+    light_curve = pyramid.slice(instrument, t0, t1, pixels, channels)
+
+    lines = []
+    for channel in light_curve.columns:
+        lines += ax.plot(light_curve.index, light_curve[channel], label=channel, **kwargs)
+
+    ax.set_xlim(pd.Timestamp(t0), pd.Timestamp(t1))
+
+    return lines
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(
+        description="Build the plotting pyramids for light curves in the light curve store."
+    )
+    parser.add_argument('instruments', nargs='*')
+    parser.add_argument('--root', default=LIGHT_CURVE_DIR)
+    args = parser.parse_args()
+
+    pyramid = LightCurvePyramid(args.root)
+
+    for instrument in args.instruments or pyramid.store.instruments():
+        print(f"{instrument}: built {pyramid.build(instrument)} days")
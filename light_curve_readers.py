@@ -0,0 +1,538 @@
+import os
+import re
+
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+
+from pipeline_metrics import staged
+
+
+# Channel names follow the sunpy TimeSeries columns used in the notebooks
+# (xrsa/xrsb, '25 - 50 keV', '25-50 keV', ...).
+GOES_TEXT_CHANNELS = [
+    'xrsb', 'xrsa', 'emission_measure', 'temperature',
+    'xrsb_derivative', 'xrsa_derivative'
+]
+
+EVE_MISSING = -1.0
+
+DAY_NS = 86400 * 10**9
+MINUTE_NS = 60 * 10**9
+
+
+def _as_time_series(times, values: np.ndarray, channels: list[str]) -> DataFrame:
+
+    return DataFrame(
+        values,
+        index=pd.DatetimeIndex(times, name='time'),
+        columns=channels
+    )
+
+
+def _header_length(filename: str, is_data) -> tuple[list[str], int, int]:
+
+    # Header lines, the number of lines before the first data line and the
+    # byte offset of the first data line.
+    header = []
+    offset = 0
+
+    with open(filename, 'rb') as f:
+        for raw in f:
+            line = raw.decode(errors='replace')
+            if is_data(line):
+                break
+            header.append(line)
+            offset += len(raw)
+
+    return header, len(header), offset
+
+
+###################
+# SSW Text Export #
+###################
+
+
+# Rows per chunk when iterating over large exports.
+SSW_CHUNK_ROWS = 1_000_000
+
+
+def _fixed_width_dtype(line: bytes) -> np.dtype:
+
+    # The SSW exports are written with fixed width, right aligned fields, so
+    # a data line's tokens give the field boundaries. Each field runs from
+    # the end of the previous token to the end of its own; the trailing
+    # spaces and newline make up a final padding field.
+    ends = [m.end() for m in re.finditer(rb'\S+', line)]
+    widths = np.diff([0, *ends, len(line)])
+
+    return np.dtype([(f"f{i}", f"S{w}") for i, w in enumerate(widths[:-1])] + [
+        ('pad', f"S{widths[-1]}")
+    ])
+
+
+def _fixed_width_rows(filename: str, offset: int) -> tuple[np.dtype, int] | None:
+
+    # Record dtype and row count of the fixed width body starting at offset,
+    # or None when the rows are not all the same width (e.g. a hand edited
+    # file), in which case the delimited readers are used instead.
+    with open(filename, 'rb') as f:
+        f.seek(offset)
+        first = f.readline()
+
+    if not first.endswith(b'\n'):
+        return None
+
+    dtype = _fixed_width_dtype(first)
+    body = os.path.getsize(filename) - offset
+    n_rows, remainder = divmod(body, dtype.itemsize)
+
+    if remainder:
+        with open(filename, 'rb') as f:
+            f.seek(offset + n_rows * dtype.itemsize)
+            if f.read().strip():
+                return None
+
+    # The last row must end exactly where the first does; the rest are
+    # checked as they are read.
+    if n_rows:
+        with open(filename, 'rb') as f:
+            f.seek(offset + n_rows * dtype.itemsize - 1)
+            if f.read(1) != b'\n':
+                return None
+
+    return dtype, n_rows
+
+
+def _read_chunks(filename: str, offset: int, dtype: np.dtype, n_rows: int, chunksize: int | None):
+
+    # Reads the body as chunks of records with a single bulk read each.
+    chunksize = chunksize or max(n_rows, 1)
+
+    for start in range(0, n_rows, chunksize):
+
+        rows = np.fromfile(
+            filename,
+            dtype=dtype,
+            count=min(chunksize, n_rows - start),
+            offset=offset + start * dtype.itemsize
+        )
+
+        if not (rows.view(np.uint8).reshape(len(rows), -1)[:, -1] == ord('\n')).all():
+            raise ValueError(f"{filename} has rows of differing widths")
+
+        yield rows
+
+
+def _clock_ns(fields: np.ndarray) -> np.ndarray:
+
+    # Time of day in ns from right aligned HH:MM:SS.fff byte strings,
+    # decoded from the digits' byte values instead of parsing strings.
+    width = fields.dtype.itemsize
+    chars = np.ascontiguousarray(fields).view(np.uint8).reshape(-1, width)
+    chars = chars[:, width - 12:].astype(np.int64) - ord('0')
+
+    def number(*cols):
+        value = 0
+        for col in cols:
+            value = value * 10 + chars[:, col]
+        return value
+
+    seconds = number(0, 1) * 3600 + number(3, 4) * 60 + number(6, 7)
+
+    return seconds * 10**9 + number(9, 10, 11) * 10**6
+
+
+def _header_value(header: list[str], label: str) -> str | None:
+
+    line = next((line for line in header if line.startswith(label)), None)
+
+    return None if line is None else line[len(label):].strip()
+
+
+def _goes_header(filename: str) -> tuple[dict, int, int]:
+
+    header, skip, offset = _header_length(
+        filename, lambda line: re.match(r'\s*\d{1,2}-[A-Za-z]{3}-\d{4}\s', line)
+    )
+
+    interval = _header_value(header, 'GOES data for time interval:')
+    t0, t1 = re.split(r'\s+to\s+', interval) if interval else (None, None)
+
+    meta = {
+        'interval': (t0, t1),
+        'archive': _header_value(header, 'GOES archive:'),
+        'data_type': _header_value(header, 'Data Type:')
+    }
+
+    return meta, skip, offset
+
+
+def _goes_frame(rows: np.ndarray, meta: dict) -> DataFrame:
+
+    # The date only changes at midnight, so each run of equal date fields
+    # is parsed once.
+    dates = rows['f0']
+    runs = np.concatenate([[0], np.flatnonzero(dates[1:] != dates[:-1]) + 1])
+    run_days = pd.to_datetime(
+        np.char.strip(dates[runs]).astype(str), format='%d-%b-%Y'
+    ).to_numpy(dtype='datetime64[ns]').astype(np.int64)
+
+    day = np.repeat(run_days, np.diff(np.concatenate([runs, [len(rows)]])))
+    times = (day + _clock_ns(rows['f1'])).view('datetime64[ns]')
+
+    values = np.column_stack([
+        rows[f"f{i + 2}"].astype(np.float64) for i in range(len(GOES_TEXT_CHANNELS))
+    ])
+
+    light_curve = _as_time_series(times, values, GOES_TEXT_CHANNELS)
+    light_curve.attrs['header'] = meta
+
+    return light_curve
+
+
+def _read_goes_delimited(filename: str, skip: int, meta: dict, chunksize: int | None):
+
+    reader = pd.read_csv(
+        filename, sep=r'\s+', skiprows=skip, header=None,
+        names=['date', 'time', *GOES_TEXT_CHANNELS], chunksize=chunksize
+    )
+
+    for rows in ([reader] if chunksize is None else reader):
+
+        times = pd.to_datetime(
+            rows['date'] + ' ' + rows['time'], format='%d-%b-%Y %H:%M:%S.%f'
+        )
+        light_curve = _as_time_series(
+            times, rows[GOES_TEXT_CHANNELS].to_numpy(), GOES_TEXT_CHANNELS
+        )
+        light_curve.attrs['header'] = meta
+
+        yield light_curve
+
+
+def iter_goes_text(filename: str, chunksize: int | None = SSW_CHUNK_ROWS):
+
+    # SSW GOES export ("GOES data for time interval: ..."), one row per
+    # 2 s sample: date, time, 1-8 A, 0.5-4 A, emission measure, temperature
+    # and the two flux derivatives. Yields chunks of at most chunksize rows.
+    #
+    # The samples are not exactly 2 s apart (about 2.047 s), so the times
+    # are decoded from the fixed width time field rather than derived from
+    # the header's interval.
+    meta, skip, offset = _goes_header(filename)
+    layout = _fixed_width_rows(filename, offset)
+
+    if layout is None:
+        yield from _read_goes_delimited(filename, skip, meta, chunksize)
+        return
+
+    for rows in _read_chunks(filename, offset, *layout, chunksize):
+        yield _goes_frame(rows, meta)
+
+
+@staged('readers.goes_text', instrument='GOES')
+def read_goes_text(filename: str) -> DataFrame:
+
+    chunks = list(iter_goes_text(filename, chunksize=None))
+
+    return chunks[0] if chunks else _as_time_series([], np.zeros((0, 6)), GOES_TEXT_CHANNELS)
+
+
+def _rhessi_header(filename: str) -> tuple[dict, list[str], int, int]:
+
+    header, skip, offset = _header_length(
+        filename, lambda line: re.match(r'\d{2}:\d{2}:\d{2}', line)
+    )
+
+    t0, t1 = re.split(r'\s+-\s+', _header_value(header, 'Time Interval:'))
+    delta_t = float(_header_value(header, 'Delta t:').split()[0])
+
+    edges = next(
+        line for line in header if re.match(r'\s+[\d.]+\s+-', line)
+    ).replace('-', ' ').split()
+    channels = [
+        f"{float(lo):g} - {float(hi):g} keV" for lo, hi in zip(edges[:-1], edges[1:])
+    ]
+
+    meta = {
+        'interval': (t0, t1),
+        'delta_t': delta_t,
+        'detectors': _header_value(header, 'Detectors:')
+    }
+
+    return meta, channels, skip, offset
+
+
+def _rhessi_times(clock: np.ndarray, first: int, start: int, cadence: int, previous: int) -> np.ndarray:
+
+    # Sample times of rows first, first + 1, ... as start + row * cadence,
+    # checked against the first and last rows' time of day. If those
+    # disagree (a gap in the export) every row's own time of day is used,
+    # counted from the day of the previous sample and rolling over to the
+    # next day whenever the time of day goes backwards.
+    times = start + (first + np.arange(len(clock), dtype=np.int64)) * cadence
+
+    if len(clock) == 0 or (times[[0, -1]] % DAY_NS == clock[[0, -1]]).all():
+        return times
+
+    day = previous - previous % DAY_NS
+    backwards = np.diff(np.concatenate([[previous % DAY_NS], clock])) < 0
+
+    return day + clock + np.cumsum(backwards) * DAY_NS
+
+
+def iter_rhessi_text(filename: str, chunksize: int | None = SSW_CHUNK_ROWS):
+
+    # SSW "HESSI Observing Summary Count Rates" export, rows of HH:MM:SS.fff
+    # followed by the count rate in each energy band, yielded in chunks of
+    # at most chunksize rows. Times are derived from the "Time Interval:"
+    # start and "Delta t:" cadence in the header.
+    meta, channels, skip, offset = _rhessi_header(filename)
+
+    start = pd.to_datetime(meta['interval'][0], format='%d-%b-%Y %H:%M:%S.%f').value
+    cadence = int(round(meta['delta_t'] * 1e9))
+
+    layout = _fixed_width_rows(filename, offset)
+
+    if layout is None:
+        reader = pd.read_csv(
+            filename, sep=r'\s+', skiprows=skip, header=None,
+            names=['time', *channels], chunksize=chunksize
+        )
+        chunks = (
+            (pd.to_timedelta(rows['time']).to_numpy().astype(np.int64), rows[channels].to_numpy())
+            for rows in ([reader] if chunksize is None else reader)
+        )
+    else:
+        chunks = (
+            (
+                _clock_ns(rows['f0']),
+                np.column_stack([
+                    rows[f"f{i + 1}"].astype(np.float64) for i in range(len(channels))
+                ])
+            )
+            for rows in _read_chunks(filename, offset, *layout, chunksize)
+        )
+
+    first = 0
+    previous = start
+
+    for clock, values in chunks:
+
+        times = _rhessi_times(clock, first, start, cadence, previous)
+
+        first += len(times)
+        previous = times[-1] if len(times) else previous
+
+        light_curve = _as_time_series(times.view('datetime64[ns]'), values, channels)
+        light_curve.attrs['header'] = meta
+
+        yield light_curve
+
+
+@staged('readers.rhessi_text', instrument='RHESSI')
+def read_rhessi_text(filename: str) -> DataFrame:
+
+    meta, channels, _, _ = _rhessi_header(filename)
+    chunks = list(iter_rhessi_text(filename, chunksize=None))
+
+    return chunks[0] if chunks else _as_time_series([], np.zeros((0, len(channels))), channels)
+
+
+def _fermi_times(minutes: np.ndarray) -> np.ndarray:
+
+    # Sample times (int64 ns) from the minute (int64 ns) each sample is
+    # stamped with. The export has no cadence and GBM switches between
+    # 4.096 s and 1.024 s around triggers, so each run of samples sharing a
+    # minute is spread evenly over it: the minute start plus the sample's
+    # position in the run times the run's cadence (60 s over its length).
+    if len(minutes) == 0:
+        return minutes
+
+    starts = np.flatnonzero(np.concatenate([[True], minutes[1:] != minutes[:-1]]))
+    lengths = np.diff(np.append(starts, len(minutes)))
+
+    position = np.arange(len(minutes)) - np.repeat(starts, lengths)
+
+    return minutes + position * MINUTE_NS // np.repeat(lengths, lengths)
+
+
+def iter_fermi_csv(filename: str, chunksize: int | None = SSW_CHUNK_ROWS):
+
+    # Fermi GBM export with a dd/mm/yy HH:MM time column followed by one
+    # column per energy band. The times are minute resolution and repeat
+    # for every sample in the minute, so each distinct time string is parsed
+    # once with an explicit format rather than inferred row by row, and the
+    # samples' own times are derived with _fermi_times. The rows of the last
+    # minute of a chunk are held back until the next, so that no minute is
+    # split between chunks.
+    reader = pd.read_csv(filename, dtype={'time': str}, chunksize=chunksize)
+
+    held = None
+
+    for rows in ([reader] if chunksize is None else reader):
+
+        if held is not None:
+            rows = pd.concat([held, rows], ignore_index=True)
+
+        if len(rows) == 0:
+            continue
+
+        last = rows['time'].to_numpy() == rows['time'].iloc[-1]
+        held = rows[last]
+
+        if last.all():
+            continue
+
+        yield _fermi_chunk(rows[~last])
+
+    if held is not None and len(held):
+        yield _fermi_chunk(held)
+
+
+def _fermi_chunk(rows: DataFrame) -> DataFrame:
+
+    codes, uniques = pd.factorize(rows['time'])
+    minutes = pd.to_datetime(uniques, format='%d/%m/%y %H:%M').to_numpy(dtype='datetime64[ns]')
+
+    times = _fermi_times(minutes.view(np.int64)[codes])
+    channels = [col for col in rows.columns if col != 'time']
+
+    return _as_time_series(
+        times.view('datetime64[ns]'), rows[channels].to_numpy(dtype=np.float64), channels
+    )
+
+
+@staged('readers.fermi_csv', instrument='FERMI')
+def read_fermi_csv(filename: str) -> DataFrame:
+
+    chunks = list(iter_fermi_csv(filename, chunksize=None))
+
+    if not chunks:
+        channels = [col for col in pd.read_csv(filename, nrows=0).columns if col != 'time']
+        return _as_time_series([], np.zeros((0, len(channels))), channels)
+
+    return pd.concat(chunks)
+
+
+@staged('readers.eve_diodes', instrument='EVE')
+def read_eve_diodes(filename: str) -> DataFrame:
+
+    # SDO/EVE Level 0CS 1 minute diode indices (*_EVE_L0CS_DIODES_1m.txt):
+    # a ';' header ending in ;END_OF_HEADER, a "YYYY DOY MO DD" line and
+    # then HHMM rows. Missing data (-1) is returned as NaN.
+    header, skip, _ = _header_length(filename, lambda line: not line.startswith(';'))
+
+    # Channel names from the "Column descriptions:" block, as sunpy's
+    # EVESpWxTimeSeries names them ('XRS-B proxy', '0.1-7ESPquad', ...).
+    described = [line.lstrip(';').strip() for line in header]
+    first = described.index('Column descriptions:') + 2
+    last = described.index('Format:')
+    channels = [line.split(':')[0] for line in described[first:last]]
+
+    with open(filename) as f:
+        for _ in range(skip):
+            next(f)
+        year, _, month, day = next(f).split()
+
+    rows = pd.read_csv(
+        filename, sep=r'\s+', skiprows=skip + 1, header=None,
+        names=['hhmm', *channels], dtype={'hhmm': str}
+    )
+
+    times = (
+        pd.Timestamp(int(year), int(month), int(day)) +
+        pd.to_timedelta(rows['hhmm'].str[:2].astype(int), unit='h') +
+        pd.to_timedelta(rows['hhmm'].str[2:].astype(int), unit='min')
+    )
+    values = rows[channels].to_numpy(dtype=np.float64)
+    values[values == EVE_MISSING] = np.nan
+
+    return _as_time_series(times, values, channels)
+
+
+@staged('readers.xrt_fits', instrument='XRT')
+def read_xrt_fits(filenames: list[str]) -> DataFrame:
+
+    # Hinode/XRT level 1 images reduced to a light curve of total DN/s per
+    # image, one channel per filter wheel combination ("Al_poly/Open"), NaN
+    # where an image used another filter.
+    from astropy.io import fits
+
+    records = []
+
+    for filename in filenames:
+        with fits.open(filename, memmap=True) as hdul:
+            header = hdul[0].header
+            records.append({
+                'time': pd.Timestamp(header['DATE_OBS']),
+                'filter': f"{header['EC_FW1_']}/{header['EC_FW2_']}",
+                'rate': float(np.nansum(hdul[0].data)) / header['EXPTIME']
+            })
+
+    rows = DataFrame(records).pivot_table(
+        index='time', columns='filter', values='rate', aggfunc='mean'
+    )
+
+    return _as_time_series(
+        rows.index, rows.to_numpy(dtype=np.float64), list(rows.columns)
+    )
+
+
+@staged('readers.goes_netcdf', instrument='GOES')
+def read_goes_netcdf(filename: str) -> DataFrame:
+
+    # GOES XRS L2 netCDF (sci_gxrs-l2-irrad_* and sci_xrsf-l2-avg1m_*),
+    # keeping the xrsa/xrsb fluxes and their quality flags. Needs netCDF4 as
+    # the files are HDF5 based.
+    import netCDF4
+
+    with netCDF4.Dataset(filename) as ds:
+
+        time = ds.variables['time']
+        times = netCDF4.num2date(
+            time[:], time.units, only_use_cftime_datetimes=False,
+            only_use_python_datetimes=True
+        )
+
+        channels = [
+            name for name in ('xrsa_flux', 'xrsb_flux', 'xrsa_flag', 'xrsb_flag')
+            if name in ds.variables
+        ]
+        values = np.column_stack([
+            np.ma.filled(ds.variables[name][:].astype(np.float64), np.nan)
+            for name in channels
+        ])
+
+    channels = [name.replace('_flux', '').replace('_flag', '_quality') for name in channels]
+
+    return _as_time_series(pd.to_datetime(times), values, channels)
+
+
+READERS = {
+    'goes_text': read_goes_text,
+    'rhessi_text': read_rhessi_text,
+    'fermi_csv': read_fermi_csv,
+    'eve_diodes': read_eve_diodes,
+    'goes_netcdf': read_goes_netcdf
+}
+
+
+def guess_reader(filename: str):
+
+    # Picks a reader from a light curve file's name.
+    name = filename.rsplit('/', 1)[-1].lower()
+
+    if name.endswith('_goes.txt'):
+        return read_goes_text
+    if name.endswith('_rhessi.txt'):
+        return read_rhessi_text
+    if name.endswith('_fermi.csv'):
+        return read_fermi_csv
+    if 'eve_l0cs_diodes' in name:
+        return read_eve_diodes
+    if name.startswith('sci_') and name.endswith('.nc'):
+        return read_goes_netcdf
+
+    raise ValueError(f"No light curve reader for {filename}")
@@ -0,0 +1,297 @@
+import argparse
+import json
+import os
+
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+
+from archive_cache import day_buckets
+from light_curve_readers import READERS, guess_reader, read_xrt_fits
+
+
+LIGHT_CURVE_DIR = 'light_curves'
+
+
+class LightCurveStore:
+
+    # Directory of light curves ingested once from their original formats,
+    # partitioned into one chunk per instrument per UTC day:
+    #   <root>/<instrument>/meta.json           channels and ingested sources
+    #   <root>/<instrument>/YYYYMMDD.time.npy   int64 ns since 1970, sorted
+    #   <root>/<instrument>/YYYYMMDD.data.npy   float64, (channel, sample)
+    # Data is stored channel major so that a channel's slice of a day is
+    # contiguous. Channels are only ever appended to an instrument, so a
+    # chunk written before a channel was added simply has fewer rows and
+    # the missing channel reads as NaN.
+    #
+    # slice() memory maps only the days it touches, so reading a few hours
+    # out of years of 2 s GOES data reads a few pages of one or two chunks.
+
+    def __init__(self, root: str = LIGHT_CURVE_DIR):
+
+        self.root = root
+        self._meta = {}
+        self._open = {}
+
+    def _dir(self, instrument: str) -> str:
+
+        return os.path.join(self.root, instrument)
+
+    def _chunk(self, instrument: str, day: pd.Timestamp, part: str) -> str:
+
+        return os.path.join(self._dir(instrument), f"{day.strftime('%Y%m%d')}.{part}.npy")
+
+    def instruments(self) -> list[str]:
+
+        if not os.path.isdir(self.root):
+            return []
+
+        return sorted(
+            name for name in os.listdir(self.root)
+            if os.path.exists(os.path.join(self._dir(name), 'meta.json'))
+        )
+
+    def meta(self, instrument: str) -> dict:
+
+        if instrument not in self._meta:
+
+            path = os.path.join(self._dir(instrument), 'meta.json')
+
+            if not os.path.exists(path):
+                raise FileNotFoundError(
+                    f"No light curves stored for {instrument} in {self.root}"
+                )
+
+            with open(path) as f:
+                self._meta[instrument] = json.load(f)
+
+        return self._meta[instrument]
+
+    def channels(self, instrument: str) -> list[str]:
+
+        return self.meta(instrument)['channels']
+
+    def days(self, instrument: str) -> pd.DatetimeIndex:
+
+        return pd.DatetimeIndex(pd.to_datetime(self.meta(instrument)['days'], format='%Y%m%d'))
+
+    def _write_meta(self, instrument: str, meta: dict):
+
+        path = os.path.join(self._dir(instrument), 'meta.json')
+        tmp = f"{path}.tmp{os.getpid()}"
+
+        with open(tmp, 'w') as f:
+            json.dump(meta, f, indent=4)
+
+        os.replace(tmp, path)
+        self._meta[instrument] = meta
+
+    def _save(self, path: str, array: np.ndarray):
+
+        tmp = f"{path}.tmp{os.getpid()}.npy"
+        np.save(tmp, array)
+        os.replace(tmp, path)
+
+    def _load_day(self, instrument: str, day: pd.Timestamp) -> tuple[np.ndarray, np.ndarray] | None:
+
+        key = (instrument, day)
+
+        if key not in self._open:
+
+            time_path = self._chunk(instrument, day, 'time')
+
+            if not os.path.exists(time_path):
+                return None
+
+            self._open[key] = (
+                np.load(time_path, mmap_mode='r'),
+                np.load(self._chunk(instrument, day, 'data'), mmap_mode='r')
+            )
+
+        return self._open[key]
+
+    def ingest(
+                self,
+                instrument: str,
+                light_curve: DataFrame,
+                source: str | None = None
+            ) -> int:
+
+        # Adds a time indexed light curve (one column per channel), as
+        # returned by the light_curve_readers. Within each day, the new
+        # samples replace any stored samples inside the span they cover, so
+        # re-ingesting a file is idempotent while files covering other parts
+        # of the day are kept. Returns the number of samples written.
+        directory = self._dir(instrument)
+        os.makedirs(directory, exist_ok=True)
+
+        try:
+            meta = dict(self.meta(instrument))
+        except FileNotFoundError:
+            meta = {'instrument': instrument, 'channels': [], 'days': [], 'sources': []}
+
+        channels = meta['channels'] + [
+            str(col) for col in light_curve.columns if str(col) not in meta['channels']
+        ]
+        columns = [channels.index(str(col)) for col in light_curve.columns]
+
+        light_curve = light_curve.sort_index(kind='stable')
+        times = light_curve.index.to_numpy(dtype='datetime64[ns]').astype(np.int64)
+        values = light_curve.to_numpy(dtype=np.float64).T
+
+        day_index = light_curve.index.floor('D')
+        bounds = np.flatnonzero(day_index[1:] != day_index[:-1]) + 1
+        bounds = np.concatenate([[0], bounds, [len(times)]]).astype(int)
+
+        days = set(meta['days'])
+
+        for b0, b1 in zip(bounds[:-1], bounds[1:]):
+
+            if b0 == b1:
+                continue
+
+            day = day_index[b0]
+            new_times = times[b0:b1]
+
+            new_data = np.full((len(channels), b1 - b0), np.nan)
+            new_data[columns] = values[:, b0:b1]
+
+            stored = self._load_day(instrument, day)
+
+            if stored is not None:
+
+                old_times, old_data = stored
+                keep = (old_times < new_times[0]) | (old_times > new_times[-1])
+
+                old_part = np.full((len(channels), int(keep.sum())), np.nan)
+                old_part[:len(old_data)] = old_data[:, keep]
+
+                merged_times = np.concatenate([np.asarray(old_times)[keep], new_times])
+                merged_data = np.concatenate([old_part, new_data], axis=1)
+
+                order = np.argsort(merged_times, kind='stable')
+                new_times = merged_times[order]
+                new_data = merged_data[:, order]
+
+                self._open.pop((instrument, day), None)
+
+            self._save(self._chunk(instrument, day, 'data'), new_data)
+            self._save(self._chunk(instrument, day, 'time'), new_times)
+
+            days.add(day.strftime('%Y%m%d'))
+
+        meta['channels'] = channels
+        meta['days'] = sorted(days)
+        if source is not None and source not in meta['sources']:
+            meta['sources'] = meta['sources'] + [source]
+
+        self._write_meta(instrument, meta)
+
+        return len(times)
+
+    def ingest_file(
+                self,
+                instrument: str,
+                filename: str,
+                format: str | None = None
+            ) -> int:
+
+        # Reads a light curve file with the named (or guessed) reader and
+        # ingests it.
+        reader = READERS[format] if format else guess_reader(filename)
+
+        return self.ingest(instrument, reader(filename), source=filename)
+
+    def slice(
+                self,
+                instrument: str,
+                t0,
+                t1,
+                channels: list[str] | None = None
+            ) -> DataFrame:
+
+        # Samples in [t0, t1] for the given channels (all by default), read
+        # from the memory mapped chunks of the days the range touches.
+        stored_channels = self.channels(instrument)
+        channels = stored_channels if channels is None else list(channels)
+
+        unknown = [c for c in channels if c not in stored_channels]
+        if unknown:
+            raise KeyError(f"{instrument} has no channels {unknown}")
+
+        rows = [stored_channels.index(c) for c in channels]
+
+        t0 = pd.Timestamp(t0)
+        t1 = pd.Timestamp(t1)
+        ns0 = np.int64(t0.value)
+        ns1 = np.int64(t1.value)
+
+        stored_days = set(self.meta(instrument)['days'])
+
+        times = []
+        data = []
+
+        for day in day_buckets(t0, t1):
+
+            if day.strftime('%Y%m%d') not in stored_days:
+                continue
+
+            day_times, day_data = self._load_day(instrument, day)
+
+            lo = np.searchsorted(day_times, ns0, side='left')
+            hi = np.searchsorted(day_times, ns1, side='right')
+
+            if lo == hi:
+                continue
+
+            part = np.full((len(rows), hi - lo), np.nan)
+            for i, row in enumerate(rows):
+                if row < len(day_data):
+                    part[i] = day_data[row, lo:hi]
+
+            times.append(np.asarray(day_times[lo:hi]))
+            data.append(part)
+
+        if times:
+            times = np.concatenate(times)
+            data = np.concatenate(data, axis=1)
+        else:
+            times = np.zeros(0, dtype=np.int64)
+            data = np.zeros((len(rows), 0))
+
+        return DataFrame(
+            data.T,
+            index=pd.DatetimeIndex(times.view('datetime64[ns]'), name='time'),
+            columns=channels
+        )
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(
+        description="Ingest light curve files into the light curve store."
+    )
+    parser.add_argument('instrument')
+    parser.add_argument('files', nargs='+')
+    parser.add_argument(
+        '--format', choices=[*READERS, 'xrt_fits'],
+        help="Reader to use, guessed from the file names by default."
+    )
+    parser.add_argument('--root', default=LIGHT_CURVE_DIR)
+    args = parser.parse_args()
+
+    store = LightCurveStore(args.root)
+
+    if args.format == 'xrt_fits':
+        # XRT images are reduced to one light curve across all the files.
+        n = store.ingest(
+            args.instrument, read_xrt_fits(args.files), source=os.path.dirname(args.files[0])
+        )
+    else:
+        n = sum(store.ingest_file(args.instrument, f, args.format) for f in args.files)
+
+    print(
+        f"Stored {n} samples for {args.instrument} in {args.root} "
+        f"({len(store.days(args.instrument))} days)"
+    )
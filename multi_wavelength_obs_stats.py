@@ -1,26 +1,26 @@
 from datetime import date
+from functools import cached_property
+import argparse
+import os
+
 import pandas as pd
-import matplotlib.pyplot as plt
-import plotly.express as px
-from upsetplot import UpSet
+from pandas import DataFrame
 import numpy as np
 
+from co_observation_index import CoObservationIndex, observation_mask, popcount
+from flare_list_cache import load_flare_list
+from goes_class import goes_class_letters, goes_class_rank
+from pipeline_metrics import stage
 
-# Set font to Times New Roman
-plt.rcParams['font.family'] = 'Times New Roman'
 
 FLARE_LIST_FILENAME = 'instr_observed_flare_list.csv'
 
+INSTR_OBS_RANGE_INFO_FILENAME = (
+    'instrument_info/instrument_observing_range_info.csv'
+)
 
-###################
-# Flare List Prep #
-###################
-
+STATS_OUT_DIR = 'stats_out'
 
-df = pd.read_csv(
-    FLARE_LIST_FILENAME,
-    parse_dates=['FLARE_START', 'FLARE_PEAK', 'FLARE_END']
-)
 '''
 ** COL NAMES **
 
@@ -73,7 +73,7 @@ df = pd.read_csv(
 '''
 
 # 8 instruments
-instrument_names_short = [
+INSTRUMENT_NAMES_SHORT = [
     'RSI',
     'MEGSA',
     'MEGSB',
@@ -84,233 +84,638 @@ instrument_names_short = [
     'FERMI'
 ]
 
-# Removing flares with incorrect flare_start -> flare_peak -> flare_end sequence
-for instr in instrument_names_short:
-    df = df[df[f"{instr}_OBSERVED"] != 255]
-
-# Removing flares with no coordinates (0,0)
+# Instrument names with RSI replaced with RHESSI
+INSTRUMENT_NAMES_FULL = (
+    ['RHESSI' if i == 'RSI' else i for i in INSTRUMENT_NAMES_SHORT]
+)
 
-no_coords = df[
-    (df['AIA_XCEN'] == 0) &
-    (df['AIA_YCEN'] == 0)
+EXPECTED_SUCCESS_RATES = [
+    '50%',
+    '100%',
+    '12.5%',
+    '0.5-6%',
+    '0.5-8%',
+    '25-100%',
+    '0.5-3%',
+    '50%'
 ]
 
-print(f"Number of flares with no coordinates: {len(no_coords)}")
+# For MEGS-A, XRT and SOT, no "{instr_short}_FRAC_OBS_RISE" exists.
+NO_FRAC_OBS_INSTRUMENTS = ('MEGSA', 'XRT', 'SOT')
 
-df = df[
-    (df['AIA_XCEN'] != 0) &
-    (df['AIA_YCEN'] != 0)
-]
+# Time range during the lifetimes of all 8 instruments
+# 17/07/2013 -> 27/05/2014
+COMMON_TIME_RANGE = (pd.Timestamp('2013-07-17'), pd.Timestamp('2014-05-27'))
 
-# Removing stray A-class flares
 
-df = df[
-    ~df['CLASS'].str.contains('A')
-]
+###################
+# Flare List Prep #
+###################
+
 
-# Adding column to count number of observations made by different instruments.
-df['INSTR_OBSERVATIONS'] = df[
-    [f"{instr}_OBSERVED" for instr in instrument_names_short]
-].sum(axis=1)
+def prepare_flare_list(df: DataFrame) -> tuple[DataFrame, int]:
 
-df['CLASS_LETTER'] = df['CLASS'].apply(lambda x: x[0])
+    # Applies the standard filters and derived columns to an instrument
+    # observed flare list. Returns the prepared list and the number of flares
+    # removed for having no coordinates.
 
-# Finding flares observed by all instruments.
-fully_obs = df[df['INSTR_OBSERVATIONS'] == 8].reset_index()
+    # Removing flares with incorrect flare_start -> flare_peak -> flare_end
+    # sequence
+    for instr in INSTRUMENT_NAMES_SHORT:
+        df = df[df[f"{instr}_OBSERVED"] != 255]
 
-fully_obs = fully_obs[
-    [
-        'INDEX',
-        'FLARE_START',
-        'FLARE_PEAK',
-        'FLARE_END',
-        'CLASS'
+    # Removing flares with no coordinates (0,0)
+    no_coords = (df['AIA_XCEN'] == 0) & (df['AIA_YCEN'] == 0)
+    no_coords_count = int(no_coords.sum())
+
+    df = df[
+        (df['AIA_XCEN'] != 0) &
+        (df['AIA_YCEN'] != 0)
     ]
-]
 
-print(fully_obs)
+    # Removing stray A-class flares
+    df = df[
+        ~df['CLASS'].str.contains('A')
+    ].copy()
 
-# Finding flares that occurred during the lifetimes of all instruments
-# 17/07/2013 -> 27/05/2014
+    # Adding columns for the set of instruments observing each flare (one bit
+    # per instrument, in INSTRUMENT_NAMES_SHORT order) and the number of
+    # instruments observing each flare.
+    df['INSTR_MASK'] = observation_mask(df, INSTRUMENT_NAMES_SHORT)
+    df['INSTR_OBSERVATIONS'] = popcount(df['INSTR_MASK'].to_numpy())
 
-all_instr_flares = df[
-    (df['FLARE_START'] > '17/07/2013') &
-    (df['FLARE_END'] < '27/05/2014')
-]
+    df['CLASS_LETTER'] = (
+        goes_class_letters(df['CLASS']).remove_unused_categories()
+    )
+    df['CLASS_RANK'] = goes_class_rank(df['CLASS'])
+
+    df['flare_durations'] = df['FLARE_END'] - df['FLARE_START']
+    df['flare_durations_mins_int'] = (
+        df['flare_durations'] / pd.Timedelta(minutes=1)
+    )
 
-print()
-print(f"Number of flares within all 8 instr's lifetime: {len(all_instr_flares)}")
-print(f"Total number of flares: {len(df)}\n")
+    return df, no_coords_count
 
 
-###################
-# Numerical Stats #
-###################
+def load_instr_obs_range_info(
+            filename: str = INSTR_OBS_RANGE_INFO_FILENAME
+        ) -> DataFrame:
+
+    instr_obs_range_info = pd.read_csv(
+        filename,
+        parse_dates=['range_start', 'range_end'],
+        dayfirst=True,
+        encoding='utf-8-sig'
+    )
 
+    instr_obs_range_info['range_end'] = (
+        instr_obs_range_info['range_end']
+        .fillna(pd.to_datetime(date.today()))
+    )
 
-def goes_class_ranking_val(goes_class: str) -> float:
+    return instr_obs_range_info
 
-    class_rank = {
-        "A": 10,
-        "B": 20,
-        "C": 30,
-        "M": 40,
-        "X": 50
-    }
-    
-    if not isinstance(goes_class, str):
-        return 0
-    
-    letter = goes_class[0]
-    number = goes_class[1:]
 
-    return class_rank[letter] + float(number)
+def merge_observing_windows(
+            instr_obs_range_info: DataFrame,
+            degraded: bool | None = None
+        ) -> DataFrame:
 
-df['CLASS_RANK'] = df['CLASS'].apply(goes_class_ranking_val)
+    # Merges each instrument's overlapping or touching observing ranges into
+    # disjoint windows, sorted by instrument then start. degraded=True or
+    # False keeps only the degraded or non-degraded ranges respectively.
+    ranges = instr_obs_range_info
 
+    if degraded is not None:
+        ranges = ranges[ranges['degraded'] == degraded]
 
-# % flares observed
-flares_observed = len(df[df['INSTR_OBSERVATIONS'] != 0])
-observation_percentage = 100 * (flares_observed / len(df))
-avg_no_sim_obs = round(df['INSTR_OBSERVATIONS'].mean(axis=0), 1)
-# avg_no_sim_obs = round(all_instr_flares['INSTR_OBSERVATIONS'].mean(axis=0), 1)
+    ranges = ranges.sort_values(['instrument', 'range_start'], kind='stable')
 
-print(
-    f"% of flares observed by at least 1 instrument: \
-        {round(observation_percentage, 1)}%"
-)
+    # A range opens a new window unless it starts before the latest end of
+    # the earlier ranges of the same instrument.
+    prev_end = (
+        ranges
+        .groupby('instrument')['range_end']
+        .transform(lambda end: end.cummax().shift())
+    )
+    window_id = (
+        prev_end.isna() | (ranges['range_start'] > prev_end)
+    ).cumsum()
+
+    return (
+        ranges
+        .groupby(window_id)
+        .agg(
+            instrument=('instrument', 'first'),
+            range_start=('range_start', 'min'),
+            range_end=('range_end', 'max')
+        )
+        .reset_index(drop=True)
+    )
 
-print(f"Average number of simultaneous observations: {avg_no_sim_obs}")
 
+def windowed_success(
+            df: DataFrame,
+            instr_obs_range_info: DataFrame,
+            degraded: bool | None = None
+        ) -> DataFrame:
+
+    # Number of flares each instrument could have observed (flares starting
+    # after and ending before the bounds of one of its observing windows) and
+    # how many of those it did observe.
+    #
+    # Every instrument's windows are placed on a single sorted key axis by
+    # offsetting their times by instrument, so one searchsorted resolves the
+    # window of every (flare, instrument) pair. The cost grows with
+    # flares x instruments x log(windows) rather than flares x windows.
+    windows = merge_observing_windows(instr_obs_range_info, degraded)
+
+    n_instr = len(INSTRUMENT_NAMES_FULL)
+    instr_idx = windows['instrument'].map(
+        {name: i for i, name in enumerate(INSTRUMENT_NAMES_FULL)}
+    )
+    windows = windows[instr_idx.notna()]
+    instr_idx = instr_idx[instr_idx.notna()].to_numpy(dtype=np.int64)
 
-failed_rhessi_flare_flag = df[
-    (df['RSI_FLARE_TRIGGERED'] == 0) &
-    (df['RSI_OBSERVED'] == 1)
-]
+    def micros(times):
+        return np.asarray(times, dtype='datetime64[us]').astype(np.int64)
 
-total_rhessi_observed = df[
-    df['RSI_OBSERVED'] == 1
-]
-print(f'No. Failed RHESSI Flare Flags: {len(failed_rhessi_flare_flag)}')
-print(f'No. Flares Observed by RHESSI: {len(total_rhessi_observed)}')
-print(
-    f'% Failed RHESSI Flare Flags: \
-        {round(100 * len(failed_rhessi_flare_flag) / len(total_rhessi_observed), 1)}%'
-)
+    flare_start = micros(df['FLARE_START'])
+    flare_end = micros(df['FLARE_END'])
+    window_start = micros(windows['range_start'])
+    window_end = micros(windows['range_end'])
+
+    base = min(
+        flare_start.min(initial=0),
+        window_start.min(initial=0)
+    )
+    span = max(
+        flare_end.max(initial=0),
+        window_end.max(initial=0)
+    ) - base + 1
+
+    window_keys = instr_idx * span + (window_start - base)
+    order = np.argsort(window_keys, kind='stable')
+    window_keys = window_keys[order]
+    window_end = window_end[order]
+    window_instr = instr_idx[order]
+
+    # Shape (n_instr, n_flares)
+    query_keys = (
+        np.arange(n_instr)[:, None] * span +
+        (flare_start - base)[None, :]
+    )
 
-# This is making a box plot of all flares which RHESSI failed to flag as flares.
-failed_rhessi_flare_flag.boxplot(column='CLASS_RANK', sym ='')
-# df.boxplot(column='CLASS_RANK', sym ='')
+    # Last window starting strictly before each flare start.
+    idx = np.searchsorted(window_keys, query_keys, side='left') - 1
+    valid = idx >= 0
+    idx = np.where(valid, idx, 0)
 
-# df.hist(column='CLASS_RANK', bins=50)
+    observable = (
+        valid &
+        (window_instr[idx] == np.arange(n_instr)[:, None]) &
+        (flare_end[None, :] < window_end[idx])
+    )
 
-plt.ylabel('Class Rank', fontsize=20)
-plt.yticks(fontsize=13)
-plt.grid(axis='x')
-plt.xticks([])
-plt.show()
+    observed = df[
+        [f"{instr}_OBSERVED" for instr in INSTRUMENT_NAMES_SHORT]
+    ].to_numpy().T == 1
 
+    no_observable_flares = observable.sum(axis=1)
+    no_flares_observed = (observable & observed).sum(axis=1)
 
-#####################
-# The Average Flare #
-#####################
+    with np.errstate(divide='ignore', invalid='ignore'):
+        percent_obs = np.round(
+            100 * no_flares_observed / no_observable_flares, 1
+        )
 
+    return DataFrame({
+        'instrument': INSTRUMENT_NAMES_FULL,
+        'n_windows': np.bincount(instr_idx, minlength=n_instr),
+        'observable_flares': no_observable_flares,
+        'observed_flares': no_flares_observed,
+        '%_observed': percent_obs
+    })
 
-df['flare_durations'] = df['FLARE_END'] - df['FLARE_START']
-df['flare_durations_mins_int'] = df['flare_durations'] / pd.Timedelta(minutes=1)
 
-df.boxplot('flare_durations_mins_int', by='CLASS_LETTER', sym ='')
+##############
+# Statistics #
+##############
 
-plt.title('')
-plt.suptitle('')
-plt.xlabel('GOES Class', fontsize=20)
-plt.ylabel('Flare Duration (Minutes)', fontsize=20)
-plt.xticks(fontsize=13)
-plt.yticks(fontsize=13)
-plt.grid(axis='x')
-plt.ylim(bottom=0)
 
-plt.savefig(
-    'stats_out/the_average_flare.png',
-    dpi=300,
-    bbox_inches='tight'
-)
-plt.show()
+class FlareStats:
+
+    # Statistics over a prepared flare list. Every statistic is computed on
+    # first access and cached, and subsets of the list (see where()) are
+    # cached per filter set, so any selection of statistics costs at most one
+    # pass over each subset.
+
+    def __init__(
+                self,
+                df: DataFrame,
+                instr_obs_range_info: DataFrame | None = None,
+                no_coords_count: int = 0
+            ):
+
+        self.df = df
+        self.no_coords_count = no_coords_count
+        self._instr_obs_range_info = instr_obs_range_info
+        self._subsets = {}
+        self._windowed_success = {}
+
+    @classmethod
+    def from_csv(
+                cls,
+                filename: str = FLARE_LIST_FILENAME,
+                instr_obs_range_filename: str = INSTR_OBS_RANGE_INFO_FILENAME
+            ) -> 'FlareStats':
+
+        with stage('stats.load') as load_stage:
+            df = load_flare_list(filename)
+            load_stage.rows = len(df)
+
+        with stage('stats.prepare', rows=len(df)):
+            df, no_coords_count = prepare_flare_list(df)
+
+        return cls(
+            df,
+            load_instr_obs_range_info(instr_obs_range_filename),
+            no_coords_count
+        )
 
-avg_flare_duration = df['flare_durations'].mean()
+    @property
+    def instr_obs_range_info(self) -> DataFrame:
 
-print(f"Average Flare Duration: {avg_flare_duration}")
+        if self._instr_obs_range_info is None:
+            self._instr_obs_range_info = load_instr_obs_range_info()
 
+        return self._instr_obs_range_info
 
-############################################################################
-# Creating a bar chart for number of instruments observing a single flare. #
-############################################################################
+    def where(self, start=None, end=None, classes=None) -> 'FlareStats':
 
-# Entire time range
-instr_obs_pivot = (
-    df
-    .groupby('INSTR_OBSERVATIONS')
-    .size()
-    .reset_index(name='count')
-)
+        # Returns (cached) statistics for the flares starting after start,
+        # ending before end and with CLASS_LETTER in classes.
+        key = (
+            None if start is None else pd.Timestamp(start),
+            None if end is None else pd.Timestamp(end),
+            None if classes is None else tuple(sorted(classes))
+        )
 
-print(instr_obs_pivot)
+        if key not in self._subsets:
 
-# Plot histogram
-ax = instr_obs_pivot['count'].plot(
-    kind='bar', edgecolor='black', color='grey', linewidth=1
-)
+            mask = np.ones(len(self.df), dtype=bool)
 
-for container in ax.containers:
-    ax.bar_label(container, fontsize=13)
+            if key[0] is not None:
+                mask &= (self.df['FLARE_START'] > key[0]).to_numpy()
+            if key[1] is not None:
+                mask &= (self.df['FLARE_END'] < key[1]).to_numpy()
+            if key[2] is not None:
+                mask &= self.df['CLASS_LETTER'].isin(key[2]).to_numpy()
 
-# Customize the plot
-# plt.title('Multi-Instrument Observations', fontsize=16, fontweight='bold')
-plt.xlabel('Number of Instruments Observed', fontsize=20)
-plt.ylabel('Count', fontsize=20)
-plt.xticks(rotation=0, fontsize=13)
-plt.yticks(rotation=0, fontsize=13)
+            self._subsets[key] = FlareStats(
+                self.df[mask],
+                self._instr_obs_range_info
+            )
 
-plt.savefig(
-    'stats_out/multi_instr_obs_bar_chart.png',
-    dpi=300,
-    bbox_inches='tight'
-)
+        return self._subsets[key]
 
-plt.show()
+    def common_time_range(self) -> 'FlareStats':
 
-# Common time range
-instr_obs_pivot = (
-    all_instr_flares
-    .groupby('INSTR_OBSERVATIONS')
-    .size()
-    .reset_index(name='count')
-)
+        return self.where(*COMMON_TIME_RANGE)
 
-print(instr_obs_pivot)
+    @cached_property
+    def _grouped(self) -> DataFrame:
 
-# Plot histogram
-ax = instr_obs_pivot['count'].plot(
-    kind='bar', edgecolor='black', color='grey', linewidth=1
-)
+        # Single grouped aggregation from which the count based statistics
+        # are all derived.
+        df = self.df
+        observed_cols = [f"{instr}_OBSERVED" for instr in INSTRUMENT_NAMES_SHORT]
 
-for container in ax.containers:
-    ax.bar_label(container, fontsize=13)
+        agg_input = df[['CLASS_LETTER', 'INSTR_OBSERVATIONS', *observed_cols]]
+        agg_input = agg_input.assign(
+            n_flares=1,
+            RSI_FAILED_FLAG=(
+                (df['RSI_FLARE_TRIGGERED'] == 0) &
+                (df['RSI_OBSERVED'] == 1)
+            ).astype(np.int64),
+            duration_mins=df['flare_durations_mins_int']
+        )
 
-# Customize the plot
-# plt.title('Multi-Instrument Observations', fontsize=16, fontweight='bold')
-plt.xlabel('Number of Instruments Observed', fontsize=20)
-plt.ylabel('Count', fontsize=20)
-plt.xticks(rotation=0, fontsize=13)
-plt.yticks(rotation=0, fontsize=13)
+        return (
+            agg_input
+            .groupby(['CLASS_LETTER', 'INSTR_OBSERVATIONS'], observed=True)
+            .sum()
+        )
 
-plt.savefig(
-    'stats_out/multi_instr_obs_bar_chart_common_time_range.png',
-    dpi=300,
-    bbox_inches='tight'
-)
+    @property
+    def n_flares(self) -> int:
+
+        return len(self.df)
+
+    @cached_property
+    def observation_counts(self) -> pd.Series:
+
+        # Number of flares observed by each instrument.
+        counts = self._grouped[
+            [f"{instr}_OBSERVED" for instr in INSTRUMENT_NAMES_SHORT]
+        ].sum()
+        counts.index = INSTRUMENT_NAMES_SHORT
+
+        return counts.astype(np.int64)
+
+    @cached_property
+    def instr_obs_histogram(self) -> DataFrame:
+
+        # Number of flares against number of instruments observing them.
+        return (
+            self._grouped['n_flares']
+            .groupby(level='INSTR_OBSERVATIONS')
+            .sum()
+            .reset_index(name='count')
+        )
+
+    @cached_property
+    def class_counts(self) -> pd.Series:
+
+        return self._grouped['n_flares'].groupby(level='CLASS_LETTER').sum()
+
+    @property
+    def percent_observed(self) -> float:
+
+        # % flares observed by at least 1 instrument
+        hist = self.instr_obs_histogram
+        flares_observed = hist.loc[hist['INSTR_OBSERVATIONS'] != 0, 'count'].sum()
+
+        return 100 * (flares_observed / self.n_flares)
+
+    @property
+    def avg_simultaneous_obs(self) -> float:
+
+        hist = self.instr_obs_histogram
+
+        return (
+            (hist['INSTR_OBSERVATIONS'] * hist['count']).sum() /
+            hist['count'].sum()
+        )
+
+    @cached_property
+    def rhessi_flag_counts(self) -> dict:
+
+        failed = int(self._grouped['RSI_FAILED_FLAG'].sum())
+        observed = int(self._grouped['RSI_OBSERVED'].sum())
+
+        return {
+            'failed': failed,
+            'observed': observed,
+            'percent_failed': 100 * failed / observed if observed else np.nan
+        }
+
+    @property
+    def failed_rhessi_flare_flag(self) -> DataFrame:
+
+        # Flares which RHESSI observed but failed to flag as flares.
+        return self.df[
+            (self.df['RSI_FLARE_TRIGGERED'] == 0) &
+            (self.df['RSI_OBSERVED'] == 1)
+        ]
+
+    @cached_property
+    def co_observation(self) -> CoObservationIndex:
+
+        return CoObservationIndex(
+            self.df['INSTR_MASK'].to_numpy(), INSTRUMENT_NAMES_SHORT
+        )
+
+    def co_observed(self, instruments, mode='all') -> DataFrame:
+
+        # Flares observed by all of / any of / exactly the given instruments
+        # (short names), see CoObservationIndex.matching_masks.
+        return self.df.iloc[self.co_observation.rows(instruments, mode)]
+
+    @cached_property
+    def fully_observed(self) -> DataFrame:
+
+        # Flares observed by all instruments.
+        return self.co_observed(INSTRUMENT_NAMES_SHORT).reset_index()[
+            [
+                'INDEX',
+                'FLARE_START',
+                'FLARE_PEAK',
+                'FLARE_END',
+                'CLASS'
+            ]
+        ]
+
+    @cached_property
+    def duration_by_class(self) -> DataFrame:
+
+        return (
+            self.df
+            .groupby('CLASS_LETTER', observed=True)['flare_durations_mins_int']
+            .describe()
+        )
+
+    @property
+    def avg_flare_duration(self) -> pd.Timedelta:
+
+        return self.df['flare_durations'].mean()
+
+    def windowed_success(self, degraded: bool | None = None) -> DataFrame:
+
+        # Cached per degraded variant, see windowed_success().
+        if degraded not in self._windowed_success:
+            self._windowed_success[degraded] = windowed_success(
+                self.df, self.instr_obs_range_info, degraded
+            )
+
+        return self._windowed_success[degraded]
+
+    @cached_property
+    def lifetime_success(self) -> DataFrame:
+
+        # Fraction of the flares within each instrument's observing windows
+        # which the instrument observed, over all windows and separately over
+        # only its non-degraded and only its degraded windows.
+        windows = merge_observing_windows(self.instr_obs_range_info)
+        bounds = windows.groupby('instrument').agg(
+            launch=('range_start', 'min'),
+            end=('range_end', 'max')
+        )
+
+        success = self.windowed_success()
+        nominal = self.windowed_success(degraded=False)
+        degraded = self.windowed_success(degraded=True)
+
+        return DataFrame({
+            'instrument': INSTRUMENT_NAMES_FULL,
+            'launch': bounds['launch'].reindex(INSTRUMENT_NAMES_FULL).to_numpy(),
+            'end': bounds['end'].reindex(INSTRUMENT_NAMES_FULL).to_numpy(),
+            'lifetime_observable_flares': success['observable_flares'],
+            'lifetime_observed_flares': success['observed_flares'],
+            '%_observed_9yr': success['%_observed'],
+            'non_degraded_observable_flares': nominal['observable_flares'],
+            'non_degraded_observed_flares': nominal['observed_flares'],
+            'degraded_observable_flares': degraded['observable_flares'],
+            'degraded_observed_flares': degraded['observed_flares']
+        })
+
+    @cached_property
+    def frac_success(self) -> DataFrame:
+
+        # Success rates over this flare list with two definitions for an
+        # "observed" flare: any fraction observed, and more than half of the
+        # flare observed (the mean of the rise and fall fractions).
+        no_observable_flares = self.n_flares
+        rows = []
+
+        for instr_short, instr_full in zip(
+            INSTRUMENT_NAMES_SHORT, INSTRUMENT_NAMES_FULL
+        ):
+
+            # obs_frac > 0 = observation
+            no_flares_observed_any_frac = self.observation_counts[instr_short]
+
+            # obs_frac > 0.5 = observation
+            if instr_short not in NO_FRAC_OBS_INSTRUMENTS:
+
+                frac_obs = (
+                    self.df[f"{instr_short}_FRAC_OBS_RISE"] +
+                    self.df[f"{instr_short}_FRAC_OBS_FALL"]
+                ) / 2
+
+                no_flares_observed_half_frac = int((frac_obs > 0.5).sum())
+
+            else:
+                # We just use the "{instr_short}_OBSERVED" Boolean.
+                no_flares_observed_half_frac = no_flares_observed_any_frac
+
+            rows.append({
+                'instrument': instr_full,
+                'any_frac': round(
+                    100 * (no_flares_observed_any_frac/no_observable_flares), 1
+                ),
+                'half_frac': round(
+                    100 * (no_flares_observed_half_frac/no_observable_flares), 1
+                )
+            })
+
+        return DataFrame(rows)
+
+    @cached_property
+    def success_rate_table(self) -> DataFrame:
+
+        lifetime = self.lifetime_success
+        common = self.common_time_range().frac_success
+
+        return DataFrame({
+            'instrument': INSTRUMENT_NAMES_FULL,
+            'expected_success_rates': EXPECTED_SUCCESS_RATES,
+            'lifetime_observable_flares': lifetime['lifetime_observable_flares'],
+            'lifetime_observed_flares': lifetime['lifetime_observed_flares'],
+            '%_observed_9yr': lifetime['%_observed_9yr'],
+            '%_observed_any_frac_11mo': common['any_frac'],
+            '%_observed_half_frac_11mo': common['half_frac']
+        })
+
+
+############
+# Plotting #
+############
+
+
+def _finish_plot(plt, filename: str | None, show: bool):
+
+    if filename is not None:
+        plt.savefig(
+            filename,
+            dpi=300,
+            bbox_inches='tight'
+        )
+
+    if show:
+        plt.show()
+    else:
+        plt.close()
+
+
+def plot_rhessi_failed_flags(stats: FlareStats, filename=None, show=False):
+
+    import matplotlib.pyplot as plt
+
+    # This is making a box plot of all flares which RHESSI failed to flag as
+    # flares.
+    stats.failed_rhessi_flare_flag.boxplot(column='CLASS_RANK', sym ='')
+
+    plt.ylabel('Class Rank', fontsize=20)
+    plt.yticks(fontsize=13)
+    plt.grid(axis='x')
+    plt.xticks([])
+
+    _finish_plot(plt, filename, show)
+
+
+def plot_average_flare(stats: FlareStats, filename=None, show=False):
+
+    import matplotlib.pyplot as plt
+
+    stats.df.boxplot('flare_durations_mins_int', by='CLASS_LETTER', sym ='')
+
+    plt.title('')
+    plt.suptitle('')
+    plt.xlabel('GOES Class', fontsize=20)
+    plt.ylabel('Flare Duration (Minutes)', fontsize=20)
+    plt.xticks(fontsize=13)
+    plt.yticks(fontsize=13)
+    plt.grid(axis='x')
+    plt.ylim(bottom=0)
+
+    _finish_plot(plt, filename, show)
+
+
+def plot_instr_obs_bar_chart(stats: FlareStats, filename=None, show=False):
+
+    import matplotlib.pyplot as plt
+
+    # Bar chart for number of instruments observing a single flare.
+    ax = stats.instr_obs_histogram['count'].plot(
+        kind='bar', edgecolor='black', color='grey', linewidth=1
+    )
+
+    for container in ax.containers:
+        ax.bar_label(container, fontsize=13)
+
+    # Customize the plot
+    # plt.title('Multi-Instrument Observations', fontsize=16, fontweight='bold')
+    plt.xlabel('Number of Instruments Observed', fontsize=20)
+    plt.ylabel('Count', fontsize=20)
+    plt.xticks(rotation=0, fontsize=13)
+    plt.yticks(rotation=0, fontsize=13)
+
+    _finish_plot(plt, filename, show)
+
+
+def plot_flare_class_pivot(
+            stats: FlareStats,
+            instr_name: str,
+            filename=None,
+            show=False
+        ):
+
+    import matplotlib.pyplot as plt
 
-plt.show()
+    # Plot histogram
+    stats.class_counts.plot(
+        kind='bar', edgecolor='black', color='grey', linewidth=1
+    )
+
+    # Customize the plot
+    plt.title(f"{instr_name} Observed Flares", fontsize=16, fontweight='bold')
+    plt.xlabel('Flare Class', fontsize=14)
+    plt.ylabel('Count', fontsize=14)
+    plt.xticks(rotation=0)
+    plt.yticks(rotation=0)
+
+    _finish_plot(plt, filename, show)
 
 
 #######################
@@ -318,21 +723,7 @@ plt.show()
 #######################
 
 
-INSTR_OBS_RANGE_INFO_FILENAME = (
-    'instrument_info/instrument_observing_range_info.csv'
-)
-
-# Read the CSV into a DataFrame
-instr_obs_range_info = pd.read_csv(
-    INSTR_OBS_RANGE_INFO_FILENAME,
-    parse_dates=['range_start', 'range_end'],
-    dayfirst=True
-)
-
-instr_obs_range_info['range_end'] = (
-    instr_obs_range_info['range_end']
-    .fillna(pd.to_datetime(date.today()))
-)
+# import plotly.express as px
 
 # fig = px.timeline(instr_obs_range_info.sort_values('range_start'),
 #                   x_start="range_start",
@@ -388,151 +779,6 @@ instr_obs_range_info['range_end'] = (
 # fig.show()
 
 
-########################################
-# Instrument Flare Observation Success #
-########################################
-
-
-# Creating new instrument name list with RSI replaced with RHESSI
-instrument_names_full = (
-    ['RHESSI' if i == 'RSI' else i for i in instrument_names_short]
-)
-
-expected_success_rates = [
-    '50%',
-    '100%',
-    '12.5%',
-    '0.5-6%',
-    '0.5-8%',
-    '25-100%',
-    '0.5-3%',
-    '50%'
-]
-
-success_rate_table = pd.DataFrame(
-    {
-        'instrument': instrument_names_full,
-        'expected_success_rates': expected_success_rates
-    }
-)
-
-instr_names_zip = zip(instrument_names_short, instrument_names_full)
-
-percent_obs_col = []
-lifetime_observable_flares_col = []
-lifetime_observed_flares_col = []
-
-for instr_short, instr_full in instr_names_zip:
-
-    instr_start = instr_obs_range_info[
-        (instr_obs_range_info['instrument'] == instr_full)
-    ]['range_start']
-
-    instr_start = instr_start.min()
-
-    instr_end = instr_obs_range_info[
-        (instr_obs_range_info['instrument'] == instr_full)
-    ]['range_end']
-
-    instr_end = instr_end.max()
-
-    observable_flares_df = df[
-        (df['FLARE_START'] > instr_start) &
-        (df['FLARE_END'] < instr_end)
-    ]
-
-    no_observable_flares = len(observable_flares_df)
-    no_flares_observed = observable_flares_df[f"{instr_short}_OBSERVED"].sum()
-    percent_obs = round(100 * (no_flares_observed/no_observable_flares), 1)
-
-    percent_obs_col.append(percent_obs)
-    lifetime_observable_flares_col.append(no_observable_flares)
-    lifetime_observed_flares_col.append(no_flares_observed)
-
-    print()
-    print(f"Instrument:         {instr_full}")
-    print(f"Launch:             {instr_start}")
-    print(f"End:                {instr_end}")
-    print(f"Observable Flares:  {no_observable_flares}")
-    print(f"Flares Observed:    {no_flares_observed}")
-    print(f"% Observed:         {percent_obs}%")
-
-
-success_rate_table['lifetime_observable_flares'] = lifetime_observable_flares_col
-success_rate_table['lifetime_observed_flares'] = lifetime_observed_flares_col
-success_rate_table['%_observed_9yr'] = percent_obs_col
-
-
-######################################################
-# Instrument Success Rate Over Identical Time Period #
-######################################################
-
-
-# Creating new instrument name list with RSI replaced with RHESSI
-instrument_names_full = (
-    ['RHESSI' if i == 'RSI' else i for i in instrument_names_short]
-)
-
-instr_names_zip = zip(instrument_names_short, instrument_names_full)
-
-print()
-
-percent_obs_any_frac_col = []
-percent_obs_half_frac_col = []
-
-no_observable_flares = len(all_instr_flares)
-
-for instr_short, instr_full in instr_names_zip:
-
-    instr_start = instr_obs_range_info[
-        (instr_obs_range_info['instrument'] == instr_full)
-    ]['range_start']
-
-    instr_start = instr_start.min()
-
-    instr_end = instr_obs_range_info[
-        (instr_obs_range_info['instrument'] == instr_full)
-    ]['range_end']
-
-    instr_end = instr_end.max()
-
-
-    # Two definitions for an "observed" flare (comment out definition not in
-    # use):
-
-    # obs_frac > 0 = observation
-    no_flares_observed_any_frac = all_instr_flares[f"{instr_short}_OBSERVED"].sum()
-
-    # obs_frac > 0.5 = observation
-    if instr_short not in ('MEGSA', 'XRT', 'SOT'):
-
-        frac_obs = (
-            all_instr_flares[f"{instr_short}_FRAC_OBS_RISE"] +
-            all_instr_flares[f"{instr_short}_FRAC_OBS_FALL"]
-        ) / 2
-
-        no_flares_observed_half_frac = len(
-            frac_obs[frac_obs > 0.5]
-        )
-
-    else:
-        # For MEGS-A, XRT and SOT, no "{instr_short}_FRAC_OBS_RISE" exits,
-        # therefore we just use the "{instr_short}_OBSERVED" Boolean.
-        no_flares_observed_half_frac = all_instr_flares[f"{instr_short}_OBSERVED"].sum()
-
-    percent_obs_any_frac = round(100 * (no_flares_observed_any_frac/no_observable_flares), 1)
-    percent_obs_half_frac = round(100 * (no_flares_observed_half_frac/no_observable_flares), 1)
-
-    percent_obs_any_frac_col.append(percent_obs_any_frac)
-    percent_obs_half_frac_col.append(percent_obs_half_frac)
-
-success_rate_table['%_observed_any_frac_11mo'] = percent_obs_any_frac_col
-success_rate_table['%_observed_half_frac_11mo'] = percent_obs_half_frac_col
-
-print(success_rate_table)
-
-success_rate_table.to_csv('stats_out/success_rate_table.csv', index=False)
-
 ##############
 # UpSet Plot #
 ##############
@@ -541,6 +787,8 @@ success_rate_table.to_csv('stats_out/success_rate_table.csv', index=False)
 ## Upset plots for all flares. ##
 
 
+# from upsetplot import UpSet
+
 # upset_plot_df = df[[f"{instr}_OBSERVED" for instr in instrument_names_short]]
 # upset_plot_df.columns = instrument_names_full
 
@@ -632,61 +880,169 @@ success_rate_table.to_csv('stats_out/success_rate_table.csv', index=False)
 # plt.show()
 
 
-######################################
-# Class Distribution of Solar Flares #
-######################################
+################
+# CLI Sections #
+################
 
 
-def flare_class_pivot(single_instr_df, instr_name):
+def section_summary(stats: FlareStats, out_dir: str, show: bool):
 
-    class_pivot = (
-        single_instr_df
-        .groupby('CLASS_LETTER')
-        .size()
-        .reset_index(name='count')
-    )
+    common = stats.common_time_range()
 
+    print(f"Number of flares with no coordinates: {stats.no_coords_count}")
+    print(stats.fully_observed)
     print()
-    print(f"Instrument: {instr_name}")
-    print(class_pivot)
+    print(f"Number of flares within all 8 instr's lifetime: {common.n_flares}")
+    print(f"Total number of flares: {stats.n_flares}\n")
 
-    class_pivot = (
-        single_instr_df
-        .groupby('CLASS_LETTER')
-        .size()
+    print(
+        f"% of flares observed by at least 1 instrument: "
+        f"{round(stats.percent_observed, 1)}%"
+    )
+    print(
+        f"Average number of simultaneous observations: "
+        f"{round(stats.avg_simultaneous_obs, 1)}"
     )
 
-    # Plot histogram
-    class_pivot.plot(
-        kind='bar', edgecolor='black', color='grey', linewidth=1
+    rhessi = stats.rhessi_flag_counts
+    print(f"No. Failed RHESSI Flare Flags: {rhessi['failed']}")
+    print(f"No. Flares Observed by RHESSI: {rhessi['observed']}")
+    print(f"% Failed RHESSI Flare Flags: {round(rhessi['percent_failed'], 1)}%")
+
+    print(f"Average Flare Duration: {stats.avg_flare_duration}")
+    print(stats.duration_by_class)
+
+
+def section_rhessi_flags(stats: FlareStats, out_dir: str, show: bool):
+
+    plot_rhessi_failed_flags(
+        stats,
+        os.path.join(out_dir, 'rhessi_failed_flare_flag_class_rank.png'),
+        show
     )
 
-    # Customize the plot
-    plt.title(f"{instr_name} Observed Flares", fontsize=16, fontweight='bold')
-    plt.xlabel('Flare Class', fontsize=14)
-    plt.ylabel('Count', fontsize=14)
-    plt.xticks(rotation=0)
-    plt.yticks(rotation=0)
 
-    plt.savefig(
-        f"stats_out/{instr_name}_flare_classes.png",
-        dpi=300,
-        bbox_inches='tight'
+def section_average_flare(stats: FlareStats, out_dir: str, show: bool):
+
+    plot_average_flare(
+        stats, os.path.join(out_dir, 'the_average_flare.png'), show
     )
 
-    plt.show()
 
-# Creating new instrument name list with RSI replaced with RHESSI
-instrument_names_full = (
-    ['RHESSI' if i == 'RSI' else i for i in instrument_names_short]
-)
+def section_instr_obs_bar(stats: FlareStats, out_dir: str, show: bool):
+
+    # Entire time range
+    print(stats.instr_obs_histogram)
+    plot_instr_obs_bar_chart(
+        stats, os.path.join(out_dir, 'multi_instr_obs_bar_chart.png'), show
+    )
+
+    # Common time range
+    common = stats.common_time_range()
+    print(common.instr_obs_histogram)
+    plot_instr_obs_bar_chart(
+        common,
+        os.path.join(out_dir, 'multi_instr_obs_bar_chart_common_time_range.png'),
+        show
+    )
+
+
+def section_success_rate(stats: FlareStats, out_dir: str, show: bool):
+
+    for _, row in stats.lifetime_success.iterrows():
+        print()
+        print(f"Instrument:         {row['instrument']}")
+        print(f"Launch:             {row['launch']}")
+        print(f"End:                {row['end']}")
+        print(f"Observable Flares:  {row['lifetime_observable_flares']}")
+        print(f"Flares Observed:    {row['lifetime_observed_flares']}")
+        print(f"% Observed:         {row['%_observed_9yr']}%")
+
+    print()
+    print(stats.success_rate_table)
+
+    stats.success_rate_table.to_csv(
+        os.path.join(out_dir, 'success_rate_table.csv'), index=False
+    )
+
+
+def section_class_distribution(stats: FlareStats, out_dir: str, show: bool):
+
+    # Distribution for all instruments and for individual instruments
+    subsets = [(stats, 'All')] + [
+        (
+            FlareStats(stats.df[stats.df[f"{instr_short}_OBSERVED"] == 1]),
+            instr_full
+        )
+        for instr_short, instr_full in zip(
+            INSTRUMENT_NAMES_SHORT, INSTRUMENT_NAMES_FULL
+        )
+    ]
+
+    for instr_stats, instr_name in subsets:
+
+        print()
+        print(f"Instrument: {instr_name}")
+        print(instr_stats.class_counts.reset_index(name='count'))
+
+        plot_flare_class_pivot(
+            instr_stats,
+            instr_name,
+            os.path.join(out_dir, f"{instr_name}_flare_classes.png"),
+            show
+        )
+
+
+SECTIONS = {
+    'summary': section_summary,
+    'rhessi_flags': section_rhessi_flags,
+    'average_flare': section_average_flare,
+    'instr_obs_bar': section_instr_obs_bar,
+    'success_rate': section_success_rate,
+    'class_distribution': section_class_distribution
+}
+
+DEFAULT_SECTIONS = [
+    'summary',
+    'rhessi_flags',
+    'average_flare',
+    'instr_obs_bar',
+    'success_rate'
+]
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(
+        description="Multi-instrument flare observation statistics."
+    )
+    parser.add_argument(
+        '--sections', nargs='+', choices=list(SECTIONS),
+        default=DEFAULT_SECTIONS,
+        help="Sections to run (default: all but class_distribution)."
+    )
+    parser.add_argument('--flare-list', default=FLARE_LIST_FILENAME)
+    parser.add_argument('--out-dir', default=STATS_OUT_DIR)
+    parser.add_argument(
+        '--show', action='store_true',
+        help="Show figures interactively as well as saving them."
+    )
+    args = parser.parse_args()
+
+    import matplotlib
+
+    if not args.show:
+        matplotlib.use('Agg')
+
+    import matplotlib.pyplot as plt
 
-instr_names_zip = zip(instrument_names_short, instrument_names_full)
+    # Set font to Times New Roman
+    plt.rcParams['font.family'] = 'Times New Roman'
 
-# Distribution for all instruments
-# flare_class_pivot(df, 'All')
+    os.makedirs(args.out_dir, exist_ok=True)
 
-# Distributions for individual instruments
-# for instr_short, instr_full in instr_names_zip:
-#     flare_class_pivot(df[df[f"{instr_short}_OBSERVED"] == 1], instr_full)
+    stats = FlareStats.from_csv(args.flare_list)
 
+    for section in args.sections:
+        with stage(f"stats.{section}", rows=stats.n_flares):
+            SECTIONS[section](stats, args.out_dir, args.show)
@@ -0,0 +1,944 @@
+import argparse
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from functools import lru_cache
+import os
+
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+
+from archive_cache import (
+    ARCHIVE_CACHE_DIR,
+    ARCHIVE_CACHE_MAX_BYTES,
+    ArchiveCache,
+    DirectoryArchive,
+    HttpArchive
+)
+from flare_list_cache import typed_flare_list
+from fov_overlap import (
+    FOV_INSTRUMENT_COLUMNS,
+    POINTING_COLUMNS,
+    fov_observed_for_flares,
+    pointing_windows
+)
+from interval_overlap import (
+    MALFORMED_OBSERVED,
+    WIDEN_NS,
+    _as_ns,
+    observed_fractions_for_flares
+)
+from observing_window_store import OBSERVING_WINDOW_DIR, ObservingWindowStore
+from pipeline_metrics import stage, staged
+from rhessi_obssumm import rsi_observed_stats_for_flares
+
+
+JOINED_FLARE_LIST_FILENAME = (
+    'flare_lists_csv/joined_her_2010-4-10_2019-5-31+gev_2010-04-11_2019-06-01.csv'
+)
+OBS_TABLE_FILENAME = 'instr_observed_flare_list.csv'
+OBS_TABLE_CHECKPOINT_DIR = 'obs_table_checkpoint'
+
+# Tasks submitted to the pool at a time per worker, so that only a few
+# shards of flares and results are held at once.
+TASKS_IN_FLIGHT_PER_WORKER = 2
+
+# Flares written at a time when the table is streamed from a checkpoint.
+WRITE_BLOCK_ROWS = 50_000
+
+# Instruments in the order compile_obs_table appends their columns.
+INSTRUMENTS = ['RSI', 'FERMI', 'EVE', 'EIS', 'XRT', 'SOT', 'IRIS']
+
+INSTRUMENT_COLUMNS = {
+    'RSI': [
+        'RSI_OBSERVED', 'RSI_FLARE_TRIGGERED', 'RSI_FRAC_OBS',
+        'RSI_FRAC_OBS_RISE', 'RSI_FRAC_OBS_FALL'
+    ],
+    'FERMI': [
+        'FERMI_OBSERVED', 'FERMI_FRAC_OBS', 'FERMI_FRAC_OBS_RISE',
+        'FERMI_FRAC_OBS_FALL'
+    ],
+    'EVE': [
+        'MEGSA_OBSERVED', 'MEGSB_OBSERVED', 'MEGSB_FRAC_OBS',
+        'MEGSB_FRAC_OBS_RISE', 'MEGSB_FRAC_OBS_FALL'
+    ],
+    **{
+        instr: [f"{instr}_{col}" for col in cols]
+        for instr, cols in FOV_INSTRUMENT_COLUMNS.items()
+    }
+}
+
+# MEGS-A is assumed to have observed continuously from launch until midnight
+# on 26 May 2014, as in eve_observed_stats.
+MEGSA_LIFETIME = ('2010-04-30', '2014-05-27')
+
+DEFAULT_SOURCES = {
+    # ObservingWindowStore holding RSI (not in SAA or eclipse), RSI_FLARE
+    # (flare flag set), FERMI and MEGSB windows.
+    'windows_root': OBSERVING_WINDOW_DIR,
+    # Pointing catalogues with observation times, see
+    # fov_overlap.pointing_windows. They are not part of the repository;
+    # check_sources fails a build up front when one is missing.
+    'pointings': {
+        instr: f"instrument_data/{instr.lower()}_pointings.csv"
+        for instr in FOV_INSTRUMENT_COLUMNS
+    },
+    # Optional {instr: (kind, location, time column)} archives queried
+    # through an ArchiveCache instead of reading the pointing catalogue,
+    # kind being 'directory' (DirectoryArchive) or 'http' (HttpArchive).
+    'archives': {},
+    'archive_cache_root': ARCHIVE_CACHE_DIR,
+    'archive_cache_max_bytes': ARCHIVE_CACHE_MAX_BYTES,
+    # Directory of hsi_obssumm_YYYYMMDD_NNN.fits files; None to use the
+    # stored RSI windows instead. Either way the RSI_FLARE windows are used
+    # for RSI_FLARE_TRIGGERED.
+    'rhessi_obssumm_dir': None
+}
+
+# Time before flare_start and after flare_end searched for pointings, as in
+# the *_observed_stats archive queries.
+ARCHIVE_MARGINS = {
+    'EIS': (pd.Timedelta(hours=4), pd.Timedelta(hours=4)),
+    'XRT': (pd.Timedelta(minutes=30), pd.Timedelta(hours=1)),
+    'SOT': (pd.Timedelta(minutes=30), pd.Timedelta(hours=1)),
+    'IRIS': (pd.Timedelta(0), pd.Timedelta(0))
+}
+
+
+@staged('obs_table.load')
+def load_joined_flare_list(filename: str = JOINED_FLARE_LIST_FILENAME) -> DataFrame:
+
+    # Reads a flare list written by flare_list_joiner with the upper case
+    # column names read_csv_w_headers gives the IDL struct tags.
+    flares = pd.read_csv(filename, index_col=0)
+    flares.columns = flares.columns.str.upper()
+    flares.index.name = 'INDEX'
+    flares = flares.reset_index()
+
+    for col in ['FLARE_START', 'FLARE_PEAK', 'FLARE_END']:
+        flares[col] = pd.to_datetime(flares[col], format='ISO8601')
+
+    return flares
+
+
+######################
+# Instrument Columns #
+######################
+
+
+@lru_cache(maxsize=None)
+def _window_store(root: str) -> ObservingWindowStore:
+
+    # One store per worker process, so each instrument's windows are memory
+    # mapped once per process rather than once per shard.
+    return ObservingWindowStore(root)
+
+
+@lru_cache(maxsize=None)
+def _pointing_table(filename: str) -> DataFrame:
+
+    # Parsed and time sorted once per worker process.
+    return pointing_windows(pd.read_csv(filename))
+
+
+def _rsi_columns(flares: DataFrame, sources: dict) -> DataFrame:
+
+    # RHESSI from the daily observing summary files when
+    # sources['rhessi_obssumm_dir'] is set, with the stored RSI_FLARE
+    # windows standing in for the flare flag. They are required, as
+    # FLARE_FLAG is zero throughout the archived files and would give an
+    # RSI_FLARE_TRIGGERED of all zeros.
+    store = _window_store(sources['windows_root'])
+
+    if sources.get('rhessi_obssumm_dir'):
+
+        if 'RSI_FLARE' not in store.instruments():
+            raise FileNotFoundError(
+                f"No RSI_FLARE windows stored in {store.root}, needed for "
+                f"RSI_FLARE_TRIGGERED when building from rhessi_obssumm_dir"
+            )
+
+        return rsi_observed_stats_for_flares(
+            flares, sources['rhessi_obssumm_dir'], store['RSI_FLARE'].coverage()
+        )
+
+    # Otherwise from the stored observing (not SAA or eclipse) and flare
+    # flag windows. Fractions are computed from the window durations rather
+    # than by counting obs summary flag samples as rsi_observed_stats does.
+
+    out = observed_fractions_for_flares(
+        flares, store['RSI'].coverage(), None, 'RSI'
+    )
+
+    start = _as_ns(flares['FLARE_START'])
+    peak = _as_ns(flares['FLARE_PEAK'])
+    end = _as_ns(flares['FLARE_END'])
+
+    malformed = (start > peak) | (peak > end)
+    start = np.where(start == peak, start - WIDEN_NS, start)
+    end = np.where(end == peak, end + WIDEN_NS, end)
+
+    triggered = store['RSI_FLARE'].coverage().touches(start, end)
+
+    out.insert(
+        1,
+        'RSI_FLARE_TRIGGERED',
+        np.where(malformed, MALFORMED_OBSERVED, triggered).astype(np.uint8)
+    )
+
+    return out
+
+
+def _fermi_columns(flares: DataFrame, sources: dict) -> DataFrame:
+
+    store = _window_store(sources['windows_root'])
+
+    return observed_fractions_for_flares(
+        flares, store['FERMI'].coverage(), None, 'FERMI'
+    )
+
+
+def _eve_columns(flares: DataFrame, sources: dict) -> DataFrame:
+
+    store = _window_store(sources['windows_root'])
+
+    megsa = observed_fractions_for_flares(
+        flares,
+        np.array([MEGSA_LIFETIME[0]], dtype='datetime64[ns]'),
+        np.array([MEGSA_LIFETIME[1]], dtype='datetime64[ns]'),
+        'MEGSA'
+    )
+    megsb = observed_fractions_for_flares(
+        flares, store['MEGSB'].coverage(), None, 'MEGSB'
+    )
+
+    return pd.concat([megsa[['MEGSA_OBSERVED']], megsb], axis=1)
+
+
+@lru_cache(maxsize=None)
+def _archive_cache(
+            instr: str,
+            archive: tuple[str, str, str],
+            root: str,
+            max_bytes: int
+        ) -> ArchiveCache:
+
+    # One cache per archive per worker process, sharing the directory.
+    kind, location, time_column = archive
+
+    if kind == 'directory':
+        fetch = DirectoryArchive(location, time_column)
+    elif kind == 'http':
+        fetch = HttpArchive(location)
+    else:
+        raise ValueError(f"Unknown archive kind: {kind!r}")
+
+    return ArchiveCache(fetch, instr, root, time_column, max_bytes)
+
+
+def _archive_pointings(flares: DataFrame, instr: str, sources: dict) -> DataFrame:
+
+    # Pointings for the days touched by any of the flares' search windows,
+    # fetched through the archive cache.
+    cache = _archive_cache(
+        instr,
+        tuple(sources['archives'][instr]),
+        sources['archive_cache_root'],
+        sources['archive_cache_max_bytes']
+    )
+    before, after = ARCHIVE_MARGINS[instr]
+
+    rows = cache.query_days(zip(
+        flares['FLARE_START'] - before, flares['FLARE_END'] + after
+    ))
+
+    if len(rows) == 0:
+        return DataFrame(columns=['START', 'END', *POINTING_COLUMNS])
+
+    return rows
+
+
+def _fov_columns(instr: str):
+
+    def columns(flares: DataFrame, sources: dict) -> DataFrame:
+
+        if instr in sources.get('archives', {}):
+            pointings = pointing_windows(_archive_pointings(flares, instr, sources))
+        else:
+            pointings = _pointing_table(sources['pointings'][instr])
+
+        return fov_observed_for_flares(flares, pointings, instr)
+
+    return columns
+
+
+INSTRUMENT_BUILDERS = {
+    'RSI': _rsi_columns,
+    'FERMI': _fermi_columns,
+    'EVE': _eve_columns,
+    **{instr: _fov_columns(instr) for instr in FOV_INSTRUMENT_COLUMNS}
+}
+
+
+def check_sources(instruments: list[str], sources: dict = DEFAULT_SOURCES):
+
+    # Raises FileNotFoundError naming every stored window set and pointing
+    # catalogue the instruments' builders would need but which is missing,
+    # so a build fails before any work rather than in a worker part way
+    # through.
+    store = ObservingWindowStore(sources['windows_root'])
+    stored = set(store.instruments())
+
+    windows = {
+        'RSI': ['RSI_FLARE'] + ([] if sources.get('rhessi_obssumm_dir') else ['RSI']),
+        'FERMI': ['FERMI'],
+        'EVE': ['MEGSB']
+    }
+
+    missing = [
+        f"{name} observing windows in {store.root}"
+        for instr in instruments for name in windows.get(instr, [])
+        if name not in stored
+    ]
+
+    for instr in instruments:
+
+        if instr not in FOV_INSTRUMENT_COLUMNS or instr in sources.get('archives', {}):
+            continue
+
+        filename = sources['pointings'].get(instr)
+
+        if filename is None or not os.path.exists(filename):
+            missing.append(f"{instr} pointing catalogue {filename}")
+
+    if missing:
+        raise FileNotFoundError(
+            "Missing sources for the observation table: " + "; ".join(missing)
+        )
+
+
+########################
+# Parallel Table Build #
+########################
+
+
+def shard_flares(flares: DataFrame, freq: str = 'M') -> list[np.ndarray]:
+
+    # Positional row indices of the flares in each FLARE_START period, in
+    # time order.
+    periods = flares['FLARE_START'].dt.to_period(freq).to_numpy()
+    _, inverse = np.unique(periods, return_inverse=True)
+
+    order = np.argsort(inverse, kind='stable')
+    bounds = np.flatnonzero(np.diff(inverse[order])) + 1
+
+    return np.split(order, bounds)
+
+
+def _build_shard(
+            instr: str,
+            shard: int,
+            flares: DataFrame,
+            sources: dict
+        ) -> tuple[str, int, DataFrame]:
+
+    # Measured in the worker, so each instrument's share of the build shows
+    # up on its own.
+    with stage('obs_table.build', instrument=instr, rows=len(flares)):
+        return instr, shard, INSTRUMENT_BUILDERS[instr](flares, sources)
+
+
+def _shard_tasks(
+            flares: DataFrame,
+            instruments: list[str],
+            freq: str,
+            pending: dict[str, np.ndarray] | None = None
+        ):
+
+    # Yields the (instrument, shard, flares) tasks, each shard's flares only
+    # sliced out when its task is taken. pending optionally maps each
+    # instrument to a Boolean mask of the flares still to be built, so
+    # finished flares are left out of the tasks.
+    for shard, rows in enumerate(shard_flares(flares, freq)):
+        for instr in instruments:
+
+            if pending is not None:
+                rows_todo = rows[pending[instr][rows]]
+            else:
+                rows_todo = rows
+
+            if len(rows_todo):
+                yield instr, shard, flares.iloc[rows_todo]
+
+
+def _run_tasks(tasks, sources: dict, workers: int):
+
+    # Yields (instrument, shard, columns) as tasks complete. At most
+    # TASKS_IN_FLIGHT_PER_WORKER tasks per worker are submitted ahead of the
+    # results being consumed. When a task raises, no further tasks are
+    # submitted, but those already running are finished and yielded (and so
+    # checkpointed) before the first error is raised.
+    if workers == 1:
+        for task in tasks:
+            yield _build_shard(*task, sources)
+        return
+
+    tasks = iter(tasks)
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+
+        running = set()
+        error = None
+
+        while True:
+
+            while error is None and len(running) < TASKS_IN_FLIGHT_PER_WORKER * workers:
+                task = next(tasks, None)
+                if task is None:
+                    break
+                running.add(pool.submit(_build_shard, *task, sources))
+
+            if not running:
+                break
+
+            done, running = wait(running, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                if future.exception() is not None:
+                    error = error or future.exception()
+                else:
+                    yield future.result()
+
+    if error is not None:
+        raise error
+
+
+def merge_shards(
+            flares: DataFrame,
+            results: list[tuple[str, int, DataFrame]],
+            instruments: list[str]
+        ) -> DataFrame:
+
+    # Reassembles per (instrument, shard) results in the column layout of
+    # instr_observed_flare_list.csv. Results are ordered by instrument and
+    # shard, never by completion, and each shard keeps the index of its
+    # flares, so the table does not depend on scheduling.
+    by_instr = {instr: [] for instr in instruments}
+
+    for instr, shard, columns in sorted(results, key=lambda r: (r[0], r[1])):
+        by_instr[instr].append(columns)
+
+    with stage('obs_table.merge', rows=len(flares)):
+
+        instr_cols = [
+            pd.concat(by_instr[instr]).reindex(flares.index)[INSTRUMENT_COLUMNS[instr]]
+            for instr in instruments
+        ]
+
+        return pd.concat([flares, *instr_cols], axis=1)
+
+
+class ObsTableCheckpoint:
+
+    # Append-only store of finished instrument columns, one directory per
+    # instrument holding part-NNNNNN.csv files of INDEX, FLARE_PEAK and the
+    # instrument's columns. Parts are written to a temporary file and renamed
+    # so a crash never leaves a partial part behind. A flare counts as done
+    # for an instrument when a part holds its (INDEX, FLARE_PEAK) key, so
+    # flares whose times have changed since are rebuilt.
+
+    KEY_COLUMNS = ['INDEX', 'FLARE_PEAK']
+
+    def __init__(self, root: str = OBS_TABLE_CHECKPOINT_DIR):
+
+        self.root = root
+
+    def _dir(self, instr: str) -> str:
+
+        return os.path.join(self.root, instr)
+
+    @classmethod
+    def _keys(cls, rows: DataFrame) -> pd.MultiIndex:
+
+        return pd.MultiIndex.from_arrays([
+            rows['INDEX'].to_numpy(dtype=np.int64),
+            rows['FLARE_PEAK'].to_numpy(dtype='datetime64[ns]')
+        ], names=cls.KEY_COLUMNS)
+
+    def _parts(self, instr: str) -> list[str]:
+
+        directory = self._dir(instr)
+
+        if not os.path.isdir(directory):
+            return []
+
+        return sorted(
+            os.path.join(directory, name) for name in os.listdir(directory)
+            if name.startswith('part-') and name.endswith('.csv')
+        )
+
+    def append(self, instr: str, flares: DataFrame, columns: DataFrame):
+
+        directory = self._dir(instr)
+        os.makedirs(directory, exist_ok=True)
+
+        parts = self._parts(instr)
+        seq = int(os.path.basename(parts[-1])[5:-4]) + 1 if parts else 0
+        part = os.path.join(directory, f"part-{seq:06d}.csv")
+
+        rows = pd.concat(
+            [flares.loc[columns.index, self.KEY_COLUMNS], columns], axis=1
+        )
+
+        tmp = f"{part}.tmp{os.getpid()}"
+        rows.to_csv(tmp, index=False)
+        os.replace(tmp, part)
+
+    def load(self, instr: str) -> DataFrame:
+
+        # Every checkpointed row for the instrument, the latest part winning
+        # where a flare was built more than once.
+        parts = self._parts(instr)
+
+        if not parts:
+            return DataFrame(columns=self.KEY_COLUMNS + INSTRUMENT_COLUMNS[instr])
+
+        rows = typed_flare_list(pd.concat([pd.read_csv(part) for part in parts]))
+
+        return rows.drop_duplicates(self.KEY_COLUMNS, keep='last')
+
+    def read_part(self, instr: str, part: int) -> DataFrame:
+
+        return typed_flare_list(pd.read_csv(self._parts(instr)[part]))
+
+    def locate(self, instr: str, flares: DataFrame) -> tuple[np.ndarray, np.ndarray]:
+
+        # Part number and row within the part of each flare's latest
+        # checkpointed columns, -1 where not built. Only the key columns of
+        # the parts are read.
+        keys = []
+
+        for i, part in enumerate(self._parts(instr)):
+            rows = typed_flare_list(pd.read_csv(part, usecols=self.KEY_COLUMNS))
+            keys.append(rows.assign(PART=i, ROW=np.arange(len(rows))))
+
+        if not keys:
+            return np.full(len(flares), -1), np.full(len(flares), -1)
+
+        keys = pd.concat(keys).drop_duplicates(self.KEY_COLUMNS, keep='last')
+
+        found = self._keys(keys).get_indexer(self._keys(flares))
+        built = found >= 0
+
+        part = np.where(built, keys['PART'].to_numpy()[found], -1)
+        row = np.where(built, keys['ROW'].to_numpy()[found], -1)
+
+        return part, row
+
+    def done(self, instr: str, flares: DataFrame) -> np.ndarray:
+
+        # Boolean mask of the flares already built for the instrument.
+        return self.locate(instr, flares)[0] >= 0
+
+    def columns(self, instr: str, flares: DataFrame) -> DataFrame:
+
+        # The instrument's columns aligned to flares (NaN where not built).
+        rows = self.load(instr)
+        rows = rows.set_axis(self._keys(rows))[INSTRUMENT_COLUMNS[instr]]
+
+        return rows.reindex(self._keys(flares)).set_axis(flares.index)
+
+    def clear(self, instr: str):
+
+        for part in self._parts(instr):
+            os.remove(part)
+
+
+def build_obs_table(
+            flares: DataFrame,
+            instruments: list[str] = INSTRUMENTS,
+            sources: dict = DEFAULT_SOURCES,
+            workers: int | None = None,
+            freq: str = 'M',
+            checkpoint: ObsTableCheckpoint | None = None,
+            rerun: list[str] = (),
+            out: str | None = None
+        ) -> DataFrame | None:
+
+    # Python equivalent of compile_obs_table. The flare list is split into
+    # FLARE_START periods (freq) and every (instrument, period) pair is an
+    # independent task run on a pool of worker processes. workers defaults to
+    # os.cpu_count(); workers=1 runs the tasks in this process.
+    #
+    # With a checkpoint, each task's columns are appended to it as soon as
+    # the task completes and are not held in memory. Flares already in the
+    # checkpoint are skipped, so an interrupted build resumes where it
+    # stopped. Instruments in rerun have their checkpoint cleared first.
+    # Given out, the finished table is streamed from the checkpoint to that
+    # file (see write_checkpointed_table) rather than returned.
+    unknown = [
+        instr for instr in [*instruments, *rerun]
+        if instr not in INSTRUMENT_BUILDERS
+    ]
+    if unknown:
+        raise ValueError(f"Unknown instruments: {unknown}")
+
+    instruments = [instr for instr in INSTRUMENTS if instr in instruments]
+    workers = workers or os.cpu_count() or 1
+
+    check_sources(instruments, sources)
+
+    if checkpoint is None:
+        tasks = _shard_tasks(flares, instruments, freq)
+        results = list(_run_tasks(tasks, sources, workers))
+
+        return merge_shards(flares, results, instruments)
+
+    for instr in rerun:
+        checkpoint.clear(instr)
+
+    pending = {instr: ~checkpoint.done(instr, flares) for instr in instruments}
+    tasks = _shard_tasks(flares, instruments, freq, pending)
+
+    for instr, shard, columns in _run_tasks(tasks, sources, workers):
+        with stage('obs_table.checkpoint', instrument=instr, rows=len(columns)):
+            checkpoint.append(instr, flares, columns)
+
+    if out is not None:
+        write_checkpointed_table(flares, instruments, checkpoint, out)
+        return None
+
+    instr_cols = [checkpoint.columns(instr, flares) for instr in instruments]
+
+    return pd.concat([flares, *instr_cols], axis=1)
+
+
+def write_obs_table(table: DataFrame, filename: str = OBS_TABLE_FILENAME):
+
+    # Written to a temporary file first so the table is replaced atomically.
+    with stage('obs_table.write', rows=len(table)):
+        tmp = f"{filename}.tmp{os.getpid()}"
+        table.to_csv(tmp, index=False)
+        os.replace(tmp, filename)
+
+
+def _checkpointed_block(
+            instr: str,
+            part: np.ndarray,
+            row: np.ndarray,
+            read_part,
+            index: pd.Index
+        ) -> DataFrame:
+
+    # An instrument's columns for a block of flares, from the parts and rows
+    # locate() found them in. Flags go nullable where a flare is not built,
+    # so every block writes them the same way.
+    columns = INSTRUMENT_COLUMNS[instr]
+    pieces = []
+
+    for p in np.unique(part[part >= 0]):
+        at = np.flatnonzero(part == p)
+        pieces.append(read_part(instr, p)[columns].iloc[row[at]].set_axis(at))
+
+    if not pieces:
+        return DataFrame(np.nan, index=index, columns=columns)
+
+    block = pd.concat(pieces)
+
+    if len(block) < len(index):
+        block = block.astype({
+            col: 'UInt8' for col in columns if block[col].dtype == np.uint8
+        })
+
+    return block.reindex(np.arange(len(index))).set_axis(index)
+
+
+def write_checkpointed_table(
+            flares: DataFrame,
+            instruments: list[str],
+            checkpoint: ObsTableCheckpoint,
+            filename: str = OBS_TABLE_FILENAME,
+            block_rows: int = WRITE_BLOCK_ROWS
+        ):
+
+    # Writes the same table as build_obs_table returns from a checkpoint, a
+    # block of block_rows flares at a time. Each checkpoint part is read when
+    # the first block needing it is written and dropped after the last, so
+    # for a flare list in time order only a block and the few parts it spans
+    # are held, rather than the whole table. Written to a temporary file
+    # first so the table is replaced atomically.
+    n_blocks = max(-(-len(flares) // block_rows), 1)
+    block_of = np.arange(len(flares)) // block_rows
+
+    located = {}
+    last_block = {}
+
+    for instr in instruments:
+        part, row = checkpoint.locate(instr, flares)
+        located[instr] = (part, row)
+        for p, b in zip(part[part >= 0], block_of[part >= 0]):
+            last_block[instr, p] = b
+
+    parts = {}
+
+    def read_part(instr, p):
+        if (instr, p) not in parts:
+            parts[instr, p] = checkpoint.read_part(instr, p)
+        return parts[instr, p]
+
+    with stage('obs_table.write', rows=len(flares)):
+
+        tmp = f"{filename}.tmp{os.getpid()}"
+
+        with open(tmp, 'w', newline='') as f:
+
+            for b in range(n_blocks):
+
+                rows = slice(b * block_rows, (b + 1) * block_rows)
+                block = flares.iloc[rows]
+
+                instr_cols = [
+                    _checkpointed_block(
+                        instr, located[instr][0][rows], located[instr][1][rows],
+                        read_part, block.index
+                    )
+                    for instr in instruments
+                ]
+
+                pd.concat([block, *instr_cols], axis=1).to_csv(f, index=False, header=b == 0)
+
+                for key in [key for key in parts if last_block[key] <= b]:
+                    del parts[key]
+
+        os.replace(tmp, filename)
+
+
+#############################
+# Incremental Table Updates #
+#############################
+
+
+# A flare is identified across re-joins by its peak time, GOES class and
+# location, as INDEX is renumbered whenever the flare lists are re-joined.
+FLARE_KEY_COLUMNS = ['FLARE_PEAK', 'CLASS', 'AIA_LOC']
+
+# Flare columns the observation columns depend on; a flare whose key is
+# unchanged but which differs in any of these is rebuilt.
+FLARE_INPUT_COLUMNS = ['FLARE_START', 'FLARE_END', 'AIA_XCEN', 'AIA_YCEN']
+
+
+def flare_keys(flares: DataFrame) -> pd.MultiIndex:
+
+    # Stable keys for flares. Identical keys are told apart by their order of
+    # occurrence so that duplicated flares still pair up one to one.
+    peak = pd.to_datetime(flares['FLARE_PEAK']).dt.strftime('%Y-%m-%d %H:%M:%S')
+    cls = flares['CLASS'].astype(str).str.strip()
+    loc = flares['AIA_LOC'].fillna('').astype(str).str.strip()
+
+    keys = DataFrame({'FLARE_PEAK': peak, 'CLASS': cls, 'AIA_LOC': loc})
+    keys['OCCURRENCE'] = keys.groupby(FLARE_KEY_COLUMNS).cumcount()
+
+    return pd.MultiIndex.from_frame(keys)
+
+
+def diff_flare_lists(old: DataFrame, new: DataFrame) -> dict[str, np.ndarray]:
+
+    # Compares a previous observation table (or flare list) with a newly
+    # joined flare list by flare key. Returns positional row indices:
+    #   added     - new rows with no matching old flare
+    #   changed   - new rows whose old flare differs in FLARE_INPUT_COLUMNS
+    #   unchanged - new rows whose old flare is identical
+    #   old_rows  - for each new row, the matching old row (-1 if added)
+    #   deleted   - old rows with no matching new flare
+    old_keys = flare_keys(old)
+    new_keys = flare_keys(new)
+
+    old_rows = old_keys.get_indexer(new_keys)
+    matched = old_rows >= 0
+
+    same = np.ones(len(new), dtype=bool)
+
+    for col in FLARE_INPUT_COLUMNS:
+
+        if col in ('FLARE_START', 'FLARE_END'):
+            a = _as_ns(pd.to_datetime(new[col]))
+            b = _as_ns(pd.to_datetime(old[col]))
+        else:
+            a = new[col].to_numpy(dtype=np.float64)
+            b = old[col].to_numpy(dtype=np.float64)
+
+        b = b[np.maximum(old_rows, 0)]
+
+        same &= (a == b) | ((a != a) & (b != b))
+
+    deleted = np.setdiff1d(np.arange(len(old)), old_rows[matched])
+
+    return {
+        'added': np.flatnonzero(~matched),
+        'changed': np.flatnonzero(matched & ~same),
+        'unchanged': np.flatnonzero(matched & same),
+        'old_rows': old_rows,
+        'deleted': deleted
+    }
+
+
+def update_obs_table(
+            flares: DataFrame,
+            table_filename: str = OBS_TABLE_FILENAME,
+            instruments: list[str] = INSTRUMENTS,
+            verbose: bool = False,
+            **build_kwargs
+        ) -> DataFrame:
+
+    # Incrementally updates an existing observation table for a newly joined
+    # flare list. Observation columns are copied from the existing table for
+    # unchanged flares and only built for added or changed flares; flares no
+    # longer in the list are dropped. The flare columns (including INDEX)
+    # always come from the new list, and the table is rewritten atomically.
+    # Without an existing table this is a full build.
+    #
+    # Instruments not in instruments keep their columns from the existing
+    # table. They are not built, so they are left empty for added and
+    # changed flares until those instruments are updated too.
+    if not os.path.exists(table_filename):
+        table = build_obs_table(flares, instruments=instruments, **build_kwargs)
+        write_obs_table(table, table_filename)
+        return table
+
+    with stage('obs_table.diff', rows=len(flares)):
+        old = typed_flare_list(pd.read_csv(table_filename))
+        diff = diff_flare_lists(old, flares)
+
+    instruments = [instr for instr in INSTRUMENTS if instr in instruments]
+    instr_cols = [col for instr in instruments for col in INSTRUMENT_COLUMNS[instr]]
+
+    missing = [col for col in instr_cols if col not in old.columns]
+    if missing:
+        raise ValueError(
+            f"{table_filename} is missing columns {missing}, rebuild it in full"
+        )
+
+    kept_cols = [
+        col for instr in INSTRUMENTS if instr not in instruments
+        for col in INSTRUMENT_COLUMNS[instr] if col in old.columns
+    ]
+
+    rebuild = np.sort(np.concatenate([diff['added'], diff['changed']]))
+    unchanged = diff['unchanged']
+
+    if verbose:
+        print(
+            f"{len(unchanged)} unchanged, {len(diff['added'])} added, "
+            f"{len(diff['changed'])} changed, {len(diff['deleted'])} deleted"
+        )
+        if kept_cols and len(rebuild):
+            print(
+                f"{len(rebuild)} added or changed flares left empty in "
+                f"{len(kept_cols)} columns of instruments not being updated"
+            )
+
+    # Old row of each new flare whose columns are copied, -1 for the rest.
+    old_rows = np.full(len(flares), -1, dtype=np.int64)
+    old_rows[unchanged] = diff['old_rows'][unchanged]
+
+    kept = old[instr_cols].iloc[old_rows[unchanged]]
+    kept.index = flares.index[unchanged]
+
+    parts = [kept]
+
+    if len(rebuild):
+        built = build_obs_table(
+            flares.iloc[rebuild], instruments=instruments, **build_kwargs
+        )
+        parts.append(built[instr_cols])
+
+    # Flags of the other instruments go nullable rather than float where
+    # rows are left empty, so the copied values are written out unchanged.
+    other = old[kept_cols].astype({
+        col: 'UInt8' for col in kept_cols if old[col].dtype == np.uint8
+    })
+    other = other.set_axis(np.arange(len(old))).reindex(old_rows).set_axis(flares.index)
+
+    columns = pd.concat([pd.concat(parts).reindex(flares.index), other], axis=1)
+
+    # Columns in the order of the existing table.
+    columns = columns[[col for col in old.columns if col in columns.columns]]
+
+    table = pd.concat([flares, columns], axis=1)
+
+    write_obs_table(table, table_filename)
+
+    return table
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(
+        description="Build instr_observed_flare_list.csv from a joined flare list."
+    )
+    parser.add_argument('flare_list', nargs='?', default=JOINED_FLARE_LIST_FILENAME)
+    parser.add_argument('--out', default=OBS_TABLE_FILENAME)
+    parser.add_argument(
+        '--instruments', nargs='+', choices=INSTRUMENTS, default=INSTRUMENTS
+    )
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument(
+        '--shard-freq', default='M',
+        help="Pandas period frequency used to shard flares by FLARE_START."
+    )
+    parser.add_argument('--windows-root', default=OBSERVING_WINDOW_DIR)
+    parser.add_argument(
+        '--rhessi-obssumm-dir', default=None,
+        help="Directory of hsi_obssumm_*.fits files to build the RSI columns from."
+    )
+    parser.add_argument(
+        '--checkpoint', nargs='?', const=OBS_TABLE_CHECKPOINT_DIR, default=None,
+        help="Checkpoint directory; finished flares in it are skipped."
+    )
+    parser.add_argument(
+        '--update', action='store_true',
+        help="Only build flares added or changed since the existing --out table."
+    )
+    parser.add_argument(
+        '--rerun', nargs='+', choices=INSTRUMENTS, default=[],
+        help="Instruments to rebuild from scratch (requires --checkpoint)."
+    )
+    args = parser.parse_args()
+
+    if args.rerun and args.checkpoint is None:
+        parser.error("--rerun requires --checkpoint")
+
+    sources = {
+        **DEFAULT_SOURCES,
+        'windows_root': args.windows_root,
+        'rhessi_obssumm_dir': args.rhessi_obssumm_dir
+    }
+
+    try:
+        check_sources(args.instruments, sources)
+    except FileNotFoundError as e:
+        parser.error(str(e))
+
+    flares = load_joined_flare_list(args.flare_list)
+    build_kwargs = {
+        'sources': sources,
+        'workers': args.workers,
+        'freq': args.shard_freq,
+        'checkpoint': ObsTableCheckpoint(args.checkpoint) if args.checkpoint else None,
+        'rerun': args.rerun
+    }
+
+    if args.update:
+        table = update_obs_table(
+            flares,
+            args.out,
+            instruments=args.instruments,
+            verbose=True,
+            **build_kwargs
+        )
+    elif args.checkpoint:
+        build_obs_table(flares, instruments=args.instruments, out=args.out, **build_kwargs)
+    else:
+        table = build_obs_table(flares, instruments=args.instruments, **build_kwargs)
+        write_obs_table(table, args.out)
+
+    print(f"Wrote {len(flares)} flares to {args.out}")
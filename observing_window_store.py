@@ -0,0 +1,255 @@
+import argparse
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from interval_overlap import WindowCoverage, merge_intervals
+
+
+OBSERVING_WINDOW_DIR = 'observing_windows'
+
+# Epoch of the SSW anytim seconds used in the IDL .sav files.
+ANYTIM_EPOCH = np.datetime64('1979-01-01T00:00:00', 'ns')
+
+
+def anytim_to_datetime64(seconds) -> np.ndarray:
+
+    seconds = np.asarray(seconds, dtype=np.float64)
+
+    return ANYTIM_EPOCH + np.round(seconds * 1e9).astype('timedelta64[ns]')
+
+
+class ObservingWindows:
+
+    # One instrument's observing windows as sorted, disjoint int64 (ns since
+    # 1970) start and end arrays. Arrays opened from a store are memory
+    # mapped, so slicing only touches the pages covering the slice.
+
+    def __init__(self, start: np.ndarray, end: np.ndarray, name: str = ''):
+
+        self.start = start
+        self.end = end
+        self.name = name
+
+    def __len__(self) -> int:
+
+        return len(self.start)
+
+    def _bounds(self, t0, t1) -> tuple[int, int]:
+
+        t0 = np.datetime64(pd.Timestamp(t0), 'ns').astype(np.int64)
+        t1 = np.datetime64(pd.Timestamp(t1), 'ns').astype(np.int64)
+
+        # As the windows are disjoint and sorted, their ends are sorted too.
+        lo = np.searchsorted(self.end, t0, side='left')
+        hi = np.searchsorted(self.start, t1, side='right')
+
+        return lo, max(lo, hi)
+
+    def slice(self, t0, t1) -> tuple[np.ndarray, np.ndarray]:
+
+        # Windows intersecting [t0, t1], touching included, as views onto
+        # the (memory mapped) arrays.
+        lo, hi = self._bounds(t0, t1)
+
+        return self.start[lo:hi], self.end[lo:hi]
+
+    def slice_datetime64(self, t0, t1) -> tuple[np.ndarray, np.ndarray]:
+
+        start, end = self.slice(t0, t1)
+
+        return start.view('datetime64[ns]'), end.view('datetime64[ns]')
+
+    def coverage(self) -> WindowCoverage:
+
+        return WindowCoverage(self.start, self.end, disjoint=True)
+
+
+class ObservingWindowStore:
+
+    # Directory of per-instrument observing windows, each saved once as
+    # <root>/<instrument>/start.npy and end.npy plus a meta.json. Opened
+    # windows are cached, so per-flare lookups never re-read files.
+
+    def __init__(self, root: str = OBSERVING_WINDOW_DIR):
+
+        self.root = root
+        self._open = {}
+
+    def _dir(self, instrument: str) -> str:
+
+        return os.path.join(self.root, instrument)
+
+    def instruments(self) -> list[str]:
+
+        if not os.path.isdir(self.root):
+            return []
+
+        return sorted(
+            name for name in os.listdir(self.root)
+            if os.path.exists(os.path.join(self._dir(name), 'meta.json'))
+        )
+
+    def write(
+                self,
+                instrument: str,
+                starts,
+                ends,
+                source: str | None = None
+            ) -> ObservingWindows:
+
+        # Merges the intervals and saves them, replacing any existing windows
+        # for the instrument.
+        start, end = merge_intervals(starts, ends)
+
+        directory = self._dir(instrument)
+        os.makedirs(directory, exist_ok=True)
+
+        np.save(os.path.join(directory, 'start.npy'), start)
+        np.save(os.path.join(directory, 'end.npy'), end)
+
+        meta = {
+            'instrument': instrument,
+            'source': source,
+            'n_windows': int(len(start)),
+            'first_start': str(start[0].astype('datetime64[ns]')) if len(start) else None,
+            'last_end': str(end[-1].astype('datetime64[ns]')) if len(end) else None
+        }
+
+        with open(os.path.join(directory, 'meta.json'), 'w') as f:
+            json.dump(meta, f, indent=4)
+
+        self._open.pop(instrument, None)
+
+        return self.open(instrument)
+
+    def meta(self, instrument: str) -> dict:
+
+        with open(os.path.join(self._dir(instrument), 'meta.json')) as f:
+            return json.load(f)
+
+    def open(self, instrument: str) -> ObservingWindows:
+
+        if instrument not in self._open:
+
+            directory = self._dir(instrument)
+
+            if not os.path.exists(os.path.join(directory, 'meta.json')):
+                raise FileNotFoundError(
+                    f"No observing windows stored for {instrument} in {self.root}"
+                )
+
+            self._open[instrument] = ObservingWindows(
+                np.load(os.path.join(directory, 'start.npy'), mmap_mode='r'),
+                np.load(os.path.join(directory, 'end.npy'), mmap_mode='r'),
+                instrument
+            )
+
+        return self._open[instrument]
+
+    def __getitem__(self, instrument: str) -> ObservingWindows:
+
+        return self.open(instrument)
+
+
+###########################
+# Observing Window Import #
+###########################
+
+
+def windows_from_sav(
+            filename: str,
+            variable: str = 'observed_times'
+        ) -> tuple[np.ndarray, np.ndarray]:
+
+    # Reads an Array[2, x] of anytim start/end seconds from an IDL .sav file,
+    # e.g. the Fermi GTI and day/night intersection written by
+    # fermi_observed_stats.
+    from scipy.io import readsav
+
+    times = readsav(filename)[variable]
+
+    # IDL Array[2, x] is read back with shape (x, 2).
+    times = np.atleast_2d(times).reshape(-1, 2)
+
+    return anytim_to_datetime64(times[:, 0]), anytim_to_datetime64(times[:, 1])
+
+
+def windows_from_flags(
+            times,
+            flags,
+            cadence
+        ) -> tuple[np.ndarray, np.ndarray]:
+
+    # Converts a regularly sampled Boolean flag (e.g. RHESSI not in SAA or
+    # eclipse) into intervals, each sample covering [t, t + cadence).
+    times = np.asarray(times, dtype='datetime64[ns]')
+    flags = np.asarray(flags, dtype=bool)
+    cadence = np.timedelta64(pd.Timedelta(cadence).value, 'ns')
+
+    edges = np.diff(np.concatenate([[False], flags, [False]]).astype(np.int8))
+    run_start = np.flatnonzero(edges == 1)
+    run_end = np.flatnonzero(edges == -1) - 1
+
+    return times[run_start], times[run_end] + cadence
+
+
+def windows_from_megsb_exposure(filename: str) -> tuple[np.ndarray, np.ndarray]:
+
+    # Parses megsb_daily_exposure_hours.csv (date, day of year, exposed
+    # hours) as eve_observed_stats does: days with exposed hours of -1 are
+    # skipped, "14-17" covers 14:00 to 18:00 and "17" covers 17:00 to 18:00.
+    exposure = pd.read_csv(
+        filename,
+        header=None,
+        skiprows=1,
+        names=['date', 'day_of_yr', 'exposed_hrs'],
+        dtype=str,
+        skipinitialspace=True
+    )
+
+    exposure = exposure[exposure['exposed_hrs'].str.strip() != '-1']
+
+    ranges = (
+        exposure
+        .assign(obs_range=exposure['exposed_hrs'].str.split())
+        .explode('obs_range')
+        .dropna(subset=['obs_range'])
+    )
+
+    hours = ranges['obs_range'].str.split('-', expand=True)
+    start_hr = hours[0].astype(int)
+    end_hr = hours[1].fillna(hours[0]).astype(int) if 1 in hours else start_hr
+
+    day = pd.to_datetime(ranges['date'].str.strip())
+
+    starts = day + pd.to_timedelta(start_hr, unit='h')
+    ends = day + pd.to_timedelta(end_hr + 1, unit='h')
+
+    return starts.to_numpy(), ends.to_numpy()
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(
+        description="Import observing windows into the observing window store."
+    )
+    parser.add_argument('instrument')
+    parser.add_argument(
+        'source', help="IDL .sav file or MEGS-B daily exposure hours CSV."
+    )
+    parser.add_argument('--root', default=OBSERVING_WINDOW_DIR)
+    args = parser.parse_args()
+
+    if args.source.endswith('.sav'):
+        starts, ends = windows_from_sav(args.source)
+    else:
+        starts, ends = windows_from_megsb_exposure(args.source)
+
+    windows = ObservingWindowStore(args.root).write(
+        args.instrument, starts, ends, source=args.source
+    )
+
+    print(f"Stored {len(windows)} windows for {args.instrument} in {args.root}")
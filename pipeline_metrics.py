@@ -0,0 +1,358 @@
+import argparse
+import atexit
+import cProfile
+import fnmatch
+import functools
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+import pandas as pd
+from pandas import DataFrame
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+# Instrumentation is configured from the environment, so any script can be
+# measured without editing it:
+#   FLARE_METRICS         unset or empty: off. 'summary': print a table of
+#                         the stages at exit. Anything else: a JSON lines
+#                         file each stage is appended to as it finishes.
+#   FLARE_METRICS_MEMORY  1 to trace the peak Python (numpy and pandas
+#                         included) memory of each stage with tracemalloc.
+#                         Otherwise only the process's peak RSS is recorded.
+#   FLARE_PROFILE         Comma separated stage name patterns (fnmatch, e.g.
+#                         'obs_table.*') to run under cProfile, each run
+#                         dumped to FLARE_PROFILE_DIR as
+#                         <stage>[-<instrument>]-<pid>-<n>.prof.
+# Worker processes inherit the environment, so stages run in a process pool
+# are appended to the same JSON lines file (one line per write, so records
+# never interleave); the summary only covers this process.
+METRICS_ENV = 'FLARE_METRICS'
+MEMORY_ENV = 'FLARE_METRICS_MEMORY'
+PROFILE_ENV = 'FLARE_PROFILE'
+PROFILE_DIR_ENV = 'FLARE_PROFILE_DIR'
+
+PROFILE_DIR = 'profiles'
+
+SUMMARY_COLUMNS = [
+    'stage', 'instrument', 'calls', 'failed', 'wall_seconds', 'cpu_seconds', 'rows',
+    'rows_per_second', 'peak_traced_mb', 'peak_rss_mb'
+]
+
+
+class _Config:
+
+    def __init__(
+                self,
+                output: str | None = None,
+                memory: bool = False,
+                profile: list[str] = (),
+                profile_dir: str = PROFILE_DIR
+            ):
+
+        self.output = output
+        self.memory = memory
+        self.profile = list(profile)
+        self.profile_dir = profile_dir
+
+        self.records = []
+        self.lock = threading.Lock()
+        self.profiled = 0
+
+        # Peak traced memory of the stages currently open, innermost last.
+        self.peaks = []
+
+
+def _from_environment() -> _Config | None:
+
+    output = os.environ.get(METRICS_ENV, '')
+    profile = [p for p in os.environ.get(PROFILE_ENV, '').split(',') if p]
+
+    if not output and not profile:
+        return None
+
+    return _Config(
+        output=output or None,
+        memory=os.environ.get(MEMORY_ENV, '') not in ('', '0'),
+        profile=profile,
+        profile_dir=os.environ.get(PROFILE_DIR_ENV, PROFILE_DIR)
+    )
+
+
+_config = _from_environment()
+
+
+def enable(
+            output: str | None = 'summary',
+            memory: bool = False,
+            profile: list[str] = (),
+            profile_dir: str = PROFILE_DIR
+        ):
+
+    # Turns instrumentation on from code, as the environment variables do.
+    global _config
+    _config = _Config(output, memory, profile, profile_dir)
+
+
+def disable():
+
+    global _config
+    _config = None
+
+
+def enabled() -> bool:
+
+    return _config is not None
+
+
+def _peak_rss_mb() -> float | None:
+
+    # Process high water mark. ru_maxrss is in kB on Linux and bytes on macOS.
+    if resource is None:
+        return None
+
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    return rss / 2**20 if sys.platform == 'darwin' else rss / 2**10
+
+
+class _NullStage:
+
+    # Stands in for Stage while instrumentation is off, so an instrumented
+    # block costs one call and no timing.
+    rows = None
+    instrument = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+class Stage:
+
+    # One timed run of a named stage. Set .rows inside the block when the
+    # number of rows is only known at the end.
+
+    def __init__(self, config: _Config, name: str, instrument: str | None, rows: int | None):
+
+        self.config = config
+        self.name = name
+        self.instrument = instrument
+        self.rows = rows
+        self.profiler = None
+
+    def _profiled(self) -> bool:
+
+        return any(fnmatch.fnmatchcase(self.name, p) for p in self.config.profile)
+
+    def __enter__(self):
+
+        config = self.config
+
+        if config.memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            # The enclosing stage keeps the peak reached so far, as the peak
+            # is reset for this one.
+            if config.peaks:
+                config.peaks[-1] = max(config.peaks[-1], tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+            config.peaks.append(0)
+
+        if self._profiled():
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+
+        self.wall = time.perf_counter()
+        self.cpu = time.process_time()
+
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+
+        wall = time.perf_counter() - self.wall
+        cpu = time.process_time() - self.cpu
+
+        config = self.config
+
+        if self.profiler is not None:
+            self.profiler.disable()
+            self._dump_profile()
+
+        peak_traced = None
+        if config.memory and config.peaks:
+            peak_traced = max(config.peaks.pop(), tracemalloc.get_traced_memory()[1])
+            if config.peaks:
+                config.peaks[-1] = max(config.peaks[-1], peak_traced)
+
+        record = {
+            'stage': self.name,
+            'instrument': self.instrument,
+            'rows': None if self.rows is None else int(self.rows),
+            'wall_seconds': wall,
+            'cpu_seconds': cpu,
+            'peak_traced_mb': None if peak_traced is None else peak_traced / 2**20,
+            'peak_rss_mb': _peak_rss_mb(),
+            'failed': exc_type is not None,
+            'pid': os.getpid(),
+            'time': time.time()
+        }
+
+        _record(config, record)
+
+        return False
+
+    def _dump_profile(self):
+
+        config = self.config
+
+        with config.lock:
+            config.profiled += 1
+            n = config.profiled
+
+        os.makedirs(config.profile_dir, exist_ok=True)
+
+        name = self.name if self.instrument is None else f"{self.name}-{self.instrument}"
+        self.profiler.dump_stats(
+            os.path.join(config.profile_dir, f"{name}-{os.getpid()}-{n}.prof")
+        )
+
+
+def _record(config: _Config, record: dict):
+
+    with config.lock:
+        config.records.append(record)
+
+    if config.output and config.output != 'summary':
+        # One write per line in append mode, so processes sharing the file
+        # never interleave partial lines.
+        with open(config.output, 'a') as f:
+            f.write(json.dumps(record) + '\n')
+
+
+def stage(name: str, instrument: str | None = None, rows: int | None = None):
+
+    # Context manager measuring a stage, e.g.
+    #   with stage('obs_table.build', instrument='RSI', rows=len(flares)):
+    #       ...
+    if _config is None:
+        return _NULL_STAGE
+
+    return Stage(_config, name, instrument, rows)
+
+
+def staged(name: str, instrument: str | None = None):
+
+    # Decorator form of stage(). Rows are taken from the result's length
+    # where it has one.
+    def decorate(func):
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+
+            if _config is None:
+                return func(*args, **kwargs)
+
+            with stage(name, instrument) as s:
+                result = func(*args, **kwargs)
+                if hasattr(result, '__len__'):
+                    s.rows = len(result)
+
+            return result
+
+        return wrapper
+
+    return decorate
+
+
+def records() -> list[dict]:
+
+    return [] if _config is None else list(_config.records)
+
+
+def summarise(records: list[dict]) -> DataFrame:
+
+    # Totals per (stage, instrument): calls, wall and CPU time, rows and
+    # throughput, and the largest memory peaks, slowest stage first. Runs
+    # which raised are left out of the totals and counted under failed.
+    # Rows are blank for stages which never set them.
+    if not records:
+        return DataFrame(columns=SUMMARY_COLUMNS)
+
+    df = DataFrame(records)
+    df['instrument'] = df['instrument'].fillna('')
+
+    for col in ['rows', 'peak_traced_mb', 'peak_rss_mb']:
+        df[col] = pd.to_numeric(df[col])
+
+    keys = ['stage', 'instrument']
+    failed = df['failed'].astype(bool)
+
+    grouped = df[~failed].groupby(keys, sort=False)
+    summary = grouped.agg(
+        calls=('wall_seconds', 'size'),
+        wall_seconds=('wall_seconds', 'sum'),
+        cpu_seconds=('cpu_seconds', 'sum'),
+        peak_traced_mb=('peak_traced_mb', 'max'),
+        peak_rss_mb=('peak_rss_mb', 'max')
+    )
+    summary['rows'] = grouped['rows'].sum(min_count=1)
+
+    # Stages which only ever failed still get a row.
+    summary = summary.join(
+        df[failed].groupby(keys, sort=False).size().rename('failed'), how='outer'
+    )
+    summary['calls'] = summary['calls'].fillna(0).astype(int)
+    summary['failed'] = summary['failed'].fillna(0).astype(int)
+    summary = summary.reset_index()
+
+    summary['rows_per_second'] = summary['rows'] / summary['wall_seconds']
+
+    return summary.sort_values('wall_seconds', ascending=False)[SUMMARY_COLUMNS]
+
+
+def read_metrics(filename: str) -> list[dict]:
+
+    with open(filename) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def _print_summary():
+
+    if _config is not None and _config.output == 'summary' and _config.records:
+        print(
+            summarise(_config.records).to_string(index=False, float_format=lambda v: f"{v:.3g}"),
+            file=sys.stderr
+        )
+
+
+atexit.register(_print_summary)
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(
+        description="Summarise stage metrics written with FLARE_METRICS=<file>."
+    )
+    parser.add_argument('metrics')
+    parser.add_argument('--stage', help="Only stages matching this pattern.")
+    args = parser.parse_args()
+
+    metrics = read_metrics(args.metrics)
+
+    if args.stage:
+        metrics = [m for m in metrics if fnmatch.fnmatchcase(m['stage'], args.stage)]
+
+    print(summarise(metrics).to_string(index=False, float_format=lambda v: f"{v:.3g}"))
@@ -1,17 +1,40 @@
+import argparse
+
+import numpy as np
 import pandas as pd
 
-fl_filename = 'instr_observed_flare_list.csv'
-flare_list = pd.read_csv(fl_filename)
-flare_list['FLARE_PEAK'] = pd.to_datetime(flare_list['FLARE_PEAK'], format='mixed')
+from flare_list_joiner import GEV_TIME_FORMAT
+from flare_time_index import FlareTimeIndex
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(
+        description="Extract the flares of a reference list from the instrument observed flare list."
+    )
+    parser.add_argument('--flare-list', default='instr_observed_flare_list.csv')
+    parser.add_argument('--reflist', default='goes_data_reflist.csv')
+    parser.add_argument('--out', default='filtered_flare_list.csv')
+    parser.add_argument(
+        '--tolerance',
+        help="Match the nearest peak within this (e.g. 2min) rather than exact peaks."
+    )
+    args = parser.parse_args()
 
-flare_search_filename = 'goes_data_reflist.csv'
-flares_to_search = pd.read_csv(flare_search_filename)
-flares_to_search['FLARE_PEAK'] = pd.to_datetime(flares_to_search['gpeak'], format='mixed')
+    # The flare list is only parsed when its index or cache is out of date.
+    index = FlareTimeIndex.open(args.flare_list)
 
-# out = flare_list[flare_list['FLARE_PEAK'].isin(flares_to_search['gpeak'])]
+    flares_to_search = pd.read_csv(args.reflist)
+    peaks = pd.to_datetime(flares_to_search['gpeak'].str.strip(), format=GEV_TIME_FORMAT)
 
-out = pd.merge(flare_list, flares_to_search, on='FLARE_PEAK', how='inner')
+    # Kept in flare list order, as an inner merge on the peak would give.
+    matched = index.match(peaks, args.tolerance)
+    matched = matched.iloc[np.argsort(matched['ROW'], kind='stable')]
 
-print(out)
-out.to_csv('filtered_flare_list.csv', index=False)
+    out = pd.concat([
+        matched.drop(columns=['KEY', 'ROW']).reset_index(drop=True),
+        flares_to_search.iloc[matched['KEY']].reset_index(drop=True)
+    ], axis=1)
 
+    print(out)
+    out.to_csv(args.out, index=False)
@@ -0,0 +1,259 @@
+import glob
+import os
+
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+
+from interval_overlap import (
+    MALFORMED_FRAC,
+    MALFORMED_OBSERVED,
+    WIDEN_NS,
+    WindowCoverage,
+    _as_ns
+)
+from observing_window_store import anytim_to_datetime64, windows_from_flags
+
+
+RHESSI_OBSSUMM_DIR = 'light_curve_data'
+
+OBSSUMM_FLAGS = ['SAA_FLAG', 'ECLIPSE_FLAG', 'FLARE_FLAG']
+
+
+class ObsSummFlags:
+
+    # RHESSI observing summary flags for one or more consecutive days, one
+    # sample per time_intv seconds starting at times (int64 ns):
+    #   observed  - not in SAA or eclipse, as in rsi_observed_stats
+    #   flare     - FLARE_FLAG set
+    #   has_data  - any non-zero count rate
+    # Prefix sums of each are kept so that the number of flagged samples
+    # between any two sample indices is a subtraction.
+
+    def __init__(
+                self,
+                times: np.ndarray,
+                time_intv: float,
+                observed: np.ndarray,
+                flare: np.ndarray,
+                has_data: np.ndarray
+            ):
+
+        self.times = times
+        self.time_intv_ns = int(round(time_intv * 1e9))
+
+        self.cum = {
+            name: np.concatenate([[0], np.cumsum(flags, dtype=np.int64)])
+            for name, flags in (
+                ('observed', observed), ('flare', flare), ('has_data', has_data)
+            )
+        }
+
+    def __len__(self) -> int:
+
+        return len(self.times)
+
+    @classmethod
+    def empty(cls, time_intv: float = 4.0) -> 'ObsSummFlags':
+
+        no_flags = np.zeros(0, dtype=bool)
+
+        return cls(np.zeros(0, dtype=np.int64), time_intv, no_flags, no_flags, no_flags)
+
+    @classmethod
+    def concatenate(cls, days: list['ObsSummFlags']) -> 'ObsSummFlags':
+
+        return cls(
+            np.concatenate([day.times for day in days]),
+            days[0].time_intv_ns / 1e9,
+            *(
+                np.concatenate([np.diff(day.cum[name]) for day in days])
+                for name in ('observed', 'flare', 'has_data')
+            )
+        )
+
+    def count(self, name: str, lo: np.ndarray, hi: np.ndarray) -> np.ndarray:
+
+        return self.cum[name][hi] - self.cum[name][lo]
+
+    def observing_windows(self) -> tuple[np.ndarray, np.ndarray]:
+
+        # Observing (not SAA or eclipse, with data) samples as intervals, for
+        # an ObservingWindowStore.
+        observed = (np.diff(self.cum['observed']) > 0) & (np.diff(self.cum['has_data']) > 0)
+
+        return windows_from_flags(
+            self.times.view('datetime64[ns]'),
+            observed,
+            pd.Timedelta(self.time_intv_ns, unit='ns')
+        )
+
+
+def read_obssumm(filename: str) -> ObsSummFlags:
+
+    # Reads the flag and count rate tables from an hsi_obssumm_YYYYMMDD_NNN
+    # FITS file. The tables are memory mapped and only the three flag
+    # columns and a per-sample data present flag are kept.
+    from astropy.io import fits
+
+    with fits.open(filename, memmap=True) as hdul:
+
+        info = hdul['HSI_OBSSUMMFLAGINFO'].data[0]
+        flag_ids = [str(flag).strip() for flag in info['FLAG_IDS']]
+        flags = hdul['HSI_OBSSUMMFLAGDATA'].data['FLAGS']
+
+        saa, eclipse, flare = (
+            flags[:, flag_ids.index(name)] != 0 for name in OBSSUMM_FLAGS
+        )
+        has_data = hdul['HSI_OBSSUMMRATEDATA'].data['COUNTRATE'].any(axis=1)
+
+        n = int(info['N_TIME_INTV'])
+        time_intv = float(info['TIME_INTV'])
+
+        times = (
+            anytim_to_datetime64(info['UT_REF']) +
+            (np.arange(n) * round(time_intv * 1e9)).astype('timedelta64[ns]')
+        ).astype(np.int64)
+
+    return ObsSummFlags(times, time_intv, ~(saa | eclipse), flare, has_data)
+
+
+def obssumm_filename(day, directory: str = RHESSI_OBSSUMM_DIR) -> str | None:
+
+    # Latest version of the day's hsi_obssumm_YYYYMMDD_NNN.fits, if any.
+    pattern = f"hsi_obssumm_{pd.Timestamp(day).strftime('%Y%m%d')}_*.fits"
+    files = sorted(glob.glob(os.path.join(directory, pattern)))
+
+    return files[-1] if files else None
+
+
+def rsi_phase_stats(
+            flare_start,
+            flare_peak,
+            flare_end,
+            obssumm: ObsSummFlags,
+            flare_windows: WindowCoverage | None = None
+        ) -> DataFrame:
+
+    # Vectorised rsi_observed_stats for flares covered by obssumm. Each
+    # flare's samples are found with searchsorted: a sample starting at t
+    # covers [t, t + time_intv) and belongs to the flare if it overlaps
+    # [flare_start, flare_end]. Samples starting before the peak count
+    # towards the rise and the rest towards the fall, so the sample at the
+    # peak is no longer counted in both phases.
+    #
+    # As in rsi_observed_stats, flares without any count rate data get 0 for
+    # every column, RSI_OBSERVED is whether any sample was observing and
+    # the fractions are the fraction of observing samples in each phase.
+    #
+    # FLARE_FLAG is zero throughout the archived obssumm files, as
+    # hsi_obs_summ_flag sets it from the RHESSI flare list when reading.
+    # Pass the flare list intervals as flare_windows to get
+    # RSI_FLARE_TRIGGERED; the file's flag is only used without them, for
+    # summaries written with the flag filled in.
+    start = _as_ns(flare_start)
+    peak = _as_ns(flare_peak)
+    end = _as_ns(flare_end)
+
+    start = np.where(start == peak, start - WIDEN_NS, start)
+    end = np.where(end == peak, end + WIDEN_NS, end)
+
+    malformed = ~((start < peak) & (peak < end))
+
+    lo = np.searchsorted(obssumm.times, start - obssumm.time_intv_ns, side='right')
+    mid = np.searchsorted(obssumm.times, peak, side='left')
+    hi = np.searchsorted(obssumm.times, end, side='right')
+
+    mid = np.clip(mid, lo, hi)
+
+    has_data = obssumm.count('has_data', lo, hi) > 0
+
+    def fraction(a, b):
+
+        n = b - a
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            frac = np.where(n > 0, obssumm.count('observed', a, b) / n, 0.0)
+
+        return np.where(has_data, frac, 0.0)
+
+    frac_obs = fraction(lo, hi)
+    observed = has_data & (obssumm.count('observed', lo, hi) > 0)
+    if flare_windows is not None:
+        triggered = has_data & flare_windows.touches(start, end)
+    else:
+        triggered = has_data & (obssumm.count('flare', lo, hi) > 0)
+
+    columns = {
+        'RSI_OBSERVED': observed,
+        'RSI_FLARE_TRIGGERED': triggered,
+        'RSI_FRAC_OBS': frac_obs,
+        'RSI_FRAC_OBS_RISE': fraction(lo, mid),
+        'RSI_FRAC_OBS_FALL': fraction(mid, hi)
+    }
+
+    return DataFrame(
+        {
+            name: (
+                np.where(malformed, MALFORMED_OBSERVED, col).astype(np.uint8)
+                if col.dtype == bool else
+                np.where(malformed, MALFORMED_FRAC, col).astype(np.float32)
+            )
+            for name, col in columns.items()
+        },
+        index=getattr(flare_start, 'index', None)
+    )
+
+
+def rsi_observed_stats_for_flares(
+            flares: DataFrame,
+            directory: str = RHESSI_OBSSUMM_DIR,
+            flare_windows: WindowCoverage | None = None
+        ) -> DataFrame:
+
+    # rsi_phase_stats for a flare table with FLARE_START, FLARE_PEAK and
+    # FLARE_END columns, reading each day's observing summary once. Flares
+    # are processed in order of their first day; the days each group needs
+    # (a flare may run past midnight) are read on first use and dropped once
+    # no later flare can need them. Days without a file count as no data.
+    widen = pd.Timedelta(WIDEN_NS, unit='ns')
+    first_day = (flares['FLARE_START'] - widen).dt.floor('D')
+    last_day = (flares['FLARE_END'] + widen).dt.floor('D')
+
+    days = {}
+    results = []
+
+    for day, group in flares.groupby(first_day, sort=True):
+
+        needed = pd.date_range(day, max(day, last_day[group.index].max()), freq='D')
+
+        for old in [d for d in days if d < day]:
+            del days[old]
+
+        for d in needed:
+            if d not in days:
+                filename = obssumm_filename(d, directory)
+                days[d] = read_obssumm(filename) if filename else None
+
+        loaded = [days[d] for d in needed if days[d] is not None]
+
+        obssumm = ObsSummFlags.concatenate(loaded) if loaded else ObsSummFlags.empty()
+
+        results.append(rsi_phase_stats(
+            group['FLARE_START'],
+            group['FLARE_PEAK'],
+            group['FLARE_END'],
+            obssumm,
+            flare_windows
+        ))
+
+    if not results:
+        return rsi_phase_stats(
+            flares['FLARE_START'],
+            flares['FLARE_PEAK'],
+            flares['FLARE_END'],
+            ObsSummFlags.empty(),
+            flare_windows
+        )
+
+    return pd.concat(results).reindex(flares.index)
@@ -0,0 +1,330 @@
+import warnings
+
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+
+from co_observation_index import CoObservationIndex
+from light_curve_store import LightCurveStore
+
+
+# Flares per block when streaming epochs, and the longest stretch of time a
+# block may cover, so each block only reads a day or so of light curve.
+EPOCH_BLOCK_FLARES = 512
+EPOCH_BLOCK_SPAN = pd.Timedelta(days=1)
+
+# Samples further than this many times the light curve's median cadence
+# from their neighbours are treated as a data gap and left as NaN, rather
+# than interpolated across (e.g. RHESSI nights or SAA passes).
+MAX_GAP_CADENCES = 5
+
+# Extra light curve read either side of a block, so the first and last grid
+# points have a sample to interpolate from.
+EPOCH_FETCH_MARGIN = pd.Timedelta(minutes=10)
+
+EPOCH_PERCENTILES = (10, 25, 75, 90)
+
+
+#######################
+# Light Curve Sources #
+#######################
+
+
+class SeriesLightCurve:
+
+    # One channel of an in-memory light curve (a Series with a
+    # DatetimeIndex), as sorted int64 ns times and float64 values.
+
+    def __init__(self, series: pd.Series):
+
+        series = series.sort_index(kind='stable')
+
+        self.times = series.index.to_numpy(dtype='datetime64[ns]').astype(np.int64)
+        self.values = series.to_numpy(dtype=np.float64)
+
+    def __call__(self, t0: int, t1: int) -> tuple[np.ndarray, np.ndarray]:
+
+        # Samples in [t0, t1] plus one on either side to interpolate from.
+        lo = max(int(np.searchsorted(self.times, t0, side='left')) - 1, 0)
+        hi = int(np.searchsorted(self.times, t1, side='right')) + 1
+
+        return self.times[lo:hi], self.values[lo:hi]
+
+
+class StoreLightCurve:
+
+    # One channel of an instrument in a LightCurveStore, read lazily from
+    # the days each block of flares touches.
+
+    def __init__(self, store: LightCurveStore, instrument: str, channel: str):
+
+        self.store = store
+        self.instrument = instrument
+        self.channel = channel
+
+    def __call__(self, t0: int, t1: int) -> tuple[np.ndarray, np.ndarray]:
+
+        light_curve = self.store.slice(
+            self.instrument,
+            pd.Timestamp(t0, unit='ns'),
+            pd.Timestamp(t1, unit='ns'),
+            [self.channel]
+        )
+
+        return (
+            light_curve.index.to_numpy(dtype='datetime64[ns]').astype(np.int64),
+            light_curve[self.channel].to_numpy(dtype=np.float64)
+        )
+
+
+def _as_source(light_curve):
+
+    if isinstance(light_curve, pd.Series):
+        return SeriesLightCurve(light_curve)
+
+    return light_curve
+
+
+####################
+# Epoch Extraction #
+####################
+
+
+def epoch_offsets(before, after, cadence) -> np.ndarray:
+
+    # Common grid of int64 ns offsets from the peak, from -before to +after
+    # inclusive.
+    before = pd.Timedelta(before).value
+    after = pd.Timedelta(after).value
+    cadence = pd.Timedelta(cadence).value
+
+    return np.arange(-(before // cadence), after // cadence + 1, dtype=np.int64) * cadence
+
+
+def interpolate_epochs(
+            times: np.ndarray,
+            values: np.ndarray,
+            targets: np.ndarray,
+            max_gap: int | None = None
+        ) -> np.ndarray:
+
+    # Linear interpolation of (times, values) at every target time at once,
+    # with one searchsorted over the whole (flare, sample) grid. Targets
+    # outside the data, or between samples more than max_gap ns apart, are
+    # NaN.
+    out = np.full(targets.shape, np.nan)
+
+    if len(times) == 0:
+        return out
+
+    if max_gap is None:
+        cadence = np.median(np.diff(times)) if len(times) > 1 else 0
+        max_gap = int(MAX_GAP_CADENCES * cadence)
+
+    flat = targets.ravel()
+    right = np.searchsorted(times, flat, side='left')
+
+    # An exact hit needs no neighbour on the left.
+    exact = (right < len(times)) & (times[np.minimum(right, len(times) - 1)] == flat)
+    left = np.where(exact, right, right - 1)
+
+    inside = (left >= 0) & (right < len(times))
+
+    left = np.clip(left, 0, len(times) - 1)
+    right = np.clip(right, 0, len(times) - 1)
+
+    t_left = times[left]
+    span = times[right] - t_left
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        weight = np.where(span > 0, (flat - t_left) / span, 0.0)
+
+    interpolated = values[left] + weight * (values[right] - values[left])
+
+    valid = inside & (span <= max_gap)
+    out.ravel()[valid] = interpolated[valid]
+
+    return out
+
+
+def _blocks(peaks: np.ndarray, block_flares: int, block_span: int) -> list[tuple[int, int]]:
+
+    # Splits peak-sorted flares into blocks of at most block_flares flares
+    # whose peaks span at most block_span ns.
+    blocks = []
+    b0 = 0
+
+    while b0 < len(peaks):
+
+        b1 = min(
+            b0 + block_flares,
+            int(np.searchsorted(peaks, peaks[b0] + block_span, side='right'))
+        )
+        b1 = max(b1, b0 + 1)
+
+        blocks.append((b0, b1))
+        b0 = b1
+
+    return blocks
+
+
+def iter_epochs(
+            flares: DataFrame,
+            light_curve,
+            offsets: np.ndarray,
+            max_gap=None,
+            block_flares: int = EPOCH_BLOCK_FLARES,
+            block_span=EPOCH_BLOCK_SPAN
+        ):
+
+    # Streams superposed epochs: yields (rows, epochs) per block of flares,
+    # rows being positional indices into flares and epochs the
+    # (len(rows), len(offsets)) light curve sampled at FLARE_PEAK + offsets.
+    #
+    # Flares are processed in peak order, so each block reads one short
+    # stretch of the light curve (a Series, SeriesLightCurve or
+    # StoreLightCurve). Flares without a peak time give NaN rows.
+    source = _as_source(light_curve)
+    max_gap = None if max_gap is None else pd.Timedelta(max_gap).value
+    margin = EPOCH_FETCH_MARGIN.value if max_gap is None else max_gap
+
+    peaks = flares['FLARE_PEAK'].to_numpy(dtype='datetime64[ns]').astype(np.int64)
+    has_peak = ~np.isnat(flares['FLARE_PEAK'].to_numpy(dtype='datetime64[ns]'))
+
+    missing = np.flatnonzero(~has_peak)
+    if len(missing):
+        yield missing, np.full((len(missing), len(offsets)), np.nan)
+
+    order = np.flatnonzero(has_peak)
+    order = order[np.argsort(peaks[order], kind='stable')]
+    sorted_peaks = peaks[order]
+
+    for b0, b1 in _blocks(sorted_peaks, block_flares, pd.Timedelta(block_span).value):
+
+        block_peaks = sorted_peaks[b0:b1]
+        targets = block_peaks[:, None] + offsets[None, :]
+
+        times, values = source(int(targets[0, 0]) - margin, int(targets[-1, -1]) + margin)
+
+        yield order[b0:b1], interpolate_epochs(
+            np.asarray(times), np.asarray(values), targets, max_gap
+        )
+
+
+def extract_epochs(
+            flares: DataFrame,
+            light_curve,
+            before='30min',
+            after='60min',
+            cadence='12s',
+            max_gap=None,
+            out: np.ndarray | None = None,
+            block_flares: int = EPOCH_BLOCK_FLARES
+        ) -> tuple[np.ndarray, pd.TimedeltaIndex]:
+
+    # Dense (n_flares, n_samples) array of the light curve aligned on each
+    # flare's FLARE_PEAK and sampled every cadence from -before to +after,
+    # in flare table order, together with the grid's offsets. out may be a
+    # preallocated (e.g. np.memmap) float array to fill instead.
+    offsets = epoch_offsets(before, after, cadence)
+
+    if out is None:
+        out = np.full((len(flares), len(offsets)), np.nan)
+
+    for rows, epochs in iter_epochs(
+                flares, light_curve, offsets, max_gap, block_flares
+            ):
+        out[rows] = epochs
+
+    return out, pd.TimedeltaIndex(offsets.astype('timedelta64[ns]'), name='offset')
+
+
+################
+# Epoch Stacks #
+################
+
+
+def _group_rows(flares: DataFrame, groups) -> dict:
+
+    # Positional rows of each group, from a column name (e.g. CLASS_LETTER
+    # or INSTR_MASK), an array of labels, or a ready made {name: rows} dict
+    # (e.g. from co_observation_groups(), where groups may overlap).
+    if isinstance(groups, dict):
+        return {name: np.asarray(rows) for name, rows in groups.items()}
+
+    labels = flares[groups] if isinstance(groups, str) else pd.Series(np.asarray(groups))
+    codes, uniques = pd.factorize(labels, sort=True)
+
+    # One stable argsort, as in CoObservationIndex, rather than a mask per
+    # group.
+    order = np.argsort(codes, kind='stable')
+    bounds = np.concatenate([[0], np.cumsum(np.bincount(codes[codes >= 0], minlength=len(uniques)))])
+    order = order[codes[order] >= 0]
+
+    return {
+        uniques[i]: order[bounds[i]:bounds[i + 1]] for i in range(len(uniques))
+    }
+
+
+def co_observation_groups(
+            flares: DataFrame,
+            instruments: list[str],
+            queries: dict,
+            mode: str = 'all'
+        ) -> dict:
+
+    # {name: rows} groups for epoch_stacks from co-observation queries, e.g.
+    # {'GOES+RHESSI': ['RSI'], 'RHESSI+FERMI': ['RSI', 'FERMI']}.
+    index = CoObservationIndex.from_flare_list(flares, instruments)
+
+    return {name: index.rows(query, mode) for name, query in queries.items()}
+
+
+def epoch_stacks(
+            epochs: np.ndarray,
+            offsets: pd.TimedeltaIndex,
+            flares: DataFrame,
+            groups='CLASS_LETTER',
+            percentiles=EPOCH_PERCENTILES,
+            block_samples: int = 256
+        ) -> DataFrame:
+
+    # Mean, median, percentile and count stacks of the epochs of each group,
+    # ignoring NaN samples. Returns a frame indexed by (group, statistic)
+    # with one column per offset. Groups are reduced block_samples columns
+    # at a time so memory stays bounded when epochs is memory mapped.
+    stats = ['count', 'mean', 'median', *(f"p{p:g}" for p in percentiles)]
+    rows_by_group = _group_rows(flares, groups)
+
+    stacks = {}
+
+    for name, rows in rows_by_group.items():
+
+        stack = np.full((len(stats), epochs.shape[1]), np.nan)
+
+        for c0 in range(0, epochs.shape[1], block_samples):
+
+            block = np.asarray(epochs[rows, c0:c0 + block_samples])
+            count = (~np.isnan(block)).sum(axis=0)
+            stack[0, c0:c0 + block.shape[1]] = count
+
+            if not count.any() or len(rows) == 0:
+                continue
+
+            with np.errstate(invalid='ignore', divide='ignore'):
+                stack[1, c0:c0 + block.shape[1]] = np.nansum(block, axis=0) / count
+
+            # nanpercentile warns on all-NaN columns, which stay NaN.
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore', RuntimeWarning)
+                stack[2:, c0:c0 + block.shape[1]] = np.nanpercentile(
+                    block, [50, *percentiles], axis=0
+                )
+
+        stacks[name] = DataFrame(stack, index=stats, columns=offsets)
+
+    if not stacks:
+        return DataFrame(columns=offsets)
+
+    return pd.concat(stacks, names=['group', 'statistic'])
+
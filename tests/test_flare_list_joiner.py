@@ -0,0 +1,180 @@
+import time
+
+import numpy as np
+import pandas as pd
+
+import pytest
+
+from flare_list_joiner import (
+    GEV_TIME_FORMAT,
+    HER_TIME_FORMAT,
+    create_her_goes_list,
+    match_flares_nearest,
+    stream_her_goes_list
+)
+
+
+T0 = pd.Timestamp('2012-01-01')
+
+
+def _flares(peak_minutes, half_width=5) -> pd.DataFrame:
+
+    peak = T0 + pd.to_timedelta(np.asarray(peak_minutes, dtype=np.float64), unit='min')
+
+    return pd.DataFrame({
+        'flare_start': peak - pd.Timedelta(minutes=half_width),
+        'flare_peak': peak,
+        'flare_end': peak + pd.Timedelta(minutes=half_width)
+    })
+
+
+def _pairs(her, gev, **kwargs) -> set:
+
+    her_idx, gev_idx = match_flares_nearest(her, gev, **kwargs)
+
+    return set(zip(her_idx.tolist(), gev_idx.tolist()))
+
+
+def test_tolerance():
+
+    her = _flares([0, 100])
+    gev = _flares([3, 101])
+
+    assert _pairs(her, gev) == {(1, 1)}
+    assert _pairs(her, gev, peak_tolerance=pd.Timedelta(minutes=3)) == {(0, 0), (1, 1)}
+
+
+def test_overlap_required():
+
+    her = _flares([0], half_width=0.5)
+    gev = _flares([2], half_width=0.5)
+
+    assert _pairs(her, gev) == set()
+    assert _pairs(her, gev, require_overlap=False) == {(0, 0)}
+
+
+def test_one_to_one():
+
+    # Each pair of HER flares is within tolerance of one GEV flare; only the
+    # closer one is matched (the earlier on a tie), and each flare is used
+    # at most once.
+    her = _flares([0, 1.5, 10, 11])
+    gev = _flares([1, 10.5])
+
+    pairs = _pairs(her, gev)
+
+    assert pairs == {(1, 0), (2, 1)}
+    assert len({h for h, _ in pairs}) == len({g for _, g in pairs}) == len(pairs)
+
+
+def test_ties_go_to_the_earlier_peak():
+
+    her = _flares([10])
+    gev = _flares([11, 9])
+
+    assert _pairs(her, gev) == {(0, 1)}
+
+
+def test_deterministic_under_row_order():
+
+    rng = np.random.default_rng(0)
+    # Distinct peaks, as flares with identical times are told apart by row.
+    her = _flares(rng.choice(2000, 500, replace=False))
+    gev = _flares(rng.choice(2000, 500, replace=False) + 0.5)
+
+    pairs = _pairs(her, gev)
+
+    her_order = rng.permutation(len(her))
+    gev_order = rng.permutation(len(gev))
+    shuffled = _pairs(
+        her.iloc[her_order].reset_index(drop=True),
+        gev.iloc[gev_order].reset_index(drop=True)
+    )
+
+    assert {(her_order[h], gev_order[g]) for h, g in shuffled} == pairs
+
+
+def test_chained_candidates_scale_linearly():
+
+    # HER and GEV peaks interleaved a minute apart, so every flare's
+    # candidates chain into the next ones.
+    def run(n):
+        her = _flares(np.arange(n) * 2)
+        gev = _flares(np.arange(n) * 2 + 1)
+        t0 = time.perf_counter()
+        her_idx, _ = match_flares_nearest(her, gev)
+        return time.perf_counter() - t0, len(her_idx)
+
+    small, _ = min(run(20_000) for _ in range(3))
+    large, matched = min(run(80_000) for _ in range(3))
+
+    assert matched == 80_000
+    assert large < 10 * small + 0.05
+
+
+def _flare_list_csvs(tmp_path) -> tuple[str, str]:
+
+    # HER and GEV lists over three days with flares on either side of each
+    # midnight, peaks both identical and a few minutes apart, and a flare
+    # without a peak time in each list.
+    rng = np.random.default_rng(3)
+
+    minutes = np.sort(rng.choice(3 * 24 * 60, 150, replace=False))
+    minutes = np.concatenate([minutes, [1439, 1441, 2879, 2880]])
+    her_peak = T0 + pd.to_timedelta(minutes, unit='min')
+    gev_peak = her_peak + pd.to_timedelta(rng.choice([0, 0, 1, 3], len(minutes)), unit='min')
+
+    def times(peak, fmt, offset):
+        return (peak + pd.Timedelta(minutes=offset)).strftime(fmt)
+
+    her = pd.DataFrame({
+        'GEV_START': times(her_peak, HER_TIME_FORMAT, -4),
+        'GEV_PEAK': times(her_peak, HER_TIME_FORMAT, 0),
+        'GEV_END': times(her_peak, HER_TIME_FORMAT, 6),
+        'GOES_CLASS': 'C1.5',
+        'AIA_LOC': 'S11W31',
+        'AIA_XCEN': rng.uniform(-900, 900, len(minutes)).round(3),
+        'AIA_YCEN': rng.uniform(-900, 900, len(minutes)).round(3)
+    })
+    gev = pd.DataFrame({
+        'GSTART': times(gev_peak, GEV_TIME_FORMAT, -5),
+        'GEND': times(gev_peak, GEV_TIME_FORMAT, 5),
+        'GPEAK': times(gev_peak, GEV_TIME_FORMAT, 0),
+        'CLASS': 'M2.0',
+        'LOC': 'N10E20',
+        'NOAA_AR': 12048
+    })
+
+    her.loc[5, 'GEV_PEAK'] = None
+    gev.loc[9, 'GPEAK'] = None
+
+    # Shuffled, as the lists are not necessarily in time order.
+    her_file = tmp_path / 'her.csv'
+    gev_file = tmp_path / 'gev.csv'
+    her.sample(frac=1, random_state=1).to_csv(her_file, index=False)
+    gev.sample(frac=1, random_state=2).to_csv(gev_file, index=False)
+
+    return str(her_file), str(gev_file)
+
+
+@pytest.mark.parametrize('join', ['exact', 'nearest'])
+def test_stream_matches_batch(tmp_path, join):
+
+    her_file, gev_file = _flare_list_csvs(tmp_path)
+    batch_file = tmp_path / 'batch.csv'
+    stream_file = tmp_path / 'stream.csv'
+
+    create_her_goes_list(
+        pd.read_csv(her_file), pd.read_csv(gev_file), join=join
+    ).to_csv(batch_file)
+
+    rows = stream_her_goes_list(
+        her_file, gev_file, str(stream_file), partition='D', chunksize=40, join=join
+    )
+
+    batch = pd.read_csv(batch_file, index_col=0)
+    streamed = pd.read_csv(stream_file, index_col=0)
+
+    assert rows == len(batch)
+    assert batch['flare_peak'].isna().any()
+    pd.testing.assert_frame_equal(streamed, batch)
@@ -0,0 +1,57 @@
+import numpy as np
+
+from fov_overlap import _covered_by_flare
+from interval_overlap import merge_intervals
+
+
+def _covered_brute_force(flares, window_start, window_end, a, b) -> np.ndarray:
+
+    covered = np.zeros(len(a), dtype=np.int64)
+
+    for i in range(len(a)):
+        mine = flares == i
+        start, end = merge_intervals(
+            np.clip(window_start[mine], a[i], b[i]).view('datetime64[ns]'),
+            np.clip(window_end[mine], a[i], b[i]).view('datetime64[ns]')
+        )
+        covered[i] = (end - start).sum()
+
+    return covered
+
+
+def test_covered_by_flare():
+
+    rng = np.random.default_rng(10)
+    n_flares = 300
+
+    a = rng.integers(0, 10**12, n_flares)
+    b = a + rng.integers(0, 10**10, n_flares)
+
+    flares = rng.integers(0, n_flares, 3000)
+    window_start = a[flares] + rng.integers(-10**9, 10**10, len(flares))
+    window_end = window_start + rng.integers(0, 3 * 10**9, len(flares))
+
+    np.testing.assert_array_equal(
+        _covered_by_flare(flares, window_start, window_end, a, b),
+        _covered_brute_force(flares, window_start, window_end, a, b)
+    )
+
+
+def test_covered_by_flare_long_flares():
+
+    # Many long flares, where a flare index times the longest flare would
+    # not fit in int64.
+    n_flares = 10**5
+    a = np.arange(n_flares, dtype=np.int64) * 10**9
+    b = a + 10**9
+    b[-1] = a[-1] + 10**15
+
+    flares = np.array([0, 0, n_flares - 1, n_flares - 1])
+    window_start = a[flares] + np.array([0, 2, 0, 10**14])
+    window_end = a[flares] + np.array([5, 4, 10**14, 2 * 10**14])
+
+    covered = _covered_by_flare(flares, window_start, window_end, a, b)
+
+    assert covered[0] == 5
+    assert covered[-1] == 2 * 10**14
+    assert not covered[1:-1].any()
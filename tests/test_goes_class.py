@@ -0,0 +1,23 @@
+import numpy as np
+import pandas as pd
+
+from goes_class import goes_class_letters, goes_class_rank, goes_class_split
+
+
+def test_blank_and_missing_classes():
+
+    classes = ['C3.4', ' ', '', np.nan, None, 'X18+', 'M1.0']
+
+    np.testing.assert_allclose(goes_class_rank(classes), [33.4, 0, 0, 0, 0, 68, 41])
+
+    letter_idx, magnitude = goes_class_split(pd.Series(classes))
+    np.testing.assert_array_equal(letter_idx, [3, 0, 0, 0, 0, 5, 4])
+    np.testing.assert_allclose(magnitude, [3.4, 0, 0, 0, 0, 18, 1])
+
+    letters = goes_class_letters(classes)
+    assert list(letters.isna()) == [False, True, True, True, True, False, False]
+
+
+def test_all_blank_classes():
+
+    np.testing.assert_array_equal(goes_class_rank(pd.Series([' ', np.nan])), [0, 0])
@@ -0,0 +1,48 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from goes_flare_detector import GoesFlareDetector, detect_flares
+
+
+def _light_curve(days: int, seed: int = 0) -> tuple[np.ndarray, np.ndarray]:
+
+    # 2 s 1-8 A fluxes of flares on a noisy B3 background, with gaps.
+    rng = np.random.default_rng(seed)
+
+    n = days * 86400 // 2
+    times = np.datetime64('2017-09-01', 'ns') + np.arange(n) * np.timedelta64(2, 's')
+    minutes = np.arange(n) / 30
+
+    flux = 3e-7 * np.exp(rng.normal(0, 0.02, n))
+
+    for centre in rng.uniform(0, minutes[-1], 4 * days):
+        amplitude = 10**rng.uniform(-7, -4.5)
+        rise = rng.uniform(3, 20)
+        fall = rng.uniform(10, 60)
+        d = minutes - centre
+        with np.errstate(over='ignore'):
+            flux += np.where(d < 0, np.exp(-(d / rise)**2), np.exp(-np.maximum(d, 0) / fall)) * amplitude
+
+    flux[rng.random(n) < 0.01] = np.nan
+
+    return times, flux
+
+
+@pytest.mark.parametrize('chunk', [997, 7777, 10**9])
+def test_streaming_matches_batch(chunk):
+
+    times, flux = _light_curve(10)
+
+    batch = detect_flares(times, flux)
+
+    detector = GoesFlareDetector()
+    parts = [
+        detector.update(times[i:i + chunk], flux[i:i + chunk])
+        for i in range(0, len(times), chunk)
+    ]
+    parts.append(detector.close())
+    streamed = pd.concat(parts, ignore_index=True)
+
+    assert len(batch) > 0
+    assert streamed.equals(batch)
@@ -0,0 +1,141 @@
+import numpy as np
+import pandas as pd
+
+from interval_overlap import (
+    MALFORMED_FRAC,
+    MALFORMED_OBSERVED,
+    WindowCoverage,
+    merge_intervals,
+    observed_fractions
+)
+
+
+T0 = pd.Timestamp('2012-01-01')
+
+
+def _times(seconds) -> pd.Series:
+
+    return pd.Series(T0 + pd.to_timedelta(np.asarray(seconds, dtype=np.int64), unit='s'))
+
+
+def _fractions(start, peak, end, window_start, window_end) -> pd.DataFrame:
+
+    return observed_fractions(
+        _times(start), _times(peak), _times(end), _times(window_start), _times(window_end)
+    )
+
+
+def test_malformed_flares():
+
+    result = _fractions(
+        [100, 0, 0],
+        [50, 200, 50],
+        [200, 100, 100],
+        [0],
+        [1000]
+    )
+
+    assert result['OBSERVED'].tolist() == [MALFORMED_OBSERVED, MALFORMED_OBSERVED, 1]
+    assert MALFORMED_OBSERVED == 255 and MALFORMED_FRAC == -1
+
+    for col in ['FRAC_OBS', 'FRAC_OBS_RISE', 'FRAC_OBS_FALL']:
+        assert result[col].tolist()[:2] == [-1, -1]
+        assert result[col].iloc[2] == 1
+
+
+def test_widening_before_phase_durations():
+
+    # Unlike the IDL routines, which would divide by a zero rise (or fall)
+    # duration, a flare starting (or ending) at its peak is widened by 60 s
+    # before the phases are taken. The window covers the last 30 s of the
+    # widened rise and nothing of the fall.
+    result = _fractions([600], [600], [660], [500], [570])
+
+    assert result['OBSERVED'].iloc[0] == 1
+    assert result['FRAC_OBS_RISE'].iloc[0] == 0.5
+    assert result['FRAC_OBS_FALL'].iloc[0] == 0
+    assert result['FRAC_OBS'].iloc[0] == 0.25
+
+    # start = peak = end widens both sides, to a 120 s flare.
+    result = _fractions([600], [600], [600], [630], [1000])
+
+    assert result['FRAC_OBS_RISE'].iloc[0] == 0
+    assert result['FRAC_OBS_FALL'].iloc[0] == 0.5
+    assert result['FRAC_OBS'].iloc[0] == 0.25
+
+
+def test_touching_window_is_observed():
+
+    result = _fractions([100, 100], [150, 150], [200, 200], [200], [300])
+
+    assert result['OBSERVED'].tolist() == [1, 1]
+    assert result['FRAC_OBS'].tolist() == [0, 0]
+    assert result['FRAC_OBS_RISE'].tolist() == [0, 0]
+
+    result = _fractions([100], [150], [200], [201], [300])
+
+    assert result['OBSERVED'].iloc[0] == 0
+
+
+def test_fractions_match_brute_force():
+
+    # Overlapping windows and flares on a whole second grid, where the
+    # covered time of an interval is the number of covered seconds in it.
+    rng = np.random.default_rng(8)
+    span = 20_000
+
+    window_start = rng.integers(0, span, 300)
+    window_end = window_start + rng.integers(0, 200, 300)
+
+    start = rng.integers(0, span, 2000)
+    peak = start + rng.integers(0, 300, 2000)
+    end = peak + rng.integers(0, 300, 2000)
+
+    covered_seconds = np.zeros(span + 1000, dtype=bool)
+    for a, b in zip(window_start, window_end):
+        covered_seconds[a:b] = True
+
+    result = _fractions(start, peak, end, window_start, window_end)
+
+    start = np.where(start == peak, start - 60, start)
+    end = np.where(end == peak, end + 60, end)
+
+    for col, a, b in [
+                ('FRAC_OBS', start, end),
+                ('FRAC_OBS_RISE', start, peak),
+                ('FRAC_OBS_FALL', peak, end)
+            ]:
+
+        touches = np.array([
+            ((window_start <= bi) & (window_end >= ai)).any() for ai, bi in zip(a, b)
+        ])
+        covered = np.array([covered_seconds[max(ai, 0):bi].sum() for ai, bi in zip(a, b)])
+        expected = np.where(touches, covered / (b - a), 0)
+
+        np.testing.assert_allclose(result[col], expected, rtol=1e-6)
+
+        if col == 'FRAC_OBS':
+            np.testing.assert_array_equal(result['OBSERVED'], touches)
+
+
+def test_disjoint_coverage_matches_merged():
+
+    rng = np.random.default_rng(4)
+
+    window_start = rng.integers(0, 10**6, 500)
+    window_end = window_start + rng.integers(0, 10**4, 500)
+    merged = merge_intervals(_times(window_start), _times(window_end))
+
+    a = _times(rng.integers(0, 10**6, 1000)).to_numpy().astype(np.int64)
+    b = a + rng.integers(0, 10**5, 1000)
+
+    coverage = WindowCoverage(_times(window_start), _times(window_end))
+    disjoint = WindowCoverage(*merged, disjoint=True)
+
+    np.testing.assert_array_equal(coverage.covered(a, b), disjoint.covered(a, b))
+    np.testing.assert_array_equal(coverage.touches(a, b), disjoint.touches(a, b))
+
+    empty = WindowCoverage(_times([]), _times([]))
+
+    assert not empty.covered(a, b).any()
+    assert not empty.touches(a, b).any()
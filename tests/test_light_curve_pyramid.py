@@ -0,0 +1,32 @@
+import numpy as np
+import pandas as pd
+
+from light_curve_pyramid import LightCurvePyramid
+from light_curve_store import LightCurveStore
+
+
+def _light_curve(scale: float = 1.0) -> pd.DataFrame:
+
+    times = pd.date_range('2013-11-09', periods=43200, freq='2s')
+    flux = 1 + np.sin(np.arange(len(times)) / 500)
+
+    return pd.DataFrame({'xrsb': flux * scale}, index=pd.DatetimeIndex(times, name='time'))
+
+
+def test_reingested_day_is_rebuilt(tmp_path):
+
+    root = str(tmp_path)
+    LightCurveStore(root).ingest('GOES', _light_curve())
+
+    pyramid = LightCurvePyramid(root)
+    before = pyramid.slice('GOES', '2013-11-09', '2013-11-10', pixels=1000)
+
+    # Re-ingested through another store, as by another process.
+    LightCurveStore(root).ingest('GOES', _light_curve(10))
+
+    after = pyramid.slice('GOES', '2013-11-09', '2013-11-10', pixels=1000)
+    fresh = LightCurvePyramid(root).slice('GOES', '2013-11-09', '2013-11-10', pixels=1000)
+
+    assert before['xrsb'].max() < 2
+    assert after['xrsb'].max() > 19
+    pd.testing.assert_frame_equal(after, fresh)
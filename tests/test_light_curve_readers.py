@@ -0,0 +1,28 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from light_curve_readers import iter_fermi_csv, read_fermi_csv
+
+
+FERMI_CSV = 'instrument_data/2013_fermi.csv'
+
+
+def test_fermi_times_strictly_increasing():
+
+    light_curve = read_fermi_csv(FERMI_CSV)
+
+    assert len(light_curve) == len(pd.read_csv(FERMI_CSV))
+    assert (np.diff(light_curve.index.asi8) > 0).all()
+
+    # Every sample stays within the minute it was stamped with.
+    stamped = pd.to_datetime(pd.read_csv(FERMI_CSV)['time'], format='%d/%m/%y %H:%M')
+    np.testing.assert_array_equal(light_curve.index.floor('min'), stamped)
+
+
+@pytest.mark.parametrize('chunksize', [16, 100, 1000])
+def test_fermi_chunks_match_whole_file(chunksize):
+
+    chunks = list(iter_fermi_csv(FERMI_CSV, chunksize=chunksize))
+
+    assert pd.concat(chunks).equals(read_fermi_csv(FERMI_CSV))
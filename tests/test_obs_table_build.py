@@ -0,0 +1,245 @@
+import multiprocessing
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from obs_table_build import (
+    DEFAULT_SOURCES,
+    INSTRUMENT_BUILDERS,
+    INSTRUMENT_COLUMNS,
+    INSTRUMENTS,
+    ObsTableCheckpoint,
+    build_obs_table,
+    update_obs_table,
+    write_checkpointed_table,
+    write_obs_table
+)
+from observing_window_store import ObservingWindowStore
+
+
+def _obs_table(n: int = 40) -> pd.DataFrame:
+
+    # A flare list with every instrument's columns filled in.
+    rng = np.random.default_rng(1)
+
+    start = pd.Timestamp('2012-03-01') + pd.to_timedelta(np.arange(n) * 7, unit='h')
+
+    table = pd.DataFrame({
+        'INDEX': np.arange(n),
+        'FLARE_START': start,
+        'FLARE_PEAK': start + pd.Timedelta(minutes=10),
+        'FLARE_END': start + pd.Timedelta(minutes=30),
+        'CLASS': rng.choice(['B2.1', 'C3.4', 'M1.0'], n),
+        'AIA_LOC': [f"N{i % 30:02d}W{i % 60:02d}" for i in range(n)],
+        'AIA_XCEN': rng.uniform(-900, 900, n).round(3),
+        'AIA_YCEN': rng.uniform(-900, 900, n).round(3)
+    })
+
+    for instr in INSTRUMENTS:
+        for col in INSTRUMENT_COLUMNS[instr]:
+            if 'FRAC_OBS' in col:
+                table[col] = rng.integers(0, 5, n) / 4
+            else:
+                table[col] = rng.integers(0, 2, n)
+
+    return table
+
+
+def _flare_columns(table: pd.DataFrame) -> pd.DataFrame:
+
+    return table.iloc[:, :8].copy()
+
+
+def _update(tmp_path, table, flares, instruments):
+
+    filename = str(tmp_path / 'instr_observed_flare_list.csv')
+    table.to_csv(filename, index=False)
+
+    store = ObservingWindowStore(str(tmp_path / 'windows'))
+    store.write(
+        'FERMI',
+        np.array(['2012-03-01'], dtype='datetime64[ns]'),
+        np.array(['2012-04-01'], dtype='datetime64[ns]')
+    )
+
+    update_obs_table(
+        flares,
+        filename,
+        instruments=instruments,
+        sources={**DEFAULT_SOURCES, 'windows_root': store.root},
+        workers=1
+    )
+
+    return pd.read_csv(filename, dtype=str, keep_default_na=False)
+
+
+def test_subset_update_keeps_other_instruments(tmp_path):
+
+    table = _obs_table()
+    filename = tmp_path / 'original.csv'
+    table.to_csv(filename, index=False)
+    original = pd.read_csv(filename, dtype=str, keep_default_na=False)
+
+    after = _update(tmp_path, table, _flare_columns(table), ['FERMI'])
+
+    assert list(after.columns) == list(original.columns)
+
+    other = [
+        col for instr in INSTRUMENTS if instr != 'FERMI'
+        for col in INSTRUMENT_COLUMNS[instr]
+    ]
+    pd.testing.assert_frame_equal(after[other], original[other])
+
+
+def test_subset_update_with_changed_flares(tmp_path):
+
+    table = _obs_table()
+    filename = tmp_path / 'original.csv'
+    table.to_csv(filename, index=False)
+    original = pd.read_csv(filename, dtype=str, keep_default_na=False)
+
+    # Drop a flare and lengthen another, so the rows shift and one is rebuilt.
+    flares = _flare_columns(table).drop(index=3).reset_index(drop=True)
+    flares.loc[10, 'FLARE_END'] += pd.Timedelta(minutes=5)
+
+    after = _update(tmp_path, table, flares, ['FERMI'])
+
+    other = [
+        col for instr in INSTRUMENTS if instr != 'FERMI'
+        for col in INSTRUMENT_COLUMNS[instr]
+    ]
+    kept = np.delete(np.arange(len(table)), 3)
+    unchanged = np.delete(np.arange(len(flares)), 10)
+
+    pd.testing.assert_frame_equal(
+        after[other].iloc[unchanged].reset_index(drop=True),
+        original[other].iloc[kept[unchanged]].reset_index(drop=True)
+    )
+    assert (after[other].iloc[10] == '').all()
+
+    # The rebuilt flare lies inside the FERMI window.
+    assert after.loc[10, 'FERMI_OBSERVED'] == '1'
+    assert after['FERMI_OBSERVED'].iloc[unchanged].tolist() == (
+        original['FERMI_OBSERVED'].iloc[kept[unchanged]].tolist()
+    )
+
+
+def test_obssumm_build_requires_flare_windows(tmp_path):
+
+    table = _obs_table(5)
+    store = ObservingWindowStore(str(tmp_path / 'windows'))
+    store.write(
+        'RSI',
+        np.array(['2012-03-01'], dtype='datetime64[ns]'),
+        np.array(['2012-04-01'], dtype='datetime64[ns]')
+    )
+    sources = {
+        **DEFAULT_SOURCES,
+        'windows_root': store.root,
+        'rhessi_obssumm_dir': str(tmp_path)
+    }
+
+    with pytest.raises(FileNotFoundError, match='RSI_FLARE'):
+        build_obs_table(_flare_columns(table), instruments=['RSI'], sources=sources, workers=1)
+
+
+def _window_sources(tmp_path) -> dict:
+
+    store = ObservingWindowStore(str(tmp_path / 'windows'))
+
+    # Orbit-like windows, so the columns vary from flare to flare.
+    starts = np.datetime64('2012-02-28', 'ns') + np.arange(2000) * np.timedelta64(96, 'm')
+    for instr in ['RSI', 'RSI_FLARE', 'FERMI', 'MEGSB']:
+        store.write(instr, starts, starts + np.timedelta64(55, 'm'))
+
+    return {**DEFAULT_SOURCES, 'windows_root': store.root}
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_streamed_checkpoint_table_matches_in_memory(tmp_path, workers):
+
+    flares = _flare_columns(_obs_table(300))
+    sources = _window_sources(tmp_path)
+    instruments = ['RSI', 'FERMI', 'EVE']
+
+    in_memory = build_obs_table(flares, instruments=instruments, sources=sources, workers=1)
+    expected = tmp_path / 'expected.csv'
+    write_obs_table(in_memory, str(expected))
+
+    streamed = tmp_path / 'streamed.csv'
+    result = build_obs_table(
+        flares,
+        instruments=instruments,
+        sources=sources,
+        workers=workers,
+        freq='W',
+        checkpoint=ObsTableCheckpoint(str(tmp_path / 'checkpoint')),
+        out=str(streamed)
+    )
+
+    assert result is None
+    assert streamed.read_bytes() == expected.read_bytes()
+
+
+def test_streamed_write_in_blocks(tmp_path):
+
+    flares = _flare_columns(_obs_table(300))
+    sources = _window_sources(tmp_path)
+    checkpoint = ObsTableCheckpoint(str(tmp_path / 'checkpoint'))
+
+    table = build_obs_table(
+        flares, instruments=['FERMI'], sources=sources, workers=1, freq='W', checkpoint=checkpoint
+    )
+    expected = tmp_path / 'expected.csv'
+    write_obs_table(table, str(expected))
+
+    streamed = tmp_path / 'streamed.csv'
+    write_checkpointed_table(flares, ['FERMI'], checkpoint, str(streamed), block_rows=7)
+
+    assert streamed.read_bytes() == expected.read_bytes()
+
+
+def test_missing_pointings_fail_up_front(tmp_path):
+
+    sources = _window_sources(tmp_path)
+
+    with pytest.raises(FileNotFoundError, match='EIS pointing catalogue instrument_data/eis_pointings.csv'):
+        build_obs_table(_flare_columns(_obs_table(5)), instruments=['FERMI', 'EIS'], sources=sources)
+
+
+INSTRUMENT_BUILDERS_BEFORE = dict(INSTRUMENT_BUILDERS)
+
+
+def _fermi_failing_in_april(flares, sources):
+
+    if (flares['FLARE_START'] >= '2012-04-01').any():
+        raise RuntimeError('archive unavailable')
+
+    return INSTRUMENT_BUILDERS_BEFORE['FERMI'](flares, sources)
+
+
+@pytest.mark.skipif(
+    multiprocessing.get_start_method() != 'fork',
+    reason="workers only see the patched builder when forked"
+)
+def test_failed_task_keeps_finished_shards(tmp_path, monkeypatch):
+
+    flares = _flare_columns(_obs_table(300))
+    sources = _window_sources(tmp_path)
+    checkpoint = ObsTableCheckpoint(str(tmp_path / 'checkpoint'))
+
+    monkeypatch.setitem(INSTRUMENT_BUILDERS, 'FERMI', _fermi_failing_in_april)
+
+    with pytest.raises(RuntimeError, match='archive unavailable'):
+        build_obs_table(
+            flares, instruments=['FERMI'], sources=sources, workers=2, freq='W',
+            checkpoint=checkpoint
+        )
+
+    # Every shard before the failing ones was checkpointed.
+    done = checkpoint.done('FERMI', flares)
+    march = (flares['FLARE_START'] < '2012-03-26').to_numpy()
+
+    assert done[march].all()
+    assert not done[(flares['FLARE_START'] >= '2012-04-01').to_numpy()].any()
@@ -0,0 +1,41 @@
+import numpy as np
+
+from pipeline_metrics import summarise
+
+
+def _record(stage, rows=None, failed=False, wall=1.0):
+
+    return {
+        'stage': stage, 'instrument': None, 'rows': rows, 'wall_seconds': wall,
+        'cpu_seconds': wall, 'peak_traced_mb': None, 'peak_rss_mb': 100.0, 'failed': failed
+    }
+
+
+def test_summary_of_rows_and_failures():
+
+    summary = summarise([
+        _record('load', rows=10),
+        _record('load', rows=30),
+        _record('load', rows=1000, failed=True, wall=50.0),
+        _record('write'),
+        _record('fetch', failed=True)
+    ]).set_index('stage')
+
+    assert summary.loc['load', 'calls'] == 2
+    assert summary.loc['load', 'failed'] == 1
+    assert summary.loc['load', 'wall_seconds'] == 2.0
+    assert summary.loc['load', 'rows'] == 40
+    assert summary.loc['load', 'rows_per_second'] == 20
+
+    assert np.isnan(summary.loc['write', 'rows'])
+    assert np.isnan(summary.loc['write', 'rows_per_second'])
+
+    assert summary.loc['fetch', 'calls'] == 0
+    assert summary.loc['fetch', 'failed'] == 1
+
+
+def test_summary_of_only_failures():
+
+    summary = summarise([_record('fetch', failed=True)])
+
+    assert summary[['calls', 'failed']].values.tolist() == [[0, 1]]